@@ -0,0 +1,31 @@
+# docia/gunicorn_hooks.py
+"""
+Hooks de gunicorn para DOCIA:
+
+    gunicorn docia.wsgi -c python:docia.gunicorn_hooks
+
+Con DOCIA_CALENTAR_WORKERS = True cada worker carga el stack de IA al iniciar
+(después de cargar Django) en lugar de hacerlo con la primera pregunta.
+"""
+import threading
+
+
+def post_worker_init(worker):
+    # 🔹 Django ya está configurado aquí (post_fork corre antes de cargar la app)
+    from django.conf import settings
+
+    if not getattr(settings, "DOCIA_CALENTAR_WORKERS", False):
+        return
+
+    from documentos.calentamiento import calentar
+
+    def calentar_worker():
+        try:
+            # 🔹 El LLM vive en el servicio de inferencia: el worker sólo lo verifica
+            calentar(llm=bool(getattr(settings, "DOCIA_LLM_SERVICIO_URL", "")))
+            worker.log.info("🔥 Stack de IA cargado en el worker %s", worker.pid)
+        except Exception as e:
+            worker.log.warning("⚠️ No se pudo calentar el stack de IA: %s", e)
+
+    # 🔹 En segundo plano: el worker atiende el resto de las URLs mientras carga
+    threading.Thread(target=calentar_worker, daemon=True).start()
@@ -190,4 +190,84 @@ AUTH_USER_MODEL = "core.Usuario"
 AUTHENTICATION_BACKENDS = [
     "axes.backends.AxesStandaloneBackend",  # nuevo
     "django.contrib.auth.backends.ModelBackend",
-]
\ No newline at end of file
+]
+
+# ============================================================
+# DOCIA · Indexación semántica (FAISS)
+# ============================================================
+
+DOCIA_MODELO_EMBEDDINGS = "intfloat/multilingual-e5-base"
+
+# Índice y metadatos por generaciones (una por regeneración completa, publicada
+# con un rename atómico); se conservan las últimas RETENIDAS anteriores a la vigente
+DOCIA_INDICE_DIR = os.path.join(BASE_DIR, "indice_faiss")
+DOCIA_INDICE_GENERACIONES_RETENIDAS = 2
+
+# Cada cuántos segundos una solicitud mira si otro proceso publicó una generación
+# o agregó/eliminó fragmentos (0 = en cada solicitud); se aplican sin reiniciar
+DOCIA_INDICE_INTERVALO_CHEQUEO = 1.0
+
+# Metadatos de fragmentos del formato anterior a las generaciones (solo para migrar)
+DOCIA_FRAGMENTOS_DIR = os.path.join(BASE_DIR, "fragmentos_faiss")
+
+# Caché de embeddings en disco (hash del fragmento normalizado + modelo)
+DOCIA_CACHE_EMBEDDINGS_DIR = os.path.join(BASE_DIR, "cache_embeddings")
+# Al regenerar el índice se compacta si más de esta fracción ya no está indexada
+DOCIA_CACHE_EMBEDDINGS_MAX_SOBRANTE = 0.5
+
+# Tipo de índice: "flat" (exacto), "ivfpq" o "hnsw" (aproximados).
+# Se aplica al regenerar el índice; comparar con: manage.py benchmark_indice
+# ⚠️ Con ivfpq los scores son aproximados: revisar umbral_alto / umbral_bajo.
+DOCIA_FAISS_TIPO_INDICE = "flat"
+DOCIA_FAISS_IVF_NLIST = 1024
+DOCIA_FAISS_IVF_NPROBE = 16
+DOCIA_FAISS_PQ_M = 48        # debe dividir la dimensión del modelo (768)
+DOCIA_FAISS_HNSW_M = 32
+DOCIA_FAISS_HNSW_EF_SEARCH = 64
+
+# OCR de PDFs escaneados: páginas en paralelo (procesos) y corte por página (segundos)
+DOCIA_OCR_PROCESOS = max(1, (os.cpu_count() or 2) - 1)
+DOCIA_OCR_TIMEOUT_PAGINA = 120
+
+# Caché de OCR por página (hash de los píxeles renderizados), con tope de tamaño
+DOCIA_OCR_CACHE_DIR = os.path.join(BASE_DIR, "cache_ocr")
+DOCIA_OCR_CACHE_MAX_MB = 512
+
+# Servicio de inferencia (manage.py servidor_llm): único proceso dueño del modelo GGUF.
+# Vacío = cada worker de Django carga el modelo (sólo para desarrollo).
+DOCIA_LLM_SERVICIO_URL = "http://127.0.0.1:8765"
+DOCIA_LLM_SLOTS = 1          # generaciones simultáneas (una copia del modelo por slot)
+DOCIA_LLM_COLA_MAX = 16      # solicitudes en espera antes de responder 503
+DOCIA_LLM_TIMEOUT = 300
+
+# Caché de respuestas del modelo (pregunta normalizada + contexto exacto + alcance).
+# SIMILITUD: coseno mínimo para reutilizar la respuesta de una pregunta casi igual
+# y con los mismos identificadores (None = sólo preguntas idénticas tras normalizar).
+# ⚠️ Opcional: preguntas que difieren en un dato no identificado siguen pasando 0.95.
+DOCIA_CACHE_RESPUESTAS_TTL = 3600
+DOCIA_CACHE_RESPUESTAS_SIMILITUD = None
+
+# Contexto del modelo: tope de tokens para fragmentos (además se respeta n_ctx)
+# y fragmentos por documento antes de completar con el resto.
+DOCIA_CONTEXTO_TOKENS = 1500
+DOCIA_CONTEXTO_MAX_POR_DOC = 2
+
+# Calentar embeddings + índice FAISS al iniciar cada worker de gunicorn
+# (ver docia/gunicorn_hooks.py); readiness en /documentos/ia/estado/
+DOCIA_CALENTAR_WORKERS = True
+
+# Métricas Prometheus en /documentos/ia/metricas/ (staff, o este token como
+# "Authorization: Bearer <token>" para el scraper). Vacío = sólo staff.
+DOCIA_METRICAS_TOKEN = ""
+
+# Regeneración completa del índice (manage.py regenerar_indice): procesos de
+# fragmentado, documentos por lote y fragmentos por lote de embeddings (cada lote
+# queda en la caché de embeddings, desde donde retoma una corrida interrumpida).
+DOCIA_REGENERAR_PROCESOS = max(1, (os.cpu_count() or 2) - 1)
+DOCIA_REGENERAR_LOTE_DOCS = 200
+DOCIA_REGENERAR_LOTE_FRAGMENTOS = 4096
+
+# Embeddings: batch del modelo y procesos de encode en CPU (1 = un proceso; torch ya
+# usa varios hilos, conviene subirlo sólo con muchos núcleos)
+DOCIA_EMBEDDINGS_BATCH = 64
+DOCIA_EMBEDDINGS_PROCESOS = 1
@@ -1,6 +1,6 @@
 # documentos/admin.py
 from django.contrib import admin, messages
-from .models import Documento, TipoDoc
+from .models import Documento, TipoDoc, TareaIndexacion, EntidadFragmento
 
 @admin.action(description="Regenerar índice FAISS")
 def regenerar_faiss_action(modeladmin, request, queryset):
@@ -19,4 +19,27 @@ class DocumentoAdmin(admin.ModelAdmin):
 
 @admin.register(TipoDoc)
 class TipoDocAdmin(admin.ModelAdmin):
-    list_display = ("id", "tipo")
\ No newline at end of file
+    list_display = ("id", "tipo")
+
+
+@admin.action(description="Reintentar tareas seleccionadas")
+def reintentar_tareas_action(modeladmin, request, queryset):
+    from django.utils import timezone
+    n = queryset.exclude(estado=TareaIndexacion.EN_CURSO).update(
+        estado=TareaIndexacion.PENDIENTE, intentos=0, disponible_desde=timezone.now()
+    )
+    messages.success(request, f"🔁 {n} tareas vuelven a la cola.")
+
+@admin.register(TareaIndexacion)
+class TareaIndexacionAdmin(admin.ModelAdmin):
+    list_display = ("id", "documento_id", "accion", "estado", "intentos", "fecha_creacion", "fecha_modificacion")
+    list_filter = ("estado", "accion")
+    search_fields = ("documento_id",)
+    actions = [reintentar_tareas_action]
+
+@admin.register(EntidadFragmento)
+class EntidadFragmentoAdmin(admin.ModelAdmin):
+    list_display = ("id", "tipo", "valor", "documento", "faiss_id")
+    list_filter = ("tipo",)
+    search_fields = ("valor",)
+    raw_id_fields = ("documento",)
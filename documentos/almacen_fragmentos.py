@@ -0,0 +1,365 @@
+# documentos/almacen_fragmentos.py
+import json
+import os
+import shutil
+import threading
+import numpy as np
+
+from .bloqueos import bloqueo_archivo
+from .indice_invertido import IndiceInvertido
+
+# 🔹 Columnas de ancho fijo (un archivo por columna)
+COLUMNAS = {
+    "faiss_id": "<i8",
+    "doc_id": "<i8",
+    "dep": "<i4",         # posición en meta["deps"]; -1 = sin dependencia
+    "leido": "u1",
+    "vivo": "u1",         # 0 = eliminado (pendiente de compactar)
+    "version": "<u8",     # hash del contenido del documento al indexarlo
+    "texto_off": "<i8",
+    "texto_len": "<i4",
+    "texto_norm_off": "<i8",
+    "texto_norm_len": "<i4",
+    "asunto_off": "<i8",
+    "asunto_len": "<i4",
+}
+CAMPOS_TEXTO = ("texto", "texto_norm", "asunto")
+ARCHIVO_TEXTOS = "textos.bin"
+
+# 🔹 Fracción de fragmentos eliminados a partir de la cual se compacta
+UMBRAL_COMPACTACION = 0.25
+
+
+def _mapear(ruta, dtype, n):
+    # 🔹 Columna agregada después de crear el almacén: se lee como ceros
+    if n == 0 or not os.path.exists(ruta):
+        return np.zeros(n, dtype=dtype)
+    return np.memmap(ruta, dtype=dtype, mode="r", shape=(n,))
+
+
+def _escribir_json_atomico(ruta, datos):
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+class AlmacenFragmentos:
+    """
+    Metadatos de los fragmentos del índice en formato columnar.
+
+    Cada columna es un archivo de ancho fijo mapeado en memoria (modo lectura),
+    así todos los workers comparten las mismas páginas sin deserializar nada.
+    Los textos van en un único blob UTF-8 direccionado por offset/largo.
+
+    meta.json es el punto de confirmación: las filas agregadas solo son
+    visibles cuando se actualiza n_filas. Se accede por faiss_id estable.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.ruta_meta = os.path.join(directorio, "meta.json")
+        self.ruta_lock = os.path.join(directorio, ".lock")
+        self._lock = threading.RLock()
+        self._firma = None
+        self.meta = None
+        self._col = {}
+        self._textos = None
+        self._indice_invertido = None
+        self._visibles = {}
+        self.refrescar()
+
+    # ------------------------------------------------------------
+    # Creación y apertura
+    # ------------------------------------------------------------
+
+    @staticmethod
+    def existe(directorio):
+        return os.path.exists(os.path.join(directorio, "meta.json"))
+
+    @classmethod
+    def crear(cls, directorio, fragmentos, proximo_id=None):
+        """
+        Escribe un almacén completo en un subdirectorio de datos nuevo y lo
+        publica reemplazando meta.json (regeneración o compactación).
+        """
+        os.makedirs(directorio, exist_ok=True)
+        with bloqueo_archivo(os.path.join(directorio, ".lock")):
+            cls._escribir_completo(directorio, fragmentos, proximo_id)
+        return cls(directorio)
+
+    @classmethod
+    def _escribir_completo(cls, directorio, fragmentos, proximo_id=None):
+        """Cuerpo de crear; quien llama tiene el bloqueo del directorio."""
+        anterior = cls._leer_meta(directorio)
+        generacion = anterior["generacion"] + 1 if anterior else 1
+        datos = f"d{generacion:06d}"
+        os.makedirs(os.path.join(directorio, datos), exist_ok=True)
+
+        meta = {
+            "generacion": generacion,
+            "datos": datos,
+            "n_filas": 0,
+            "n_eliminados": 0,
+            "bytes_textos": 0,
+            "deps": [],
+            "proximo_id": 0,
+        }
+        fragmentos = sorted(fragmentos, key=lambda f: f["faiss_id"])
+        cls._anexar_filas(directorio, meta, fragmentos)
+        ultimo = max((f["faiss_id"] for f in fragmentos), default=-1)
+        meta["proximo_id"] = max(proximo_id or 0, ultimo + 1)
+        _escribir_json_atomico(os.path.join(directorio, "meta.json"), meta)
+
+        # 🔹 Los datos viejos pueden seguir mapeados en otro proceso (Windows):
+        # si no se pueden borrar ahora, se reintenta en la próxima creación.
+        for nombre in os.listdir(directorio):
+            if nombre.startswith("d") and nombre != datos:
+                shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
+
+    @staticmethod
+    def _leer_meta(directorio):
+        ruta = os.path.join(directorio, "meta.json")
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _ruta(self, nombre, meta=None):
+        return os.path.join(self.directorio, (meta or self.meta)["datos"], nombre)
+
+    def refrescar(self):
+        """Vuelve a mapear las columnas si meta.json cambió (otro proceso escribió)."""
+        with self._lock:
+            st = os.stat(self.ruta_meta)
+            firma = (st.st_mtime_ns, st.st_size)
+            if firma == self._firma:
+                return False
+
+            meta = self._leer_meta(self.directorio)
+            n = meta["n_filas"]
+            anterior = self.meta
+            self._col = {
+                nombre: _mapear(self._ruta(nombre, meta), dtype, n)
+                for nombre, dtype in COLUMNAS.items()
+            }
+            self._textos = _mapear(self._ruta(ARCHIVO_TEXTOS, meta), "u1", meta["bytes_textos"])
+            self.meta, self._firma = meta, firma
+            self._visibles = {}
+
+            # 🔹 Índice invertido: mismas filas + agregadas → incremental; datos nuevos → rearmar
+            if self._indice_invertido is not None:
+                if anterior and anterior["datos"] == meta["datos"]:
+                    for fila in range(anterior["n_filas"], n):
+                        if self._col["vivo"][fila]:
+                            self._indice_invertido.agregar(
+                                int(self._col["faiss_id"][fila]), self._texto("texto_norm", fila)
+                            )
+                else:
+                    self._indice_invertido = None
+            return True
+
+    @property
+    def firma(self):
+        """(mtime, tamaño) de meta.json al último refrescar: cambia con cada escritura."""
+        return self._firma
+
+    @property
+    def indice_invertido(self):
+        """Índice token → faiss_id, armado a demanda y mantenido al agregar/eliminar."""
+        with self._lock:
+            if self._indice_invertido is None:
+                self._indice_invertido = IndiceInvertido()
+                for fila in np.flatnonzero(self._col["vivo"]):
+                    self._indice_invertido.agregar(
+                        int(self._col["faiss_id"][fila]), self._texto("texto_norm", int(fila))
+                    )
+            return self._indice_invertido
+
+    # ------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------
+
+    def _fila(self, faiss_id):
+        """Posición de un faiss_id vigente, o None. Los IDs se agregan en orden creciente."""
+        col = self._col   # 🔹 ambas columnas de la misma foto aunque se refresque
+        ids = col["faiss_id"]
+        fila = int(np.searchsorted(ids, faiss_id))
+        if fila < len(ids) and ids[fila] == faiss_id and col["vivo"][fila]:
+            return fila
+        return None
+
+    def _texto(self, campo, fila):
+        off = int(self._col[f"{campo}_off"][fila])
+        largo = int(self._col[f"{campo}_len"][fila])
+        return self._textos[off:off + largo].tobytes().decode("utf-8")
+
+    def _como_dict(self, fila):
+        col = self._col
+        dep = int(col["dep"][fila])
+        frag = {
+            "faiss_id": int(col["faiss_id"][fila]),
+            "doc_id": int(col["doc_id"][fila]),
+            "dep": self.meta["deps"][dep] if dep >= 0 else None,
+            "leido": bool(col["leido"][fila]),
+            "version": int(col["version"][fila]),
+        }
+        for campo in CAMPOS_TEXTO:
+            frag[campo] = self._texto(campo, fila)
+        return frag
+
+    def __len__(self):
+        return self.meta["n_filas"] - self.meta["n_eliminados"]
+
+    def __contains__(self, faiss_id):
+        return self._fila(int(faiss_id)) is not None
+
+    def __getitem__(self, faiss_id):
+        fila = self._fila(int(faiss_id))
+        if fila is None:
+            raise KeyError(faiss_id)
+        return self._como_dict(fila)
+
+    def __iter__(self):
+        for fila in np.flatnonzero(self._col["vivo"]):
+            yield self._como_dict(int(fila))
+
+    def get(self, faiss_id, default=None):
+        fila = self._fila(int(faiss_id))
+        return self._como_dict(fila) if fila is not None else default
+
+    def ids_vigentes(self):
+        return self._col["faiss_id"][self._col["vivo"] == 1].astype("int64")
+
+    def ids_de_doc(self, doc_id):
+        mascara = (self._col["doc_id"] == doc_id) & (self._col["vivo"] == 1)
+        return self._col["faiss_id"][mascara].tolist()
+
+    def mascara_visibles(self, siglas):
+        """
+        Máscara booleana indexada por faiss_id: fragmentos vigentes, leídos por IA
+        y de alguna de las dependencias `siglas` (o sin dependencia).
+        Se cachea hasta la próxima escritura del almacén.
+        """
+        clave = frozenset(siglas)
+        with self._lock:
+            if clave not in self._visibles:
+                codigos = [-1] + [i for i, sigla in enumerate(self.meta["deps"]) if sigla in clave]
+                col = self._col
+                filas = (col["vivo"] == 1) & (col["leido"] == 1) & np.isin(col["dep"], codigos)
+                mascara = np.zeros(self.meta["proximo_id"], dtype=bool)
+                mascara[col["faiss_id"][filas]] = True
+                self._visibles[clave] = mascara
+            return self._visibles[clave]
+
+    def versiones_de_doc(self, doc_id):
+        """Versiones de contenido con las que están indexados los fragmentos del documento."""
+        mascara = (self._col["doc_id"] == doc_id) & (self._col["vivo"] == 1)
+        return set(self._col["version"][mascara].tolist())
+
+    # ------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------
+
+    @classmethod
+    def _anexar_filas(cls, directorio, meta, fragmentos):
+        """Agrega filas al final de cada columna y actualiza meta (sin publicarla)."""
+        dir_datos = os.path.join(directorio, meta["datos"])
+        n = meta["n_filas"]
+
+        # 🔹 Descartar restos de una escritura interrumpida antes de agregar
+        for nombre, dtype in COLUMNAS.items():
+            ruta = os.path.join(dir_datos, nombre)
+            with open(ruta, "a+b") as f:
+                if os.path.getsize(ruta) != n * np.dtype(dtype).itemsize:
+                    f.truncate(n * np.dtype(dtype).itemsize)   # también rellena con ceros
+        ruta_textos = os.path.join(dir_datos, ARCHIVO_TEXTOS)
+        if os.path.exists(ruta_textos) and os.path.getsize(ruta_textos) != meta["bytes_textos"]:
+            with open(ruta_textos, "r+b") as f:
+                f.truncate(meta["bytes_textos"])
+
+        valores = {nombre: [] for nombre in COLUMNAS}
+        blob, offset = [], meta["bytes_textos"]
+        for frag in fragmentos:
+            dep = frag.get("dep")
+            if dep is not None and dep not in meta["deps"]:
+                meta["deps"].append(dep)
+            valores["faiss_id"].append(frag["faiss_id"])
+            valores["doc_id"].append(frag["doc_id"])
+            valores["dep"].append(meta["deps"].index(dep) if dep is not None else -1)
+            valores["leido"].append(1 if frag.get("leido") else 0)
+            valores["vivo"].append(1)
+            valores["version"].append(frag.get("version") or 0)
+            for campo in CAMPOS_TEXTO:
+                datos = (frag.get(campo) or "").encode("utf-8")
+                valores[f"{campo}_off"].append(offset)
+                valores[f"{campo}_len"].append(len(datos))
+                blob.append(datos)
+                offset += len(datos)
+
+        with open(ruta_textos, "ab") as f:
+            f.write(b"".join(blob))
+            f.flush()
+            os.fsync(f.fileno())
+        for nombre, dtype in COLUMNAS.items():
+            with open(os.path.join(dir_datos, nombre), "ab") as f:
+                f.write(np.array(valores[nombre], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta["n_filas"] = n + len(fragmentos)
+        meta["bytes_textos"] = offset
+
+    def agregar(self, fragmentos_nuevos):
+        """Asigna faiss_id nuevos, agrega las filas sin reescribir el resto y devuelve los IDs."""
+        with self._lock, bloqueo_archivo(self.ruta_lock):
+            self.refrescar()
+            meta = json.loads(json.dumps(self.meta))
+            for frag in fragmentos_nuevos:
+                frag["faiss_id"] = meta["proximo_id"]
+                meta["proximo_id"] += 1
+            self._anexar_filas(self.directorio, meta, fragmentos_nuevos)
+            _escribir_json_atomico(self.ruta_meta, meta)
+            self.refrescar()
+        return np.array([f["faiss_id"] for f in fragmentos_nuevos], dtype="int64")
+
+    def eliminar_doc(self, doc_id):
+        """Marca como eliminados los fragmentos del documento y devuelve sus IDs."""
+        with self._lock, bloqueo_archivo(self.ruta_lock):
+            self.refrescar()
+            mascara = (self._col["doc_id"] == doc_id) & (self._col["vivo"] == 1)
+            filas = np.flatnonzero(mascara)
+            ids = self._col["faiss_id"][filas].astype("int64")
+            if len(filas):
+                vivo = np.memmap(self._ruta("vivo"), dtype="u1", mode="r+", shape=(self.meta["n_filas"],))
+                vivo[filas] = 0
+                vivo.flush()
+                del vivo
+
+                meta = dict(self.meta, n_eliminados=self.meta["n_eliminados"] + len(filas))
+                _escribir_json_atomico(self.ruta_meta, meta)
+                self.refrescar()
+                if self._indice_invertido is not None:
+                    self._indice_invertido.eliminar(ids)
+
+        self.compactar_si_corresponde()
+        return ids
+
+    def compactar_si_corresponde(self):
+        total = self.meta["n_filas"]
+        if not total or self.meta["n_eliminados"] / total < UMBRAL_COMPACTACION:
+            return
+        # 🔹 Foto y reescritura bajo el mismo bloqueo: no se pierden altas ni
+        #    reaparecen bajas que otro proceso haga mientras tanto
+        with self._lock, bloqueo_archivo(self.ruta_lock):
+            self.refrescar()
+            total = self.meta["n_filas"]
+            if not total or self.meta["n_eliminados"] / total < UMBRAL_COMPACTACION:
+                return
+            indice = self._indice_invertido   # los IDs vigentes no cambian al compactar
+            self._escribir_completo(self.directorio, list(self), proximo_id=self.meta["proximo_id"])
+            self.refrescar()
+            self._indice_invertido = indice
+        print(f"🧹 Metadatos FAISS compactados: {len(self)} fragmentos vigentes.")
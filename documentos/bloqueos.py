@@ -0,0 +1,93 @@
+# documentos/bloqueos.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+@contextmanager
+def bloqueo_archivo(ruta):
+    """
+    Bloqueo exclusivo entre procesos (workers de gunicorn, comandos de manage.py)
+    sobre un archivo auxiliar. Funciona en Windows y en Linux.
+    """
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)   # LK_LOCK se rinde a los 10 s, reintentamos
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class LectoresEscritor:
+    """
+    Bloqueo entre hilos de un proceso: varios lectores a la vez o un escritor
+    (reentrante). Un escritor que espera frena a los lectores nuevos, así las
+    búsquedas continuas no lo dejan esperando para siempre. Un lector no debe
+    pedir la escritura ni volver a pedir la lectura.
+    """
+
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._lectores = 0
+        self._escritor = None
+        self._profundidad = 0
+        self._esperando = 0
+
+    @contextmanager
+    def lectura(self):
+        if self._escritor == threading.get_ident():
+            yield   # 🔹 el escritor puede leer lo que está escribiendo
+            return
+        with self._condicion:
+            while self._escritor is not None or self._esperando:
+                self._condicion.wait()
+            self._lectores += 1
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._lectores -= 1
+                if not self._lectores:
+                    self._condicion.notify_all()
+
+    @contextmanager
+    def escritura(self):
+        yo = threading.get_ident()
+        with self._condicion:
+            if self._escritor == yo:
+                self._profundidad += 1
+            else:
+                self._esperando += 1
+                while self._escritor is not None or self._lectores:
+                    self._condicion.wait()
+                self._esperando -= 1
+                self._escritor, self._profundidad = yo, 1
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._profundidad -= 1
+                if not self._profundidad:
+                    self._escritor = None
+                    self._condicion.notify_all()
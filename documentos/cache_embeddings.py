@@ -0,0 +1,250 @@
+# documentos/cache_embeddings.py
+import hashlib
+import os
+import threading
+import numpy as np
+
+from .bloqueos import bloqueo_archivo
+
+TAM_CLAVE = 20   # sha1
+# 🔹 Índice ordenado de claves: (clave, fila del log), se busca con searchsorted
+DTYPE_ORDEN = np.dtype([("clave", f"S{TAM_CLAVE}"), ("fila", "<i8")])
+# 🔹 Filas agregadas fuera del índice ordenado antes de reordenarlo
+MAX_COLA = 4096
+
+
+def clave_embedding(texto_norm, nombre_modelo):
+    """Clave de contenido: hash del texto normalizado + nombre del modelo."""
+    return hashlib.sha1(f"{nombre_modelo}\n{texto_norm}".encode("utf-8")).digest()
+
+
+def _escribir_atomico(ruta, datos):
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+class CacheEmbeddings:
+    """
+    Almacén de embeddings direccionado por contenido, en disco y compartido
+    entre procesos.
+
+    - claves.bin: hashes sha1 de 20 bytes, uno por fila (solo se agregan).
+    - vectores.f32: vectores float32 normalizados, mapeados en memoria.
+    - orden.bin: (clave, fila) ordenado por clave, mapeado en memoria; la
+      búsqueda es un searchsorted y la memoria la comparte el page cache.
+      Sólo las filas agregadas después del último reordenamiento (a lo sumo
+      `max_cola`) se tienen en un dict por proceso.
+
+    Se escribe primero el vector y después la clave, así una clave visible
+    siempre tiene su vector completo. compactar() reescribe el log con las
+    claves que siguen en uso en una versión nueva (ACTUAL apunta a ella), así
+    los lectores nunca ven archivos a medio reescribir.
+    """
+
+    def __init__(self, directorio, dimension, max_cola=MAX_COLA):
+        self.directorio = directorio
+        self.dimension = dimension
+        self.max_cola = max_cola
+        self.ruta_actual = os.path.join(directorio, "ACTUAL")
+        self.ruta_lock = os.path.join(directorio, ".lock")
+        self._version = None
+        self._reiniciar(0)
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, nombre, extension, version=None):
+        version = self._version if version is None else version
+        # 🔹 La versión 0 conserva los nombres del formato anterior (sin migración)
+        sufijo = f".{version:06d}" if version else ""
+        return os.path.join(self.directorio, f"{nombre}{sufijo}.{extension}")
+
+    def _leer_version(self):
+        try:
+            with open(self.ruta_actual, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _reiniciar(self, version):
+        self._version = version
+        self._n = 0
+        self._vectores = None
+        self._orden = np.empty(0, dtype=DTYPE_ORDEN)
+        self._firma_orden = None
+        self._cola = {}
+
+    def _refrescar(self):
+        """Incorpora las filas que otros procesos hayan agregado (o una versión compactada)."""
+        for intento in range(2):
+            try:
+                return self._refrescar_version()
+            except FileNotFoundError:
+                # 🔹 Se compactó mientras leíamos: la versión vieja ya no existe
+                if intento:
+                    raise
+                self._reiniciar(-1)
+
+    def _refrescar_version(self):
+        version = self._leer_version()
+        if version != self._version:
+            self._reiniciar(version)
+
+        ruta_claves, ruta_vectores = self._ruta("claves", "bin"), self._ruta("vectores", "f32")
+        if not os.path.exists(ruta_claves) or not os.path.exists(ruta_vectores):
+            return
+
+        # 🔹 Primero el índice ordenado: cubre filas que ya están en el log
+        ruta_orden = self._ruta("orden", "bin")
+        if os.path.exists(ruta_orden):
+            st = os.stat(ruta_orden)
+            firma = (st.st_mtime_ns, st.st_size)
+            if firma != self._firma_orden:
+                self._orden = (
+                    np.memmap(ruta_orden, dtype=DTYPE_ORDEN, mode="r")
+                    if st.st_size else np.empty(0, dtype=DTYPE_ORDEN)
+                )
+                self._firma_orden = firma
+                n_orden = len(self._orden)
+                self._cola = {c: f for c, f in self._cola.items() if f >= n_orden}
+
+        bytes_fila = 4 * self.dimension
+        n = min(
+            os.path.getsize(ruta_claves) // TAM_CLAVE,
+            os.path.getsize(ruta_vectores) // bytes_fila,
+        )
+        if n <= self._n:
+            return
+
+        desde = max(self._n, len(self._orden))
+        with open(ruta_claves, "rb") as f:
+            f.seek(desde * TAM_CLAVE)
+            nuevas = f.read((n - desde) * TAM_CLAVE)
+        for i in range(n - desde):
+            self._cola.setdefault(nuevas[i * TAM_CLAVE:(i + 1) * TAM_CLAVE], desde + i)
+
+        self._vectores = np.memmap(ruta_vectores, dtype="float32", mode="r", shape=(n, self.dimension))
+        self._n = n
+
+    def _filas(self, claves):
+        """Fila de cada clave en el log (-1 si no está)."""
+        filas = np.full(len(claves), -1, dtype="int64")
+        if not len(claves):
+            return filas
+        if len(self._orden):
+            buscadas = np.array(claves, dtype=DTYPE_ORDEN["clave"])
+            pos = np.minimum(np.searchsorted(self._orden["clave"], buscadas), len(self._orden) - 1)
+            hallada = self._orden["clave"][pos] == buscadas
+            filas[hallada] = self._orden["fila"][pos[hallada]]
+        if self._cola:
+            for i in np.flatnonzero(filas < 0):
+                filas[i] = self._cola.get(claves[i], -1)
+        return filas
+
+    def buscar(self, claves):
+        """Devuelve (vectores, faltantes): matriz con las filas encontradas y posiciones sin caché."""
+        with self._lock:
+            self._refrescar()
+            vectores = np.zeros((len(claves), self.dimension), dtype="float32")
+            filas = self._filas(claves)
+            encontradas = np.flatnonzero(filas >= 0)
+            if len(encontradas):
+                vectores[encontradas] = self._vectores[filas[encontradas]]
+            faltantes = np.flatnonzero(filas < 0).tolist()
+        return vectores, faltantes
+
+    def guardar(self, claves, vectores):
+        vectores = np.ascontiguousarray(vectores, dtype="float32")
+        with self._lock, bloqueo_archivo(self.ruta_lock):
+            self._refrescar()
+            existentes = self._filas(claves)
+            nuevas, filas, vistas = [], [], set()
+            for clave, vector, fila in zip(claves, vectores, existentes):
+                if fila >= 0 or clave in vistas:
+                    continue
+                vistas.add(clave)
+                nuevas.append(clave)
+                filas.append(vector)
+            if not nuevas:
+                return
+
+            # 🔹 Truncar restos de una escritura interrumpida antes de agregar
+            ruta_claves, ruta_vectores = self._ruta("claves", "bin"), self._ruta("vectores", "f32")
+            for ruta, tam in ((ruta_vectores, 4 * self.dimension), (ruta_claves, TAM_CLAVE)):
+                if os.path.exists(ruta) and os.path.getsize(ruta) != self._n * tam:
+                    with open(ruta, "r+b") as f:
+                        f.truncate(self._n * tam)
+
+            with open(ruta_vectores, "ab") as f:
+                f.write(np.stack(filas).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(ruta_claves, "ab") as f:
+                f.write(b"".join(nuevas))
+                f.flush()
+                os.fsync(f.fileno())
+            self._refrescar()
+
+            if len(self._cola) > self.max_cola:
+                self._reordenar()
+
+    def _reordenar(self):
+        """Rearma orden.bin con todas las filas del log (con el bloqueo tomado)."""
+        claves = np.fromfile(self._ruta("claves", "bin"), dtype=DTYPE_ORDEN["clave"], count=self._n)
+        orden = self._orden_de(claves)
+        _escribir_atomico(self._ruta("orden", "bin"), orden.tobytes())
+        self._refrescar()
+
+    @staticmethod
+    def _orden_de(claves):
+        # 🔹 Si una clave quedó repetida (escritura interrumpida) vale la primera fila
+        unicas, filas = np.unique(claves, return_index=True)
+        orden = np.empty(len(unicas), dtype=DTYPE_ORDEN)
+        orden["clave"], orden["fila"] = unicas, filas
+        return orden
+
+    def __len__(self):
+        with self._lock:
+            self._refrescar()
+            return self._n
+
+    def compactar(self, conservar):
+        """
+        Reescribe la caché con sólo las claves de `conservar` (las que siguen en
+        uso) en una versión nueva y borra la anterior. Devuelve cuántas filas se
+        descartaron. Los procesos que tenían la versión vieja mapeada la siguen
+        leyendo hasta su próximo refresco.
+        """
+        with self._lock, bloqueo_archivo(self.ruta_lock):
+            self._refrescar()
+            conservar = list(dict.fromkeys(conservar))
+            filas = self._filas(conservar)
+            filas = np.sort(filas[filas >= 0])
+            descartadas = self._n - len(filas)
+            if not descartadas:
+                return 0
+
+            anterior, version = self._version, self._version + 1
+            claves = np.fromfile(self._ruta("claves", "bin"), dtype=DTYPE_ORDEN["clave"], count=self._n)
+            ruta_vectores = self._ruta("vectores", "f32", version)
+            with open(ruta_vectores, "wb") as f:
+                for inicio in range(0, len(filas), 65536):
+                    f.write(np.ascontiguousarray(self._vectores[filas[inicio:inicio + 65536]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            _escribir_atomico(self._ruta("claves", "bin", version), claves[filas].tobytes())
+            _escribir_atomico(self._ruta("orden", "bin", version), self._orden_de(claves[filas]).tobytes())
+            _escribir_atomico(self.ruta_actual, str(version).encode("utf-8"))
+
+            self._reiniciar(version)
+            self._refrescar()
+            for nombre, extension in (("claves", "bin"), ("vectores", "f32"), ("orden", "bin")):
+                try:
+                    os.remove(self._ruta(nombre, extension, anterior))
+                except OSError:
+                    pass
+        print(f"🧹 Caché de embeddings compactada: {descartadas} vectores sin uso descartados.")
+        return descartadas
@@ -0,0 +1,75 @@
+# documentos/cache_ocr.py
+import hashlib
+import os
+
+# 🔹 Cambiar si cambia el preprocesado o los parámetros del OCR: invalida la caché
+VERSION_OCR = "300dpi|spa+eng+por|v1"
+
+
+def clave_pagina(pix):
+    """Hash de los píxeles renderizados de la página + configuración del OCR."""
+    h = hashlib.sha256(VERSION_OCR.encode("utf-8"))
+    h.update(f"{pix.width}x{pix.height}x{pix.n}".encode("ascii"))
+    h.update(pix.samples)
+    return h.hexdigest()
+
+
+def _ruta(directorio, clave):
+    return os.path.join(directorio, clave[:2], f"{clave}.txt")
+
+
+def leer(directorio, clave):
+    """Texto OCR cacheado, o None. Un acierto renueva la fecha (para el desalojo LRU)."""
+    ruta = _ruta(directorio, clave)
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            texto = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(ruta)
+    except OSError:
+        pass
+    return texto
+
+
+def guardar(directorio, clave, texto):
+    ruta = _ruta(directorio, clave)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(tmp, ruta)
+
+
+def podar(directorio, max_bytes):
+    """Borra las entradas usadas hace más tiempo hasta quedar en el 90% de max_bytes."""
+    if not os.path.isdir(directorio):
+        return 0
+
+    entradas, total = [], 0
+    for raiz, _, archivos in os.walk(directorio):
+        for nombre in archivos:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, ruta))
+            total += st.st_size
+
+    if total <= max_bytes:
+        return 0
+
+    borrados, objetivo = 0, max_bytes * 0.9
+    for _, tam, ruta in sorted(entradas):
+        if total <= objetivo:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            continue
+        total -= tam
+        borrados += 1
+    print(f"🧹 Caché OCR: {borrados} páginas desalojadas.")
+    return borrados
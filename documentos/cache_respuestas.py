@@ -0,0 +1,73 @@
+# documentos/cache_respuestas.py
+"""
+Caché de respuestas del modelo para preguntas repetidas.
+
+La clave de grupo es el contexto exacto que recibe el modelo (textos de los
+fragmentos) + el alcance de acceso del usuario: si un documento se reindexa
+con otro contenido, su texto cambia y la entrada deja de alcanzarse sola
+(el TTL termina de limpiarla). Dentro del grupo se busca la misma pregunta
+normalizada o, opcionalmente, una casi idéntica por similitud de embeddings
+que además mencione exactamente los mismos identificadores (matrícula, SGSP,
+CI...): "matrícula abc1234" y "matrícula abc1235" son casi iguales para el
+modelo de embeddings pero no tienen la misma respuesta.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .entidades import extraer_entidades
+
+TTL = getattr(settings, "DOCIA_CACHE_RESPUESTAS_TTL", 3600)
+# 🔹 Coseno mínimo entre preguntas para reutilizar respuesta; None = sólo pregunta idéntica
+SIMILITUD_MINIMA = getattr(settings, "DOCIA_CACHE_RESPUESTAS_SIMILITUD", None)
+MAX_POR_CONTEXTO = 8
+
+
+def clave_contexto(textos_para_modelo, perfil):
+    h = hashlib.sha1()
+    h.update(f"{int(perfil.acceso_global)}|{','.join(sorted(perfil.siglas))}".encode("utf-8"))
+    for texto in textos_para_modelo:
+        h.update(b"\0")
+        h.update(texto.encode("utf-8"))
+    return f"docia:respuesta:{h.hexdigest()}"
+
+
+def buscar(pregunta_norm, textos_para_modelo, perfil):
+    """Respuesta cacheada para esta pregunta y este contexto, o None."""
+    entradas = cache.get(clave_contexto(textos_para_modelo, perfil)) or []
+    for entrada in entradas:
+        if entrada["pregunta"] == pregunta_norm:
+            return entrada["respuesta"]
+
+    if SIMILITUD_MINIMA is None:
+        return None
+    # 🔹 Sólo preguntas con los mismos identificadores: si no, otra respuesta
+    entidades = extraer_entidades(pregunta_norm)
+    entradas = [e for e in entradas if extraer_entidades(e["pregunta"]) == entidades]
+    if not entradas:
+        return None
+
+    from .faiss_utils import vector_pregunta
+
+    vector = vector_pregunta(pregunta_norm)
+    similitudes = np.array([e["vector"] for e in entradas], dtype="float32") @ vector
+    mejor = int(np.argmax(similitudes))
+    if similitudes[mejor] >= SIMILITUD_MINIMA:
+        print(f"♻️ Respuesta reutilizada (similitud {similitudes[mejor]:.3f}): {entradas[mejor]['pregunta']!r}")
+        return entradas[mejor]["respuesta"]
+    return None
+
+
+def guardar(pregunta_norm, textos_para_modelo, perfil, respuesta):
+    from .faiss_utils import vector_pregunta
+
+    clave = clave_contexto(textos_para_modelo, perfil)
+    entradas = [e for e in (cache.get(clave) or []) if e["pregunta"] != pregunta_norm]
+    entradas.insert(0, {
+        "pregunta": pregunta_norm,
+        "vector": vector_pregunta(pregunta_norm).tolist(),
+        "respuesta": respuesta,
+    })
+    cache.set(clave, entradas[:MAX_POR_CONTEXTO], TTL)
@@ -0,0 +1,139 @@
+# documentos/calentamiento.py
+"""
+Carga anticipada del stack de IA (embeddings, índice FAISS, LLM) y estado
+de cada componente para el endpoint de readiness.
+
+- calentar(): lo usan manage.py calentar_ia y el hook de gunicorn
+  (docia/gunicorn_hooks.py) para que la primera pregunta no pague la carga.
+- estado_componentes(): no carga nada; sólo informa lo que ya está en memoria.
+"""
+import os
+import sys
+import time
+
+PREGUNTA_CALENTAMIENTO = "consulta de prueba para calentar el modelo"
+# 🔹 Segundos que se reutiliza el estado del servicio LLM entre sondeos de readiness
+VIGENCIA_ESTADO_SERVICIO = 5.0
+
+_estado_servicio = (0.0, None)
+
+
+def _mb(n_bytes):
+    return round(n_bytes / 1024 ** 2, 1)
+
+
+def calentar(llm=True):
+    """Carga cada componente y hace una consulta de prueba. Devuelve segundos por etapa."""
+    from .consultas_phi2 import SERVICIO_LLM_URL, get_modelo_phi, restaurar_prefijo
+    from .faiss_utils import buscar_fragmentos_relevantes, get_faiss_index, get_modelo_embeddings
+
+    tiempos = {}
+
+    def etapa(nombre, funcion):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos[nombre] = round(time.perf_counter() - inicio, 2)
+        print(f"🔥 {nombre}: {tiempos[nombre]} s")
+
+    etapa("embeddings", get_modelo_embeddings)
+    etapa("indice_faiss", get_faiss_index)
+    # 🔹 Consulta completa: primera pasada de torch, búsqueda FAISS e índice invertido
+    etapa("consulta_prueba", lambda: buscar_fragmentos_relevantes(PREGUNTA_CALENTAMIENTO, top_k=5))
+
+    if llm:
+        if SERVICIO_LLM_URL:
+            from . import servicio_llm
+            etapa("llm_servicio", lambda: servicio_llm.generar(
+                SERVICIO_LLM_URL, {"prompt": PREGUNTA_CALENTAMIENTO, "max_tokens": 1}
+            ))
+        else:
+            def generar_un_token():
+                modelo = get_modelo_phi()
+                restaurar_prefijo(modelo)
+                modelo(PREGUNTA_CALENTAMIENTO, max_tokens=1)
+            etapa("llm_local", generar_un_token)
+
+    return tiempos
+
+
+def _tamano(ruta):
+    try:
+        if os.path.isdir(ruta):
+            return sum(
+                os.path.getsize(os.path.join(raiz, nombre))
+                for raiz, _, nombres in os.walk(ruta) for nombre in nombres
+            )
+        return os.path.getsize(ruta)
+    except OSError:
+        return 0
+
+
+def _estado_servicio_llm(url):
+    """Estado del servicio de inferencia, cacheado unos segundos (también si falla)."""
+    global _estado_servicio
+    instante, estado = _estado_servicio
+    if estado is None or time.monotonic() - instante > VIGENCIA_ESTADO_SERVICIO:
+        from . import servicio_llm
+        try:
+            estado = {"cargado": True, **servicio_llm.estado(url)}
+        except Exception as e:
+            estado = {"cargado": False, "error": str(e)}
+        _estado_servicio = (time.monotonic(), estado)
+    return estado
+
+
+def estado_componentes():
+    """
+    Qué está cargado en este proceso y cuánto ocupa (aprox.). Si un módulo
+    pesado todavía no se importó, el componente se informa como no cargado.
+    """
+    componentes = {}
+    faiss_utils = sys.modules.get("documentos.faiss_utils")
+    consultas = sys.modules.get("documentos.consultas_phi2")
+
+    embeddings = {"cargado": False}
+    indice = {"cargado": False}
+    if faiss_utils is not None:
+        if faiss_utils.get_modelo_embeddings.cache_info().currsize:
+            modelo = faiss_utils.get_modelo_embeddings()
+            pesos = sum(p.numel() * p.element_size() for p in modelo.parameters())
+            embeddings = {"cargado": True, "modelo": faiss_utils.MODELO_EMBEDDINGS, "mb": _mb(pesos)}
+        if faiss_utils.indice_cargado():
+            from . import generaciones
+            _, index, fragmentos = faiss_utils.get_faiss_index()
+            ruta_gen = faiss_utils.generacion_de(fragmentos)
+            manifiesto = generaciones.leer_manifiesto(ruta_gen) or {}
+            indice = {
+                "cargado": True,
+                "generacion": os.path.basename(ruta_gen),
+                "tipo": faiss_utils.tipo_de_indice(index),
+                "vectores": int(index.ntotal),
+                "fragmentos": len(fragmentos),
+                "mb": _mb(manifiesto.get("bytes", 0)),
+                "metadatos_mb": _mb(_tamano(fragmentos.directorio)),
+            }
+    componentes["embeddings"] = embeddings
+    componentes["indice_faiss"] = indice
+
+    llm = {"cargado": False}
+    if consultas is not None:
+        if consultas.SERVICIO_LLM_URL:
+            llm = {"servicio": consultas.SERVICIO_LLM_URL, **_estado_servicio_llm(consultas.SERVICIO_LLM_URL)}
+        elif consultas._modelo_phi is not None:
+            llm = {"cargado": True, "mb": _mb(_tamano(consultas.LLAMA_MODEL_PATH))}
+    componentes["llm"] = llm
+
+    try:
+        import psutil
+        rss = psutil.Process(os.getpid()).memory_info().rss
+        memoria = {"proceso_mb": _mb(rss)}
+    except ImportError:
+        memoria = {}
+
+    # 🔹 Sin servicio de inferencia cada worker carga el LLM en su primera
+    #    pregunta (el hook de gunicorn no lo calienta): no cuenta para "listo"
+    requeridos = componentes
+    if consultas is not None and not consultas.SERVICIO_LLM_URL:
+        requeridos = {n: c for n, c in componentes.items() if n != "llm"}
+    listo = all(c.get("cargado") for c in requeridos.values())
+    return {"listo": listo, "pid": os.getpid(), "componentes": componentes, **memoria}
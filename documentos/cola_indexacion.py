@@ -0,0 +1,131 @@
+# documentos/cola_indexacion.py
+import os
+import traceback
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Documento, TareaIndexacion
+
+# 🔹 Espera antes de reintentar: 30 s, 2 min, 8 min...
+ESPERA_BASE_REINTENTO = 30
+
+
+def encolar(documento_id, accion, extraer_texto=False):
+    """
+    Registra una tarea de indexación; la ejecuta el worker (procesar_indexacion).
+    Si ya hay una igual pendiente se reutiliza en lugar de duplicarla. Si hay una
+    EN_CURSO se deja (a lo sumo) una pendiente detrás: la que corre pudo haber
+    leído el documento antes del cambio, y tomar_tarea no la larga en paralelo.
+    """
+    pendiente = TareaIndexacion.objects.filter(
+        documento_id=documento_id, accion=accion, estado=TareaIndexacion.PENDIENTE
+    ).first()
+    if pendiente:
+        if extraer_texto and not pendiente.extraer_texto:
+            pendiente.extraer_texto = True
+            pendiente.save(update_fields=["extraer_texto", "fecha_modificacion"])
+        return pendiente
+
+    if accion == TareaIndexacion.ELIMINAR:
+        # 🔹 Eliminar no depende del contenido: alcanza con la que ya está corriendo
+        en_curso = TareaIndexacion.objects.filter(
+            documento_id=documento_id, accion=accion, estado=TareaIndexacion.EN_CURSO
+        ).first()
+        if en_curso:
+            return en_curso
+
+    tarea = TareaIndexacion.objects.create(
+        documento_id=documento_id,
+        accion=accion,
+        extraer_texto=extraer_texto,
+    )
+    print(f"📥 Tarea {tarea.id} encolada: {accion} documento {documento_id}")
+    return tarea
+
+
+def tomar_tarea():
+    """
+    Reserva la próxima tarea pendiente. SKIP LOCKED permite correr
+    varios workers sin que dos tomen la misma tarea.
+    """
+    with transaction.atomic():
+        tarea = (
+            TareaIndexacion.objects
+            .select_for_update(skip_locked=True)
+            .filter(estado=TareaIndexacion.PENDIENTE, disponible_desde__lte=timezone.now())
+            # 🔹 Un documento a la vez: no dos workers indexando el mismo documento
+            .exclude(documento_id__in=TareaIndexacion.objects.filter(
+                estado=TareaIndexacion.EN_CURSO
+            ).values("documento_id"))
+            .order_by("id")
+            .first()
+        )
+        if tarea is None:
+            return None
+        tarea.estado = TareaIndexacion.EN_CURSO
+        tarea.intentos += 1
+        tarea.save(update_fields=["estado", "intentos", "fecha_modificacion"])
+    return tarea
+
+
+def recuperar_tareas_colgadas(minutos=30):
+    """Devuelve a la cola las tareas EN_CURSO de un worker que se cayó."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return TareaIndexacion.objects.filter(
+        estado=TareaIndexacion.EN_CURSO, fecha_modificacion__lt=limite
+    ).update(estado=TareaIndexacion.PENDIENTE)
+
+
+def extraer_texto(doc):
+    from .utils import extraer_texto_pdf
+
+    if not doc.informe or not os.path.exists(doc.informe.path):
+        return
+    texto = extraer_texto_pdf(doc.informe.path)
+    if texto:
+        doc.texto_extraido = texto.strip()
+        # 🔹 update() no pasa por Documento.save: no vuelve a encolar
+        Documento.objects.filter(pk=doc.pk).update(texto_extraido=doc.texto_extraido)
+
+
+def ejecutar(tarea):
+    from .faiss_utils import asegurar_indexado, eliminar_fragmentos_por_doc
+
+    if tarea.accion == TareaIndexacion.ELIMINAR:
+        eliminar_fragmentos_por_doc(tarea.documento_id)
+        return
+
+    doc = Documento.objects.filter(pk=tarea.documento_id).first()
+    if doc is None:
+        print(f"⚠️ Documento {tarea.documento_id} ya no existe; se omite la tarea {tarea.id}.")
+        return
+
+    if tarea.extraer_texto:
+        extraer_texto(doc)
+
+    # 🔹 Idempotente: si el contenido no cambió desde la última indexación no hace nada
+    asegurar_indexado(doc.id)
+
+
+def procesar(tarea):
+    """Ejecuta una tarea reservada y registra el resultado (con reintentos)."""
+    try:
+        ejecutar(tarea)
+    except Exception as e:
+        tarea.error = f"{e}\n{traceback.format_exc()}"
+        if tarea.intentos < tarea.max_intentos:
+            espera = ESPERA_BASE_REINTENTO * 4 ** (tarea.intentos - 1)
+            tarea.estado = TareaIndexacion.PENDIENTE
+            tarea.disponible_desde = timezone.now() + timedelta(seconds=espera)
+            print(f"⚠️ Tarea {tarea.id} falló (intento {tarea.intentos}); reintento en {espera} s: {e}")
+        else:
+            tarea.estado = TareaIndexacion.ERROR
+            print(f"❌ Tarea {tarea.id} falló definitivamente: {e}")
+    else:
+        tarea.estado = TareaIndexacion.COMPLETADA
+        tarea.error = ""
+        print(f"✅ Tarea {tarea.id} completada: {tarea}")
+
+    tarea.save(update_fields=["estado", "error", "disponible_desde", "fecha_modificacion"])
+    return tarea.estado
@@ -1,9 +1,10 @@
 import os
-from llama_cpp import Llama
+import threading
+import time
+from functools import lru_cache
 from django.conf import settings
 
-from .faiss_utils import get_faiss_index
-import psutil
+from . import metricas, servicio_llm
 
 import re
 
@@ -27,6 +28,8 @@ def limpiar_respuesta(texto):
 
 
 def medir_consumo_memoria():
+    import psutil  # 👇 Import diferido: sólo al cargar el modelo
+
     proceso = psutil.Process(os.getpid())
     memoria_mb = proceso.memory_info().rss / 1024 ** 2
     return round(memoria_mb, 2)
@@ -38,55 +41,50 @@ LLAMA_MODEL_PATH = os.path.join(
     "meta-llama-3-8b-instruct.Q4_K_M.gguf"
 )
 
+# Ventana de contexto con la que se carga el modelo (tokens)
+N_CTX = 8192
+
 # Variables cache para lazy loading
 _modelo_phi = None
-_modelo_embeddings = None
-_index = None
-_fragmentos = None
+
+
+def crear_modelo(n_threads=8, con_prefijo=True):
+    """Instancia el modelo GGUF (lo usan este proceso y el servicio de inferencia)."""
+    try:
+        consumo = medir_consumo_memoria()
+        print(f"Uso de memoria inicial actual del proceso: {consumo} MB")  
+        print("🧠 Cargando modelo GGUF...")
+        from llama_cpp import Llama  # 👇 Import diferido: no se carga al arrancar Django
+
+        modelo = Llama(
+            model_path=LLAMA_MODEL_PATH,
+            n_ctx=N_CTX,
+            n_threads=n_threads,
+            n_gpu_layers=0,   # ⚠️ cambia si querés usar GPU
+            n_batch=256,
+            verbose=False
+        )
+        print("✅ Modelo GGUF cargado")
+
+        consumo = medir_consumo_memoria()
+        print(f"Uso de memoria final actual del proceso: {consumo} MB")
+    except Exception as e:
+        print(f"⚠️ Error al cargar el modelo GGUF: {e}")
+        raise
+    return preparar_prefijo(modelo) if con_prefijo else modelo
 
 
 def get_modelo_phi():
     """Carga el modelo GGUF de Llama solo una vez (lazy loading)."""
     global _modelo_phi
     if _modelo_phi is None:
-        try:
-            consumo = medir_consumo_memoria()
-            print(f"Uso de memoria inicial actual del proceso: {consumo} MB")  
-            print("🧠 Cargando modelo GGUF...")
-            _modelo_phi = Llama(
-                model_path=LLAMA_MODEL_PATH,
-                n_ctx=8192,
-                n_threads=8,
-                n_gpu_layers=0,   # ⚠️ cambia si querés usar GPU
-                n_batch=256,
-                verbose=False
-            )
-            print("✅ Modelo GGUF cargado")
-
-            consumo = medir_consumo_memoria()
-            print(f"Uso de memoria final actual del proceso: {consumo} MB")
-        except Exception as e:
-            print(f"⚠️ Error al cargar el modelo GGUF: {e}")
-            raise
+        _modelo_phi = crear_modelo()
     return _modelo_phi
 
 
-def get_indice_faiss():
-    """Carga embeddings, índice FAISS y fragmentos una sola vez."""
-    global _modelo_embeddings, _index, _fragmentos
-    if _index is None:
-        print("📦 Cargando índice FAISS en memoria...")
-        _modelo_embeddings, _index, _fragmentos = get_faiss_index()
-        print(f"✅ Índice FAISS cargado con {len(_fragmentos)} fragmentos")
-    return _modelo_embeddings, _index, _fragmentos
-
-
-def construir_prompt(contexto, pregunta):
-    return f"""
-Documentos relevantes extraídos de la base de datos:
-{contexto}
-
-Instrucciones:
+# 🔹 Parte fija del prompt: va primero para que su estado KV se calcule una
+#    sola vez por modelo y se reutilice en cada pregunta (ver preparar_prefijo)
+PREFIJO_PROMPT = """Instrucciones:
 - Responde únicamente con información contenida en los documentos proporcionados.
 - No incluyas enlaces externos ni referencias que no provengan de los documentos.
 - Si hay datos parciales, armá la mejor respuesta posible con ellos.
@@ -98,25 +96,124 @@ Instrucciones:
 - Solo si no existe absolutamente ningún dato relacionado, respondé:
 "No se encontró información suficiente en los documentos."
 
+Documentos relevantes extraídos de la base de datos:
+"""
+
+
+def construir_prompt(contexto, pregunta):
+    return f"""{PREFIJO_PROMPT}{contexto}
+
 Pregunta: {pregunta}
 Respuesta:"""
 
-def responder_pregunta_phi2(pregunta, fragmentos_relevantes):
+
+def preparar_prefijo(modelo):
     """
-    Genera una respuesta con el modelo usando los fragmentos relevantes.
-    - pregunta: texto de la consulta del usuario
-    - fragmentos_relevantes: lista de fragmentos de documentos (strings)
+    Evalúa PREFIJO_PROMPT una vez y guarda el estado KV en el modelo.
+    llama.cpp reutiliza el prefijo común con el estado cargado, así que
+    cada pregunta sólo evalúa contexto + pregunta.
     """
-    if not fragmentos_relevantes:
-        return "No se encontró información relevante en los documentos."
+    tokens = modelo.tokenize(PREFIJO_PROMPT.encode("utf-8"), add_bos=True)
+    modelo.reset()
+    modelo.eval(tokens)
+    modelo.tokens_prefijo = tokens
+    modelo.estado_prefijo = modelo.save_state()
+    print(f"📌 Prefijo del prompt en caché KV ({len(tokens)} tokens)")
+    return modelo
 
-    # 🗂️ Unir fragmentos en un solo contexto
-    contexto = "\n".join(fragmentos_relevantes)
 
-    # ✂️ Limitar contexto a 2000 caracteres para no saturar
-    LIMITE_CTX = 2000
-    if len(contexto) > LIMITE_CTX:
-        contexto = contexto[:LIMITE_CTX] + "\n[Texto recortado por límite de contexto]"
+def restaurar_prefijo(modelo):
+    """Vuelve al estado del prefijo si la última generación no lo dejó al inicio."""
+    tokens = getattr(modelo, "tokens_prefijo", None)
+    if tokens is None:
+        return
+    n = len(tokens)
+    if modelo.n_tokens < n or modelo.input_ids[:n].tolist() != tokens:
+        modelo.load_state(modelo.estado_prefijo)
+
+
+# 🔹 Una instancia de Llama no admite generaciones concurrentes
+_lock_modelo = threading.Lock()
+
+# 🔹 Servicio de inferencia (manage.py servidor_llm); vacío = modelo en este proceso
+SERVICIO_LLM_URL = getattr(settings, "DOCIA_LLM_SERVICIO_URL", "")
+
+MAX_TOKENS_RESPUESTA = 256   # <- límite fijo para evitar cuelgues
+STOP_RESPUESTA = ["\nPregunta:", "\nRespuesta:"]
+SIN_INFORMACION = "No se encontró información relevante en los documentos."
+ERROR_RESPUESTA = "Ocurrió un error al procesar la pregunta."
+
+
+# 🔹 Tokens de contexto por pregunta (tope; además se respeta n_ctx) y diversidad por documento
+PRESUPUESTO_CONTEXTO = getattr(settings, "DOCIA_CONTEXTO_TOKENS", 1500)
+MAX_FRAGMENTOS_POR_DOC = getattr(settings, "DOCIA_CONTEXTO_MAX_POR_DOC", 2)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizador():
+    """
+    Sólo el vocabulario del GGUF: cuenta tokens sin cargar los pesos.
+    Lo usa el servicio de inferencia (POST /tokenizar), que es quien tiene el archivo.
+    """
+    from llama_cpp import Llama  # 👇 Import diferido
+
+    return Llama(model_path=LLAMA_MODEL_PATH, vocab_only=True, verbose=False)
+
+
+def contar_tokens(textos):
+    """
+    Tokens de cada texto (sin BOS). Con servicio de inferencia se cuentan allá
+    en una sola llamada (los workers no tienen el GGUF); sin servicio, con el
+    modelo local que de todos modos va a generar la respuesta.
+    """
+    if not textos:
+        return []
+    if SERVICIO_LLM_URL:
+        return servicio_llm.contar_tokens(SERVICIO_LLM_URL, textos)
+    modelo = get_modelo_phi()
+    return [len(modelo.tokenize(texto.encode("utf-8"), add_bos=False)) for texto in textos]
+
+
+def presupuesto_contexto(tokens_fijos):
+    """Tokens disponibles para fragmentos: tope configurado sin pasarse de n_ctx."""
+    fijos = tokens_fijos + 1  # + BOS
+    return max(0, min(PRESUPUESTO_CONTEXTO, N_CTX - MAX_TOKENS_RESPUESTA - fijos))
+
+
+def empaquetar_contexto(pregunta, candidatos):
+    """
+    Elige qué fragmentos entran al prompt.
+    - candidatos: lista de (texto, doc_id) ya ordenada por prioridad (score)
+    Llena el presupuesto de tokens en ese orden, con a lo sumo
+    MAX_FRAGMENTOS_POR_DOC por documento en una primera pasada; lo que sobre
+    se completa con el resto. Los fragmentos nunca se cortan: si uno no entra
+    se prueba con el siguiente.
+    Devuelve (índices elegidos en orden de prioridad, tokens usados).
+    """
+    # 🔹 Prompt sin contexto y fragmentos en un solo conteo
+    conteos = contar_tokens([construir_prompt("", pregunta)] + [texto for texto, _ in candidatos])
+    presupuesto = presupuesto_contexto(conteos[0])
+    # 🔹 +1 por el salto de línea que separa fragmentos
+    costos = [n + 1 for n in conteos[1:]]
+
+    elegidos, usados, por_doc = set(), 0, {}
+    for diversidad in (True, False):
+        for i, (_, doc_id) in enumerate(candidatos):
+            if i in elegidos or usados + costos[i] > presupuesto:
+                continue
+            if diversidad and por_doc.get(doc_id, 0) >= MAX_FRAGMENTOS_POR_DOC:
+                continue
+            elegidos.add(i)
+            usados += costos[i]
+            por_doc[doc_id] = por_doc.get(doc_id, 0) + 1
+
+    print(f"🧮 Contexto: {len(elegidos)}/{len(candidatos)} fragmentos, {usados}/{presupuesto} tokens")
+    return sorted(elegidos), usados
+
+
+def preparar_prompt(pregunta, fragmentos_relevantes):
+    # 🗂️ Unir fragmentos en un solo contexto (ya recortados por presupuesto de tokens)
+    contexto = "\n".join(fragmentos_relevantes)
 
     prompt = construir_prompt(contexto, pregunta)
 
@@ -128,26 +225,97 @@ def responder_pregunta_phi2(pregunta, fragmentos_relevantes):
     print("📄 PROMPT ENVIADO AL MODELO ======================")
     print(prompt)
     print("=================================================")
+    return prompt
 
-    modelo = get_modelo_phi()
 
-    # 🔹 Máximo de tokens para la respuesta
-    max_tokens = 256   # <- límite fijo para evitar cuelgues
+def parametros_generacion(prompt, stream=False):
+    return {
+        "prompt": prompt,
+        "max_tokens": MAX_TOKENS_RESPUESTA,
+        "stop": STOP_RESPUESTA,
+        "temperature": 0.2,
+        "stream": stream,
+    }
+
+
+def generar_local_stream(prompt):
+    with _lock_modelo:
+        modelo = get_modelo_phi()
+        restaurar_prefijo(modelo)
+        salida = modelo(**parametros_generacion(prompt, stream=True))
+        try:
+            for parcial in salida:
+                texto = parcial["choices"][0]["text"]
+                if texto:
+                    yield texto
+        finally:
+            salida.close()
+
 
+def medir_generacion(tokens):
+    """
+    Registra el tiempo hasta el primer token (evaluación del prompt) y el de
+    la generación restante, también si el consumidor corta antes.
+    """
+    inicio = time.perf_counter()
+    primero = None
     try:
-        respuesta = modelo(
-            prompt,
-            max_tokens=max_tokens,
-            stop=["\nPregunta:", "\nRespuesta:"],
-            temperature=0.2
-        )
-        texto = respuesta["choices"][0]["text"].strip()
+        for texto in tokens:
+            if primero is None:
+                primero = time.perf_counter()
+                metricas.registrar("evaluacion_prompt", primero - inicio)
+            yield texto
+    finally:
+        tokens.close()
+        if primero is not None:
+            metricas.registrar("generacion", time.perf_counter() - primero)
+
+
+def _tokens_respuesta(prompt):
+    if SERVICIO_LLM_URL:
+        tokens = servicio_llm.generar_stream(SERVICIO_LLM_URL, parametros_generacion(prompt, stream=True))
+    else:
+        tokens = generar_local_stream(prompt)
+    return medir_generacion(tokens)
+
+
+def responder_pregunta_phi2(pregunta, fragmentos_relevantes):
+    """
+    Genera una respuesta con el modelo usando los fragmentos relevantes.
+    - pregunta: texto de la consulta del usuario
+    - fragmentos_relevantes: lista de fragmentos de documentos (strings)
+    Con DOCIA_LLM_SERVICIO_URL la generación la hace el servicio de inferencia
+    (manage.py servidor_llm) y este proceso no carga el modelo.
+    """
+    if not fragmentos_relevantes:
+        return SIN_INFORMACION
+
+    with metricas.etapa("armado_prompt"):
+        prompt = preparar_prompt(pregunta, fragmentos_relevantes)
+
+    try:
+        texto = "".join(_tokens_respuesta(prompt))
 
         # Limpiar ruido de formato (pipes, tablas, etc)
-        texto = limpiar_respuesta(texto)
+        texto = limpiar_respuesta(texto.strip())
 
-        return texto or "No se encontró información relevante en los documentos."
+        return texto or SIN_INFORMACION
 
     except Exception as e:
         print(f"⚠️ Error al generar respuesta: {e}")
-        return "Ocurrió un error al procesar la pregunta."
+        return ERROR_RESPUESTA
+
+
+def responder_pregunta_stream(pregunta, fragmentos_relevantes):
+    """
+    Igual que responder_pregunta_phi2 pero entrega el texto a medida que se genera.
+    Si quien consume cierra el generador (cliente desconectado), la generación
+    se corta en el próximo token y el modelo queda libre.
+    """
+    if not fragmentos_relevantes:
+        yield SIN_INFORMACION
+        return
+
+    with metricas.etapa("armado_prompt"):
+        prompt = preparar_prompt(pregunta, fragmentos_relevantes)
+    yield from _tokens_respuesta(prompt)
@@ -0,0 +1,90 @@
+# documentos/entidades.py
+import re
+
+PATRONES = {
+    # SGSP: 7–10 dígitos seguidos
+    "sgsp": r"\b\d{7,10}\b",
+
+    # Matrículas: letras + 3-4 números + opcionales letras
+    "matricula": r"\b[a-z]{1,3}\d{3,4}[a-z]{0,3}\b",
+
+    # Teléfonos: 8–12 dígitos (después de normalizar)
+    "telefono": r"\b\d{8,12}\b",
+
+    # CI uruguaya: exactamente 8 dígitos (después de normalizar)
+    "ci": r"\b\d{8}\b",
+
+    # Direcciones (se mantienen igual)
+    "direccion": r"\b(calle|av|avenida|ruta|camino)\s+\w+",
+}
+
+
+_REGEX = {tipo: re.compile(patron) for tipo, patron in PATRONES.items()}
+
+# 🔹 Mismo largo que EntidadFragmento.valor
+MAX_VALOR = 120
+
+
+def extraer_entidades(texto_norm):
+    """
+    Pares (tipo, valor) presentes en un texto ya normalizado.
+    Se usa igual al indexar y al consultar, así los valores coinciden.
+    """
+    entidades = set()
+    for tipo, regex in _REGEX.items():
+        for m in regex.finditer(texto_norm or ""):
+            entidades.add((tipo, m.group(0)[:MAX_VALOR]))
+    return entidades
+
+
+def filas_entidades(doc_id, fragmentos):
+    """Filas EntidadFragmento para fragmentos ya indexados (con faiss_id)."""
+    from .models import EntidadFragmento
+
+    return [
+        EntidadFragmento(documento_id=doc_id, tipo=tipo, valor=valor, faiss_id=frag["faiss_id"])
+        for frag in fragmentos
+        for tipo, valor in extraer_entidades(frag.get("texto_norm", ""))
+    ]
+
+
+def guardar_entidades_doc(doc_id, fragmentos):
+    """Reemplaza las entidades de un documento por las de sus fragmentos actuales."""
+    from .models import EntidadFragmento
+
+    EntidadFragmento.objects.filter(documento_id=doc_id).delete()
+    EntidadFragmento.objects.bulk_create(filas_entidades(doc_id, fragmentos), batch_size=1000)
+
+
+def regenerar_entidades(fragmentos):
+    """Rearma toda la tabla de entidades a partir de los fragmentos indexados."""
+    from django.db import transaction
+    from .models import EntidadFragmento
+
+    filas = [
+        fila
+        for frag in fragmentos
+        for fila in filas_entidades(frag["doc_id"], [frag])
+    ]
+    with transaction.atomic():
+        EntidadFragmento.objects.all().delete()
+        EntidadFragmento.objects.bulk_create(filas, batch_size=1000)
+    print(f"🏷️ {len(filas)} entidades indexadas.")
+    return len(filas)
+
+
+def faiss_ids_por_entidades(entidades):
+    """
+    Pares (faiss_id, documento_id) de los fragmentos que mencionan alguna de las
+    entidades (consulta indexada). El documento permite descartar filas que no
+    corresponden al índice cargado (otra generación, índice de prueba).
+    """
+    from django.db.models import Q
+    from .models import EntidadFragmento
+
+    if not entidades:
+        return set()
+    filtro = Q()
+    for tipo, valor in entidades:
+        filtro |= Q(tipo=tipo, valor=valor)
+    return set(EntidadFragmento.objects.filter(filtro).values_list("faiss_id", "documento_id"))
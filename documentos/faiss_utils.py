@@ -1,188 +1,413 @@
+import hashlib
+import multiprocessing
 import os
 import re
+import shutil
+import threading
+import time
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 from django.conf import settings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import lru_cache
-from sklearn.preprocessing import normalize   # 🔹 FIX: para coseno
-
-# 📦 Rutas de archivos
+from . import generaciones
+from .almacen_fragmentos import AlmacenFragmentos
+from .bloqueos import LectoresEscritor, bloqueo_archivo
+from .cache_embeddings import CacheEmbeddings, clave_embedding
+from .entidades import (
+    extraer_entidades, faiss_ids_por_entidades, guardar_entidades_doc, regenerar_entidades
+)
+from .indice_invertido import PALABRAS_VACIAS, tokenizar
+from .metricas import etapa
+from .security import perfil_acceso
+from .texto import (  # noqa: F401
+    dividir_en_fragmentos, fragmentar_documento, fragmentar_documentos, normalizar_texto, tiene_match
+)
+
+# 📦 Rutas de archivos: una generación por regeneración completa (ver generaciones.py)
+INDICE_DIR = getattr(settings, "DOCIA_INDICE_DIR", os.path.join(settings.BASE_DIR, "indice_faiss"))
+GENERACIONES_RETENIDAS = getattr(settings, "DOCIA_INDICE_GENERACIONES_RETENIDAS", 2)
+# 🔹 Cada cuántos segundos una solicitud mira si otro proceso cambió el índice
+INTERVALO_CHEQUEO = getattr(settings, "DOCIA_INDICE_INTERVALO_CHEQUEO", 1.0)
+
+# 🔹 Formato anterior a las generaciones (archivos sueltos), solo para migrar
 INDEX_PATH = os.path.join(settings.BASE_DIR, "indice_faiss.index")
 FRAGMENTOS_PATH = os.path.join(settings.BASE_DIR, "fragmentos_guardados.npy")
+FRAGMENTOS_DIR = getattr(
+    settings, "DOCIA_FRAGMENTOS_DIR", os.path.join(settings.BASE_DIR, "fragmentos_faiss")
+)
+
+MODELO_EMBEDDINGS = getattr(settings, "DOCIA_MODELO_EMBEDDINGS", "intfloat/multilingual-e5-base")
+CACHE_EMBEDDINGS_DIR = getattr(
+    settings, "DOCIA_CACHE_EMBEDDINGS_DIR", os.path.join(settings.BASE_DIR, "cache_embeddings")
+)
+# 🔹 Fracción de la caché sin uso (texto que ya no está indexado) que dispara su compactación
+CACHE_EMBEDDINGS_MAX_SOBRANTE = getattr(settings, "DOCIA_CACHE_EMBEDDINGS_MAX_SOBRANTE", 0.5)
+
+# 🔹 Embeddings por lotes: tamaño de batch del modelo y procesos de encode (1 = sin pool)
+EMBEDDINGS_BATCH = getattr(settings, "DOCIA_EMBEDDINGS_BATCH", 64)
+EMBEDDINGS_PROCESOS = getattr(settings, "DOCIA_EMBEDDINGS_PROCESOS", 1)
+
+# 🔹 Armado completo del índice: procesos de fragmentado y tamaño de los lotes
+REGENERAR_PROCESOS = getattr(settings, "DOCIA_REGENERAR_PROCESOS", max(1, (os.cpu_count() or 2) - 1))
+REGENERAR_LOTE_DOCS = getattr(settings, "DOCIA_REGENERAR_LOTE_DOCS", 200)
+REGENERAR_LOTE_FRAGMENTOS = getattr(settings, "DOCIA_REGENERAR_LOTE_FRAGMENTOS", 4096)
+
+
+@lru_cache(maxsize=1)
+def get_modelo_embeddings():
+    return SentenceTransformer(MODELO_EMBEDDINGS, device="cpu")
+
+
+@lru_cache(maxsize=1)
+def get_cache_embeddings():
+    modelo = get_modelo_embeddings()
+    directorio = os.path.join(CACHE_EMBEDDINGS_DIR, re.sub(r"[^\w.-]+", "_", MODELO_EMBEDDINGS))
+    return CacheEmbeddings(directorio, modelo.get_sentence_embedding_dimension())
+
 
+def normalize(matriz):
+    """Normaliza filas a norma L2 = 1 (coseno con producto interno); filas nulas quedan en 0."""
+    matriz = np.asarray(matriz, dtype="float32")
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    return matriz / np.where(normas == 0, 1, normas)
 
 
-def dividir_en_fragmentos(texto, max_long=1200, solapamiento=200, es_normativa=False):
+@lru_cache(maxsize=256)
+def vector_pregunta(pregunta_norm):
+    """Embedding normalizado de una pregunta (lo reutilizan búsqueda y caché de respuestas)."""
+    vector = normalize(get_modelo_embeddings().encode([pregunta_norm]))[0].astype("float32")
+    vector.flags.writeable = False
+    return vector
+
+
+def codificar_fragmentos(textos_norm, pool=None):
     """
-    Divide un texto en fragmentos para indexar.
-    Si es normativa, separa por artículos.
+    Embeddings normalizados (float32) de fragmentos ya normalizados.
+    Solo se codifican los textos que no están en la caché en disco.
+    `pool`: pool de procesos de sentence-transformers (start_multi_process_pool).
     """
-    if es_normativa:
-        partes = re.split(r'(Artículo\s+\d+)', texto)
-        fragmentos, actual = [], ""
-        for i in range(len(partes)):
-            if re.match(r'Artículo\s+\d+', partes[i]):
-                if actual.strip():
-                    fragmentos.append({"texto": actual.strip()})
-                actual = partes[i]
-            else:
-                actual += " " + partes[i]
-        if actual.strip():
-            fragmentos.append({"texto": actual.strip()})
-        return fragmentos
-
-    oraciones = re.split(r'(?<=[.?!])\s+', texto.strip())
-    fragmentos, actual = [], ""
-    for o in oraciones:
-        if len(actual) + len(o) + 1 <= max_long:
-            actual += " " + o
-        else:
-            fragmentos.append({"texto": actual.strip()})
-            actual = o
-    if actual:
-        fragmentos.append({"texto": actual.strip()})
-    return fragmentos
-
+    modelo = get_modelo_embeddings()
+    cache = get_cache_embeddings()
 
+    claves = [clave_embedding(t, MODELO_EMBEDDINGS) for t in textos_norm]
+    vectores, faltantes = cache.buscar(claves)
 
+    if faltantes:
+        textos = [textos_norm[i] for i in faltantes]
+        if pool is not None:
+            nuevos = modelo.encode_multi_process(textos, pool, batch_size=EMBEDDINGS_BATCH)
+        else:
+            nuevos = modelo.encode(textos, batch_size=EMBEDDINGS_BATCH)
+        nuevos = normalize(nuevos)
+        nuevos = np.asarray(nuevos, dtype="float32")
+        vectores[faltantes] = nuevos
+        cache.guardar([claves[i] for i in faltantes], nuevos)
 
-# 📦 Rutas de archivos
-INDEX_PATH = os.path.join(settings.BASE_DIR, "indice_faiss.index")
-FRAGMENTOS_PATH = os.path.join(settings.BASE_DIR, "fragmentos_guardados.npy")
+    print(f"🧮 Embeddings: {len(textos_norm) - len(faltantes)} desde caché, {len(faltantes)} calculados.")
+    return vectores
 
-...
-def regenerar_indice_faiss():
-    from documentos.models import Documento
-    modelo_embeddings = SentenceTransformer("intfloat/multilingual-e5-base", device="cpu")
 
-    fragmentos, textos = [], []
+def compactar_cache_embeddings(fragmentos):
+    """
+    Descarta de la caché los embeddings que no usa ningún fragmento indexado
+    cuando superan CACHE_EMBEDDINGS_MAX_SOBRANTE del total.
+    """
+    cache = get_cache_embeddings()
+    claves = {clave_embedding(f["texto_norm"], MODELO_EMBEDDINGS) for f in fragmentos}
+    total = len(cache)
+    if total and (total - len(claves)) / total > CACHE_EMBEDDINGS_MAX_SOBRANTE:
+        cache.compactar(claves)
+
+def sigla_dependencia(doc):
+    return (
+        doc.dependencia.dependencia_argos.sigla
+        if doc.dependencia and doc.dependencia.dependencia_argos
+        else None
+    )
 
-    for doc in Documento.objects.all():
-        texto = (doc.texto_extraido or "").strip()
-        if not texto:
-            continue
 
-        es_normativa = doc.tipo_doc and any(
+def version_contenido(doc):
+    """
+    Hash de 64 bits de lo que se indexa de un documento (texto, asunto,
+    descripción y los datos de permisos que viajan con cada fragmento).
+    """
+    partes = [
+        doc.texto_extraido or "",
+        doc.asunto or "",
+        doc.descripcion or "",
+        sigla_dependencia(doc) or "",
+        "1" if doc.leido_por_ia else "0",
+    ]
+    digest = hashlib.sha1("\x1f".join(partes).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def datos_de_documento(doc):
+    """Lo necesario para fragmentar un documento, en tipos simples (se envía a otros procesos)."""
+    return {
+        "texto": doc.texto_extraido or "",
+        "es_normativa": bool(doc.tipo_doc and any(
             kw in doc.tipo_doc.tipo.lower() for kw in ["código", "ley", "norma"]
-        )
+        )),
+        "doc_id": doc.id,
+        "dep": sigla_dependencia(doc),
+        "leido": doc.leido_por_ia,
+        "asunto": doc.asunto,
+        "version": version_contenido(doc),
+    }
 
-        fragmentos_doc = dividir_en_fragmentos(texto, es_normativa=es_normativa)
-        for frag in fragmentos_doc:
-            faiss_id = len(textos)
-            frag_original = frag["texto"]
-            frag_norm = normalizar_texto(frag_original)
-
-            fragmentos.append({
-                "faiss_id": faiss_id,
-                "texto": frag_original,          # 🔹 original para mostrar
-                "texto_norm": frag_norm,         # 🔹 normalizado para embeddings
-                "doc_id": doc.id,
-                "dep": (
-                    doc.dependencia.dependencia_argos.sigla
-                    if doc.dependencia and doc.dependencia.dependencia_argos
-                    else None
-                ),
-                "leido": doc.leido_por_ia,
-                "asunto": doc.asunto,
-            })
 
-            print(f"Total fragmentos generados: {len(fragmentos)}")
+def fragmentos_de_documento(doc):
+    """Fragmentos (sin faiss_id) listos para indexar un documento."""
+    return fragmentar_documento(datos_de_documento(doc))
 
-            textos.append(frag_norm)  # 🔹 solo normalizado para embeddings
 
-    embeddings = modelo_embeddings.encode(textos)
-    embeddings = normalize(embeddings)
+def _lotes(iterable, tamano):
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
 
-    index = faiss.IndexFlatIP(embeddings.shape[1])  # producto interno ≈ coseno
-    if len(embeddings) > 0:
-        index.add(np.array(embeddings, dtype="float32"))
 
-    faiss.write_index(index, INDEX_PATH)
-    np.save(FRAGMENTOS_PATH, fragmentos, allow_pickle=True)
+def fragmentar_en_procesos(datos_docs, procesos):
+    """
+    Fragmentos de cada documento, en el orden en que llegan, con el fragmentado
+    y la normalización repartidos en un pool de procesos. Solo hay unos pocos
+    lotes en vuelo, así los documentos se siguen leyendo de a poco.
+    """
+    lotes = _lotes(datos_docs, REGENERAR_LOTE_DOCS)
+    if procesos <= 1:
+        for lote in lotes:
+            yield from fragmentar_documentos(lote)
+        return
 
-    get_faiss_index.cache_clear()
-    print(f"✅ Índice FAISS regenerado con {len(fragmentos)} fragmentos.")
+    # 🔹 spawn: los workers no heredan torch, FAISS ni la conexión a la base
+    contexto = multiprocessing.get_context("spawn")
+    en_vuelo = deque()
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        for lote in lotes:
+            en_vuelo.append(pool.submit(fragmentar_documentos, lote))
+            if len(en_vuelo) >= 2 * procesos:
+                yield from en_vuelo.popleft().result()
+        while en_vuelo:
+            yield from en_vuelo.popleft().result()
 
 
-import re
-import unicodedata
-
-# 🔹 Función para normalizar texto
-def normalizar_texto(texto: str) -> str:
-    if not texto:
-        return ""
-
-    # 🔹 Minúsculas y quitar tildes
-    texto = texto.lower()
-    texto = ''.join(
-        c for c in unicodedata.normalize('NFD', texto)
-        if unicodedata.category(c) != 'Mn'
-    )
+def indice_desde_vectores(vectores, tipo=None):
+    """
+    Índice con faiss_id = fila de `vectores` (matriz o memmap), agregado por lotes.
+    IVF-PQ se entrena con una muestra: k-means no usa más de 256 vectores por lista.
+    """
+    n, dimension = vectores.shape
+    entrenamiento = vectores
+    tope = IVF_NLIST * 256
+    if (tipo or TIPO_INDICE) == "ivfpq" and n > tope:
+        filas = np.sort(np.random.default_rng(0).choice(n, tope, replace=False))
+        entrenamiento = vectores[filas]
+
+    index = nuevo_indice(dimension, tipo=tipo, entrenamiento=entrenamiento)
+    for inicio in range(0, n, REGENERAR_LOTE_FRAGMENTOS):
+        fin = min(inicio + REGENERAR_LOTE_FRAGMENTOS, n)
+        index.add_with_ids(
+            np.ascontiguousarray(vectores[inicio:fin], dtype="float32"),
+            np.arange(inicio, fin, dtype="int64"),
+        )
+    return index
 
-    # 🔹 Quitar separadores en números (puntos, guiones, espacios)
-    texto = re.sub(r'(?<=\d)[\.\-\s](?=\d)', '', texto)
 
-    # 🔹 Matrículas: ca-1234-ax / ca 1234 ax → ca1234ax
-    texto = re.sub(
-        r'\b([a-z]{1,3})[\s\-]?(\d{3,4})(?:[\s\-]?([a-z]{1,3}))?\b',
-        lambda m: f"{m.group(1)}{m.group(2)}{m.group(3) or ''}",
-        texto
-    )
+def regenerar_indice_faiss(documentos=None, procesos=None, procesos_embeddings=None, aislado=False):
+    """
+    Rearma índice, metadatos y entidades. `documentos`: queryset a indexar (por defecto todos).
+    `aislado`: índice de prueba (benchmarks): no toca la tabla de entidades ni la cola.
+
+    Los documentos se leen con iterator() y se fragmentan en un pool de procesos;
+    los embeddings se calculan de a REGENERAR_LOTE_FRAGMENTOS y cada lote queda en
+    la caché de embeddings, así que si el armado se corta la próxima corrida solo
+    calcula lo que faltaba. El índice nuevo se arma en una generación aparte que se
+    publica al final; mientras tanto se sigue respondiendo con la anterior. Lo que
+    la cola indexó o eliminó durante el armado se vuelve a encolar al publicar.
+    """
+    from django.utils import timezone
+    from documentos.models import Documento
 
-    # 🔹 SGSP: números largos (7-10 dígitos) → dejamos solo número
-    # Antes: sgspXXXXXXXX → ahora: XXXXXXXX
-    # Si querés mantener prefijo, cambialo a r"sgsp\1"
-    texto = re.sub(r'\b(\d{7,10})\b', r"\1", texto)
+    inicio_armado = timezone.now()
+    modelo_embeddings = get_modelo_embeddings()
+    dimension = modelo_embeddings.get_sentence_embedding_dimension()
+    procesos = procesos or REGENERAR_PROCESOS
+    procesos_embeddings = procesos_embeddings or EMBEDDINGS_PROCESOS
+
+    if documentos is None:
+        documentos = Documento.objects.all()
+    documentos = documentos.select_related("dependencia__dependencia_argos", "tipo_doc")
+    datos_docs = (
+        datos_de_documento(doc)
+        for doc in documentos.iterator(chunk_size=REGENERAR_LOTE_DOCS)
+        if (doc.texto_extraido or "").strip()
+    )
+    frags_docs = (frag for frags in fragmentar_en_procesos(datos_docs, procesos) for frag in frags)
+
+    ruta_gen = generaciones.nueva_generacion(INDICE_DIR)
+    ruta_vectores = os.path.join(ruta_gen, "vectores.tmp")
+    pool = None
+    fragmentos = []
+    try:
+        if procesos_embeddings > 1:
+            pool = modelo_embeddings.start_multi_process_pool(["cpu"] * procesos_embeddings)
+
+        inicio = time.perf_counter()
+        with open(ruta_vectores, "wb") as salida:
+            for lote in _lotes(frags_docs, REGENERAR_LOTE_FRAGMENTOS):
+                for frag in lote:
+                    frag["faiss_id"] = len(fragmentos)
+                    fragmentos.append(frag)
+                salida.write(codificar_fragmentos([f["texto_norm"] for f in lote], pool=pool).tobytes())
+                ritmo = len(fragmentos) / max(time.perf_counter() - inicio, 1e-6)
+                print(f"Total fragmentos generados: {len(fragmentos)} ({ritmo:.0f} fragmentos/s)")
+
+        if fragmentos:
+            vectores = np.memmap(ruta_vectores, dtype="float32", mode="r", shape=(len(fragmentos), dimension))
+        else:
+            vectores = np.empty((0, dimension), dtype="float32")
+        index = indice_desde_vectores(vectores)
+        del vectores
+
+        AlmacenFragmentos.crear(os.path.join(ruta_gen, generaciones.DIR_FRAGMENTOS), fragmentos)
+        _escribir_indice(index, ruta_gen, modelo=MODELO_EMBEDDINGS)
+        # 🔹 Sin escrituras incrementales a medio hacer sobre la generación anterior
+        with bloqueo_archivo(os.path.join(INDICE_DIR, ".escritura")):
+            generaciones.publicar(INDICE_DIR, ruta_gen, GENERACIONES_RETENIDAS)
+    except BaseException:
+        # 🔹 Generación sin publicar: se descarta (la caché de embeddings queda)
+        shutil.rmtree(ruta_gen, ignore_errors=True)
+        raise
+    finally:
+        if pool is not None:
+            modelo_embeddings.stop_multi_process_pool(pool)
+        if os.path.exists(ruta_vectores):
+            os.remove(ruta_vectores)
+
+    if not aislado:
+        regenerar_entidades(fragmentos)
+        reencolar_cambios_desde(inicio_armado)
+        compactar_cache_embeddings(fragmentos)
+
+    # 🔹 Los demás procesos ven el cambio de ACTUAL en su próximo chequeo
+    descartar_indice()
+    print(f"✅ Índice FAISS regenerado con {len(fragmentos)} fragmentos.")
 
-    # 🔹 Teléfonos: 2-3 + 3 + 3/4 dígitos → solo números
-    texto = re.sub(r'\b(\d{2,3})(\d{3})(\d{3,4})\b', r"\1\2\3", texto)
 
-    # 🔹 CI uruguaya: 3.456.789-2 → 34567892
-    texto = re.sub(r'\b(\d{1,2})(\d{3})(\d{3})(\d)\b', r"\1\2\3\4", texto)
+def reencolar_cambios_desde(desde):
+    """
+    Las tareas de la cola que corrieron durante un armado completo escribieron
+    sobre la generación anterior, y el armado pudo haber leído esos documentos
+    antes del cambio: se vuelven a encolar (indexar es idempotente).
+    """
+    from documentos.cola_indexacion import encolar
+    from documentos.models import Documento, TareaIndexacion
 
-    # 🔹 Colapsar espacios múltiples
-    texto = re.sub(r'\s+', ' ', texto)
+    cambios = set(
+        TareaIndexacion.objects.filter(fecha_modificacion__gte=desde)
+        .exclude(estado=TareaIndexacion.PENDIENTE)
+        .values_list("documento_id", "accion")
+    )
+    cambios.update(
+        (doc_id, TareaIndexacion.INDEXAR)
+        for doc_id in Documento.objects.filter(fecha_modificacion__gte=desde).values_list("id", flat=True)
+    )
+    for doc_id, accion in sorted(cambios):
+        encolar(doc_id, accion)
+    if cambios:
+        print(f"🔁 {len(cambios)} cambios hechos durante el armado vuelven a la cola.")
 
-    return texto.strip()
-PATRONES = {
-    # SGSP: 7–10 dígitos seguidos
-    "sgsp": r"\b\d{7,10}\b",
 
-    # Matrículas: letras + 3-4 números + opcionales letras
-    "matricula": r"\b[a-z]{1,3}\d{3,4}[a-z]{0,3}\b",
+@contextmanager
+def usar_indice_en(directorio):
+    """
+    Apunta las generaciones del índice y la caché de embeddings a otro directorio
+    mientras dure el bloque (benchmarks sobre un corpus aparte sin tocar el
+    índice ni la caché productivos).
+    """
+    global INDICE_DIR, CACHE_EMBEDDINGS_DIR
+    anteriores = INDICE_DIR, CACHE_EMBEDDINGS_DIR
+    INDICE_DIR = os.path.join(directorio, "indice")
+    CACHE_EMBEDDINGS_DIR = os.path.join(directorio, "cache_embeddings")
+    descartar_indice()
+    get_cache_embeddings.cache_clear()
+    try:
+        yield
+    finally:
+        INDICE_DIR, CACHE_EMBEDDINGS_DIR = anteriores
+        descartar_indice()
+        get_cache_embeddings.cache_clear()
+
+
+def busqueda_semantica(query, k=10, user=None):
+    """
+    Búsqueda FAISS directa (sin umbrales ni fallbacks) con preview por fragmento,
+    restringida a lo que `user` puede ver (mismo filtro que buscar_fragmentos_relevantes).
+    """
+    with lectura_indice() as (modelo_embeddings, index, fragmentos):
+        perfil = perfil_acceso(user)
+        mascara = None if perfil.acceso_global else fragmentos.mascara_visibles(perfil.siglas)
+        if mascara is not None and not mascara.any():
+            return []
+
+        vec = modelo_embeddings.encode([query])
+        distancias, indices = index.search(
+            np.array(vec, dtype="float32"), k, params=parametros_busqueda(index, mascara)
+        )
 
-    # Teléfonos: 8–12 dígitos (después de normalizar)
-    "telefono": r"\b\d{8,12}\b",
+        resultados = []
+        for j, i in enumerate(indices[0]):
+            if i < 0 or i not in fragmentos:  # seguridad por si hay índice inválido
+                continue
 
-    # CI uruguaya: exactamente 8 dígitos (después de normalizar)
-    "ci": r"\b\d{8}\b",
+            frag = fragmentos[i]
+            # Extraer el texto (puede estar en dict o en string según cómo se guardó)
+            texto = frag["texto"]["texto"] if isinstance(frag.get("texto"), dict) else str(frag.get("texto"))
 
-    # Direcciones (se mantienen igual)
-    "direccion": r"\b(calle|av|avenida|ruta|camino)\s+\w+",
-}
+            distancia = float(distancias[0][j])
+            contiene = query.lower() in texto.lower()
+            resultados.append({
+                "doc_id": frag.get("doc_id"),
+                "asunto": frag.get("asunto", "Sin asunto"),
+                "texto": texto[:300],  # preview de 300 chars
+                "distancia": distancia,
+                "match": contiene,
+            })
 
+        # Ordenar: primero los que contienen literalmente el query, luego por similitud
+        # (producto interno: mayor = más parecido)
+        resultados.sort(key=lambda x: (not x["match"], -x["distancia"]))
+        return resultados[:k]
 
-def tiene_match(query: str, texto: str) -> bool:
-    return normalizar_texto(query) in normalizar_texto(texto)
 
 # 🔹 Función de coincidencias clave (boost extra)
-def coincidencias_clave(pregunta: str, fragmentos: list):
+def coincidencias_clave(pregunta: str, fragmentos):
+    """
+    Fragmentos que mencionan los identificadores de la pregunta (SGSP,
+    matrícula, teléfono, CI, dirección). Las entidades se extraen una vez
+    al indexar (EntidadFragmento), así que esto es una consulta por índice.
+    """
     resultados_extra = []
     texto_preg = normalizar_texto(pregunta)
 
-    for tipo, patron in PATRONES.items():
-        matches = re.findall(patron, texto_preg)
-        if not matches:
+    for faiss_id, doc_id in sorted(faiss_ids_por_entidades(extraer_entidades(texto_preg))):
+        frag = fragmentos.get(faiss_id)
+        if frag is None or frag["doc_id"] != doc_id:
             continue
-
-        for frag in fragmentos:
-            frag_txt = normalizar_texto(frag["texto"])
-            if any(m.lower() in frag_txt for m in matches):
-                frag_boost = frag.copy()
-                # Aumentamos el score → aparecen más arriba
-                frag_boost["score"] = frag_boost.get("score", 0) + 3.0
-                resultados_extra.append(frag_boost)
+        frag_boost = frag.copy()
+        # Aumentamos el score → aparecen más arriba
+        frag_boost["score"] = frag_boost.get("score", 0) + 3.0
+        resultados_extra.append(frag_boost)
 
     return resultados_extra
 
@@ -198,66 +423,36 @@ def buscar_fragmentos_relevantes(
     Busca fragmentos relevantes en FAISS con soporte para permisos por usuario.
     Usa texto normalizado para embeddings y comparaciones.
     """
-    modelo_embeddings, index, fragmentos = get_faiss_index()
-
-    # 🔹 Normalizar la query
-    pregunta_norm = normalizar_texto(pregunta)
-    vec_pregunta = modelo_embeddings.encode([pregunta_norm])
-    vec_pregunta = normalize(vec_pregunta)
-    distancias, indices = index.search(np.array(vec_pregunta, dtype="float32"), top_k)
-
-    fragmentos_filtrados = []
-
-    # Dependencia del usuario (si tiene)
-    user_dep_sigla = (
-        user.dependencia.dependencia_argos.sigla
-        if user and getattr(user, "dependencia", None)
-        and getattr(user.dependencia, "dependencia_argos", None)
-        else None
-    )
-
-    # --- Paso 1: similitud alta ---
-    for idx, i in enumerate(indices[0]):
-        score = float(distancias[0][idx])
-        if score <= -1e+20:
-            continue
-        if i >= len(fragmentos):
-            continue
-        if score < umbral_alto:
-            continue
+    with lectura_indice() as (modelo_embeddings, index, fragmentos):
+        # 🔹 Visibilidad del usuario: se resuelve una vez y se aplica dentro de FAISS
+        perfil = perfil_acceso(user)
+        mascara = None if perfil.acceso_global else fragmentos.mascara_visibles(perfil.siglas)
+
+        def visible(faiss_id):
+            return mascara is None or (0 <= faiss_id < len(mascara) and mascara[faiss_id])
+
+        # 🔹 Normalizar la query
+        pregunta_norm = normalizar_texto(pregunta)
+        with etapa("codificar"):
+            vec_pregunta = vector_pregunta(pregunta_norm).reshape(1, -1)
+
+        with etapa("busqueda"):
+            if mascara is not None and not mascara.any():
+                distancias = np.empty((1, 0), dtype="float32")
+                indices = np.empty((1, 0), dtype="int64")
+            else:
+                # 🔹 El top_k ya sale sólo de fragmentos visibles (no se filtra después)
+                distancias, indices = index.search(
+                    np.array(vec_pregunta, dtype="float32"), top_k,
+                    params=parametros_busqueda(index, mascara),
+                )
 
-        frag = fragmentos[i]
-        frag_dict = {
-            "faiss_id": i,
-            "texto": frag.get("texto"),
-            "doc_id": frag.get("doc_id"),
-            "dep": frag.get("dep"),
-            "leido": frag.get("leido"),
-            "asunto": frag.get("asunto"),
-            "score": score,
-            "match": tiene_match(pregunta, frag.get("texto", ""))  # ✅
-        }
-
-        if user and user.groups.filter(name="argos_consultas_general").exists():
-            fragmentos_filtrados.append(frag_dict)
-        else:
-            if frag_dict.get("leido") and (frag_dict.get("dep") == user_dep_sigla or frag_dict.get("dep") is None):
-                fragmentos_filtrados.append(frag_dict)
-
-    # --- Paso 2: similitud baja ---
-    if not fragmentos_filtrados:
-        for idx, i in enumerate(indices[0]):
-            score = float(distancias[0][idx])
-            if score <= -1e+20:
-                continue
-            if i >= len(fragmentos):
-                continue
-            if score < umbral_bajo:
-                continue
+        fragmentos_filtrados = []
 
+        def frag_de_faiss(i, score):
             frag = fragmentos[i]
-            frag_dict = {
-                "faiss_id": i,
+            return {
+                "faiss_id": int(i),
                 "texto": frag.get("texto"),
                 "doc_id": frag.get("doc_id"),
                 "dep": frag.get("dep"),
@@ -266,153 +461,540 @@ def buscar_fragmentos_relevantes(
                 "score": score,
                 "match": tiene_match(pregunta, frag.get("texto", ""))  # ✅
             }
-            fragmentos_filtrados.append(frag_dict)
-
-    # --- Paso 3: coincidencia exacta con nombres propios ---
-    palabras = pregunta.split()
-    if len(palabras) >= 2:
-        nombre_query = normalizar_texto(" ".join(palabras))
-        for frag in fragmentos:
-            if nombre_query in frag.get("texto_norm", ""):
-                fragmentos_filtrados.append({
-                    "faiss_id": frag.get("faiss_id"),
-                    "texto": frag.get("texto"),
-                    "doc_id": frag.get("doc_id"),
-                    "dep": frag.get("dep"),
-                    "leido": frag.get("leido"),
-                    "asunto": frag.get("asunto"),
-                    "score": 5.0,
-                    "match": tiene_match(pregunta, frag.get("texto", ""))  # ✅
-                })
-
-    # --- Paso 4: fallback con keywords ---
-    if len(fragmentos_filtrados) < 3:
-        for frag in fragmentos:
-            texto_norm = frag.get("texto_norm", "")
-            if any(normalizar_texto(pal) in texto_norm for pal in palabras):
-                fragmentos_filtrados.append({
-                    "faiss_id": frag.get("faiss_id"),
-                    "texto": frag.get("texto"),
-                    "doc_id": frag.get("doc_id"),
-                    "dep": frag.get("dep"),
-                    "leido": frag.get("leido"),
-                    "asunto": frag.get("asunto"),
-                    "score": 2.0,
-                    "match": tiene_match(pregunta, frag.get("texto", ""))  # ✅
-                })
-
-    # --- Paso 5: coincidencias clave (SGSP, matrícula, direcciones) ---
-    extras = coincidencias_clave(pregunta, fragmentos)
-    for frag_boost in extras:
-        frag_boost["match"] = tiene_match(pregunta, frag_boost.get("texto", ""))  # ✅
-        fragmentos_filtrados.append(frag_boost)
-
-    # --- Fallback explícito si no hay nada ---
-    if not fragmentos_filtrados:
-        return [{
-            "texto": "⚠️ No se encontró información suficiente en los documentos.",
-            "score": 0,
-            "match": False
-        }]
-
-    # --- 🔹 Deduplicado final por (doc_id, texto) ---
-    vistos, limpios = set(), []
-    for f in fragmentos_filtrados:
-        clave = (f.get("doc_id"), f.get("texto"))
-        if clave not in vistos:
-            limpios.append(f)
-            vistos.add(clave)
-
-    # --- Orden final ---
-    limpios = sorted(limpios, key=lambda x: x["score"], reverse=True)
-    return limpios
 
+        with etapa("filtro"):
+            # --- Paso 1: similitud alta ---
+            for idx, i in enumerate(indices[0]):
+                score = float(distancias[0][idx])
+                if score <= -1e+20:
+                    continue
+                if i < 0 or i not in fragmentos:
+                    continue
+                if score < umbral_alto:
+                    continue
+                fragmentos_filtrados.append(frag_de_faiss(i, score))
+
+            # --- Paso 2: similitud baja ---
+            if not fragmentos_filtrados:
+                for idx, i in enumerate(indices[0]):
+                    score = float(distancias[0][idx])
+                    if score <= -1e+20:
+                        continue
+                    if i < 0 or i not in fragmentos:
+                        continue
+                    if score < umbral_bajo:
+                        continue
+                    fragmentos_filtrados.append(frag_de_faiss(i, score))
+
+        # 🔹 Pasos 3 a 5: candidatos desde el índice invertido, sin recorrer el corpus
+        indice = fragmentos.indice_invertido
+
+        def frag_con_score(frag, score):
+            return {
+                "faiss_id": frag.get("faiss_id"),
+                "texto": frag.get("texto"),
+                "doc_id": frag.get("doc_id"),
+                "dep": frag.get("dep"),
+                "leido": frag.get("leido"),
+                "asunto": frag.get("asunto"),
+                "score": score,
+                "match": pregunta_norm in frag.get("texto_norm", "")  # ✅ = tiene_match
+            }
 
-@lru_cache(maxsize=1)
-def get_faiss_index():
+        with etapa("fallback_palabras"):
+            # --- Paso 3: coincidencia exacta con nombres propios ---
+            palabras = pregunta.split()
+            if len(palabras) >= 2:
+                nombre_query = normalizar_texto(" ".join(palabras))
+                for faiss_id in sorted(indice.candidatos_frase(nombre_query)):
+                    if not visible(faiss_id):
+                        continue
+                    frag = fragmentos.get(faiss_id)
+                    if frag and nombre_query in frag.get("texto_norm", ""):
+                        fragmentos_filtrados.append(frag_con_score(frag, 5.0))
+
+            # --- Paso 4: fallback con keywords ---
+            # 🔹 Alguna palabra como subcadena del fragmento ("1234" encuentra
+            #    "ca1234ax"); se omiten las que son sólo palabras vacías
+            if len(fragmentos_filtrados) < 3:
+                claves = {normalizar_texto(pal) for pal in palabras}
+                claves = {
+                    clave for clave in claves
+                    if any(token not in PALABRAS_VACIAS for token in tokenizar(clave))
+                }
+                candidatos = set()
+                for clave in claves:
+                    candidatos |= indice.candidatos_subcadena(clave)
+                for faiss_id in sorted(candidatos):
+                    if not visible(faiss_id):
+                        continue
+                    frag = fragmentos.get(faiss_id)
+                    texto_norm = frag.get("texto_norm", "") if frag else ""
+                    if any(clave in texto_norm for clave in claves):
+                        fragmentos_filtrados.append(frag_con_score(frag, 2.0))
+
+        with etapa("refuerzo_entidades"):
+            # --- Paso 5: coincidencias clave (SGSP, matrícula, direcciones) ---
+            extras = coincidencias_clave(pregunta, fragmentos)
+            for frag_boost in extras:
+                if not visible(frag_boost.get("faiss_id", -1)):
+                    continue
+                frag_boost["match"] = pregunta_norm in frag_boost.get("texto_norm", "")  # ✅
+                fragmentos_filtrados.append(frag_boost)
+
+        # --- Fallback explícito si no hay nada ---
+        if not fragmentos_filtrados:
+            return [{
+                "texto": "⚠️ No se encontró información suficiente en los documentos.",
+                "score": 0,
+                "match": False
+            }]
+
+        # --- 🔹 Deduplicado final por (doc_id, texto) ---
+        vistos, limpios = set(), []
+        for f in fragmentos_filtrados:
+            clave = (f.get("doc_id"), f.get("texto"))
+            if clave not in vistos:
+                limpios.append(f)
+                vistos.add(clave)
+
+        # --- Orden final ---
+        limpios = sorted(limpios, key=lambda x: x["score"], reverse=True)
+        return limpios
+
+
+# 🔹 Serializa escrituras, recargas y sincronización del índice dentro del proceso
+_lock_indice = threading.RLock()
+# 🔹 Búsquedas (lectura) contra cambios en el lugar del índice y del almacén
+#    (sincronización, escrituras): una búsqueda nunca ve uno a medio modificar
+_acceso_indice = LectoresEscritor()
+
+
+# 🔹 Tipo de índice: "flat" (exacto), "ivfpq" o "hnsw" (aproximados)
+TIPO_INDICE = getattr(settings, "DOCIA_FAISS_TIPO_INDICE", "flat")
+IVF_NLIST = getattr(settings, "DOCIA_FAISS_IVF_NLIST", 1024)
+IVF_NPROBE = getattr(settings, "DOCIA_FAISS_IVF_NPROBE", 16)
+PQ_M = getattr(settings, "DOCIA_FAISS_PQ_M", 48)
+HNSW_M = getattr(settings, "DOCIA_FAISS_HNSW_M", 32)
+HNSW_EF_SEARCH = getattr(settings, "DOCIA_FAISS_HNSW_EF_SEARCH", 64)
+
+# 🔹 FAISS recomienda ~39 vectores de entrenamiento por lista IVF; PQ necesita 256
+MIN_POR_LISTA_IVF = 39
+MIN_ENTRENAMIENTO_PQ = 256
+
+
+def descripcion_indice(tipo, n_vectores=None):
+    """Cadena para faiss.index_factory según el tipo de índice configurado."""
+    if tipo == "ivfpq":
+        nlist = IVF_NLIST
+        if n_vectores is not None:
+            nlist = min(nlist, n_vectores // MIN_POR_LISTA_IVF)
+        return f"IDMap2,IVF{max(nlist, 1)},PQ{PQ_M}"
+    if tipo == "hnsw":
+        return f"IDMap2,HNSW{HNSW_M},Flat"
+    return "IDMap2,Flat"
+
+
+def tipo_de_indice(index):
+    interno = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(interno, faiss.IndexIVF):
+        return "ivfpq"
+    if isinstance(interno, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def configurar_busqueda(index):
+    """Aplica nprobe / efSearch de settings al índice cargado."""
+    tipo = tipo_de_indice(index)
+    if tipo == "ivfpq":
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", IVF_NPROBE)
+    elif tipo == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", HNSW_EF_SEARCH)
+    return index
+
+
+def parametros_busqueda(index, mascara=None):
+    """
+    SearchParameters que restringen la búsqueda a los faiss_id marcados en
+    `mascara` (filtrado dentro de FAISS). None = sin restricción.
+    """
+    if mascara is None:
+        return None
+    bitmap = np.packbits(mascara, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+
+    tipo = tipo_de_indice(index)
+    if tipo == "ivfpq":
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=IVF_NPROBE)
+    elif tipo == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+
+    # 🔹 FAISS no copia el bitmap: se mantiene vivo junto con los parámetros
+    params.bitmap_visibles, params.selector_visibles = bitmap, selector
+    return params
+
+
+def nuevo_indice(dimension, tipo=None, entrenamiento=None):
+    """
+    Índice por producto interno (≈ coseno) con IDs externos estables (faiss_id).
+    Los índices IVF-PQ se entrenan con `entrenamiento`; si no alcanzan los
+    vectores para entrenarlo se usa un índice exacto (flat).
+    """
+    tipo = tipo or TIPO_INDICE
+    n = len(entrenamiento) if entrenamiento is not None else 0
+
+    if tipo == "ivfpq" and (n < MIN_ENTRENAMIENTO_PQ or n // MIN_POR_LISTA_IVF < 1):
+        print(f"⚠️ Solo {n} vectores para entrenar IVF-PQ. Se usa índice flat.")
+        tipo = "flat"
+
+    index = faiss.index_factory(
+        dimension, descripcion_indice(tipo, n), faiss.METRIC_INNER_PRODUCT
+    )
+    if not index.is_trained:
+        print(f"🏋️ Entrenando índice {tipo} con {n} vectores...")
+        index.train(np.ascontiguousarray(entrenamiento, dtype="float32"))
+    return configurar_busqueda(index)
+
+
+def reconstruir_indice(index, fragmentos):
+    """
+    Reconstruye el índice con los fragmentos vigentes, tomando los vectores
+    de la caché de embeddings. Se usa con índices sin remove_ids (HNSW).
+    """
+    vigentes = list(fragmentos)
+    ids = np.array([f["faiss_id"] for f in vigentes], dtype="int64")
+    vectores = codificar_fragmentos([f["texto_norm"] for f in vigentes])
+    nuevo = nuevo_indice(index.d, tipo=tipo_de_indice(index), entrenamiento=vectores)
+    if len(ids):
+        nuevo.add_with_ids(vectores, ids)
+    return nuevo
+
+
+def migrar_a_idmap(index):
+    """
+    Convierte un índice plano viejo (posición == faiss_id) en IndexIDMap2,
+    reutilizando los vectores ya guardados, sin volver a calcular embeddings.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        return index
+    nuevo = nuevo_indice(index.d)
+    if index.ntotal > 0:
+        vectores = index.reconstruct_n(0, index.ntotal)
+        nuevo.add_with_ids(vectores, np.arange(index.ntotal, dtype="int64"))
+    print(f"🔁 Índice FAISS migrado a IndexIDMap2 ({index.ntotal} vectores).")
+    return nuevo
+
+
+# 🔹 Índice cargado en este proceso: (modelo, index, fragmentos), la firma del
+#    almacén con la que se sincronizó el índice y el último chequeo
+_cargado = None
+_firma_sincronizada = None
+_ultimo_chequeo = 0.0
+
+
+def cargar_indice():
+    """
+    Carga la generación publicada. El proceso queda fijado a ella (índice en
+    memoria, metadatos mapeados) hasta que indice_actualizado vea otra.
+    """
     print("⏳ Cargando embeddings y FAISS...")
-    modelo_embeddings = SentenceTransformer("intfloat/multilingual-e5-base", device="cpu")
+    modelo_embeddings = get_modelo_embeddings()
 
-    if not os.path.exists(INDEX_PATH) or not os.path.exists(FRAGMENTOS_PATH):
+    generacion = generaciones.generacion_actual(INDICE_DIR) or migrar_a_generaciones()
+    if generacion is None:
         raise FileNotFoundError("❌ No existe índice FAISS. Ejecutá regenerar_indice_faiss().")
 
-    index = faiss.read_index(INDEX_PATH)
-    fragmentos = np.load(FRAGMENTOS_PATH, allow_pickle=True)
-    print(f"✅ FAISS cargado con {len(fragmentos)} fragmentos.")
+    ruta_gen = os.path.join(INDICE_DIR, generacion)
+    ruta_indice, _ = generaciones.indice_verificado(ruta_gen)
+    index = configurar_busqueda(faiss.read_index(ruta_indice))
+    fragmentos = AlmacenFragmentos(os.path.join(ruta_gen, generaciones.DIR_FRAGMENTOS))
+    print(f"✅ FAISS cargado con {len(fragmentos)} fragmentos (generación {generacion}).")
     return modelo_embeddings, index, fragmentos
 
 
-def agregar_fragmentos_doc(doc_id):
-    from documentos.models import Documento
+def get_faiss_index():
+    """Índice de este proceso; se carga la primera vez que se pide."""
+    global _cargado, _firma_sincronizada
+    if _cargado is None:
+        with _lock_indice:
+            if _cargado is None:
+                _cargado = cargar_indice()
+                _firma_sincronizada = None
+    return _cargado
 
-    modelo_embeddings, index, fragmentos = get_faiss_index()
-    fragmentos = list(fragmentos)
 
-    doc = Documento.objects.filter(id=doc_id).first()
-    if not doc or not doc.texto_extraido:
-        print(f"⚠️ Documento {doc_id} no tiene texto extraído.")
-        return
+def indice_cargado():
+    return _cargado is not None
 
-    fragmentos_doc = dividir_en_fragmentos(doc.texto_extraido)
-    textos = [normalizar_texto(f["texto"]) for f in fragmentos_doc]  # 🔹 normalizados
-    embeddings = modelo_embeddings.encode(textos)
-    embeddings = normalize(embeddings)
 
-    base_id = len(fragmentos)
-    for idx, frag in enumerate(fragmentos_doc):
-        frag_original = frag["texto"]
-        frag_norm = normalizar_texto(frag_original)
+def descartar_indice():
+    """Olvida el índice de este proceso: se vuelve a cargar al próximo pedido."""
+    global _cargado, _firma_sincronizada
+    with _lock_indice:
+        _cargado, _firma_sincronizada = None, None
 
-        fragmentos.append({
-            "faiss_id": base_id + idx,
-            "texto": frag_original,      # 🔹 original
-            "texto_norm": frag_norm,     # 🔹 normalizado
-            "doc_id": doc.id,
-            "dep": (
-                doc.dependencia.dependencia_argos.sigla
-                if doc.dependencia and doc.dependencia.dependencia_argos
-                else None
-            ),
-            "leido": doc.leido_por_ia,
-            "asunto": getattr(doc, "asunto", None),
-        })
 
-    index.add(np.array(embeddings, dtype="float32"))
+def _fijar_indice(index, fragmentos):
+    """Reemplaza el objeto índice cargado (p. ej. HNSW reconstruido) si es de esos metadatos."""
+    global _cargado
+    if _cargado is not None and _cargado[2] is fragmentos:
+        _cargado = (_cargado[0], index, fragmentos)
 
-    faiss.write_index(index, INDEX_PATH)
-    np.save(FRAGMENTOS_PATH, fragmentos, allow_pickle=True)
-    get_faiss_index.cache_clear()
 
-    print(f"✅ Documento {doc_id} agregado al índice con {len(fragmentos_doc)} fragmentos.")
+def _diferencias(index, vigentes):
+    """(faiss_id a quitar, faiss_id a agregar) para llevar el índice a `vigentes`."""
+    en_indice = faiss.vector_to_array(index.id_map)
+    return en_indice[~np.isin(en_indice, vigentes)], vigentes[~np.isin(vigentes, en_indice)]
 
 
+def _indice_confirmado(fragmentos):
+    """Lee el archivo de índice que confirmó el último escritor de la generación."""
+    ruta_indice, _ = generaciones.indice_verificado(generacion_de(fragmentos))
+    return configurar_busqueda(faiss.read_index(ruta_indice))
 
-def eliminar_fragmentos_por_doc(doc_id):
+
+def _sincronizar(index, fragmentos, escritor=False):
+    """
+    Aplica al índice en memoria las altas y bajas que hay en el almacén y no
+    en el índice (las hizo otro proceso). Los vectores nuevos salen de la
+    caché de embeddings; no se relee el archivo del índice.
+
+    Si hay bajas y el índice no soporta remove_ids (HNSW), un lector carga el
+    archivo que ya confirmó el escritor en vez de reconstruirlo; sólo quien
+    tiene el bloqueo de escritura (`escritor`) reconstruye.
+    """
+    global _firma_sincronizada
+    fragmentos.refrescar()
+    if fragmentos.firma == _firma_sincronizada:
+        return index
+
+    vigentes = fragmentos.ids_vigentes()
+    quitar, agregar = _diferencias(index, vigentes)
+    al_dia = True
+
+    if len(quitar) and not escritor and tipo_de_indice(index) == "hnsw":
+        index = _indice_confirmado(fragmentos)
+        _fijar_indice(index, fragmentos)
+        quitar, agregar = _diferencias(index, vigentes)
+        if len(quitar):
+            # 🔹 El escritor todavía no confirmó su archivo: las bajas se toman en
+            #    el próximo chequeo (los fragmentos borrados ya no se devuelven)
+            quitar, al_dia = quitar[:0], False
+        print(f"🔄 Índice HNSW recargado de {generacion_de(fragmentos)}.")
+
+    if len(quitar) or len(agregar):
+        nuevo = _quitar_ids(index, quitar, fragmentos)
+        if nuevo is not index:
+            agregar = agregar[:0]   # 🔹 reconstruido (HNSW) ya con todos los vigentes
+        index = nuevo
+        if len(agregar):
+            vectores = codificar_fragmentos([fragmentos[i]["texto_norm"] for i in agregar])
+            index.add_with_ids(vectores, agregar)
+        print(f"🔄 Índice sincronizado: +{len(agregar)} / -{len(quitar)} fragmentos.")
+    if al_dia:
+        _firma_sincronizada = fragmentos.firma
+    return index
+
+
+def indice_actualizado(forzar=False, escritor=False):
+    """
+    get_faiss_index() al día con lo que escribieron otros procesos. Se llama
+    en cada solicitud, pero chequea a lo sumo cada INTERVALO_CHEQUEO segundos
+    (un stat de ACTUAL y uno de meta.json):
+
+    - Otra generación publicada → se cargan su índice y sus metadatos
+      (el modelo de embeddings queda en memoria).
+    - Altas o bajas incrementales en la generación vigente → se aplican sólo
+      esos fragmentos al índice en memoria; el índice invertido y las máscaras
+      de permisos se actualizan al refrescar el almacén.
+    """
+    global _ultimo_chequeo
     modelo_embeddings, index, fragmentos = get_faiss_index()
-    fragmentos = list(fragmentos)
+    ahora = time.monotonic()
+    if not forzar and ahora - _ultimo_chequeo < INTERVALO_CHEQUEO:
+        return modelo_embeddings, index, fragmentos
+
+    with _lock_indice, _acceso_indice.escritura():
+        _ultimo_chequeo = ahora
+        actual = generaciones.generacion_actual(INDICE_DIR)
+        if actual is not None and actual != os.path.basename(generacion_de(fragmentos)):
+            print(f"🔄 Generación {actual} del índice publicada: recargando.")
+            descartar_indice()
+            modelo_embeddings, index, fragmentos = get_faiss_index()
+        index = _sincronizar(index, fragmentos, escritor)
+    return modelo_embeddings, index, fragmentos
 
-    frag_indices = [i for i, f in enumerate(fragmentos) if f.get("doc_id") == doc_id]
-    if not frag_indices:
-        print(f"⚠️ Documento {doc_id} no tenía fragmentos en el índice.")
-        return
 
-    print(f"🗑️ Eliminando {len(frag_indices)} fragmentos del documento {doc_id}...")
+def generacion_de(fragmentos):
+    """Directorio de la generación a la que pertenece un almacén cargado."""
+    return os.path.dirname(fragmentos.directorio)
+
+
+def _escribir_indice(index, ruta_gen, **datos):
+    tmp = generaciones.archivo_temporal(ruta_gen)
+    faiss.write_index(index, tmp)
+    return generaciones.confirmar_indice(
+        ruta_gen, tmp, vectores=int(index.ntotal), tipo=tipo_de_indice(index), **datos
+    )
+
+
+def guardar_indice(index, fragmentos):
+    """Confirma el índice como archivo nuevo de la generación de `fragmentos`."""
+    _escribir_indice(index, generacion_de(fragmentos))
+
+
+def migrar_a_generaciones():
+    """
+    Pasa el índice y los metadatos del formato anterior (archivos sueltos en
+    BASE_DIR) a una primera generación. Devuelve su nombre, o None si no hay
+    nada que migrar. Los archivos viejos no se borran.
+    """
+    if not os.path.exists(INDEX_PATH):
+        return None
+
+    with bloqueo_archivo(os.path.join(INDICE_DIR, ".migracion")):
+        generacion = generaciones.generacion_actual(INDICE_DIR)
+        if generacion is not None:   # 🔹 la migró otro proceso mientras esperábamos
+            return generacion
+        if not AlmacenFragmentos.existe(FRAGMENTOS_DIR):
+            if not os.path.exists(FRAGMENTOS_PATH):
+                return None
+            migrar_fragmentos_npy()
+
+        viejo = AlmacenFragmentos(FRAGMENTOS_DIR)
+        ruta_gen = generaciones.nueva_generacion(INDICE_DIR)
+        AlmacenFragmentos.crear(
+            os.path.join(ruta_gen, generaciones.DIR_FRAGMENTOS), list(viejo),
+            proximo_id=viejo.meta["proximo_id"],
+        )
+        _escribir_indice(migrar_a_idmap(faiss.read_index(INDEX_PATH)), ruta_gen, modelo=MODELO_EMBEDDINGS)
+        generaciones.publicar(INDICE_DIR, ruta_gen, GENERACIONES_RETENIDAS)
+
+    print(f"🔁 Índice migrado a {ruta_gen}. Ya se pueden borrar {INDEX_PATH} y {FRAGMENTOS_DIR}.")
+    return os.path.basename(ruta_gen)
+
+
+def migrar_fragmentos_npy():
+    """Pasa el .npy pickleado viejo al almacén columnar (una sola vez)."""
+    viejos = list(np.load(FRAGMENTOS_PATH, allow_pickle=True))
+    vigentes = [dict(f) for f in viejos if not f.get("eliminado")]
+    for pos, frag in enumerate(vigentes):
+        frag.setdefault("faiss_id", pos)
+        frag.setdefault("texto_norm", normalizar_texto(frag.get("texto", "")))
+    proximo_id = max((f["faiss_id"] for f in viejos), default=-1) + 1
+    AlmacenFragmentos.crear(FRAGMENTOS_DIR, vigentes, proximo_id=proximo_id)
+    print(f"🔁 {len(vigentes)} fragmentos migrados a {FRAGMENTOS_DIR}.")
+
+
+def _quitar_ids(index, ids, fragmentos):
+    """
+    remove_ids, o reconstrucción desde la caché si el índice no lo soporta
+    (HNSW). Reconstruye sólo quien escribe (bajo escritura_indice).
+    """
+    if not len(ids):
+        return index
+    try:
+        index.remove_ids(ids)
+    except RuntimeError:
+        index = reconstruir_indice(index, fragmentos)
+        _fijar_indice(index, fragmentos)
+    return index
+
+
+@contextmanager
+def escritura_indice():
+    """
+    Bloqueo de las escrituras del índice entre procesos (varios workers de la
+    cola, el admin, un comando). Adentro el índice se sincroniza con lo que
+    escribieron los demás, así se chequea y se escribe sobre datos al día.
+    """
+    with _lock_indice, bloqueo_archivo(os.path.join(INDICE_DIR, ".escritura")), \
+            _acceso_indice.escritura():
+        yield indice_actualizado(forzar=True, escritor=True)
+
+
+@contextmanager
+def lectura_indice():
+    """
+    Índice al día para buscar. Mientras dura el bloque ningún hilo de este
+    proceso lo modifica (remove_ids, refresco del almacén), así la búsqueda y
+    los metadatos que se leen después son de la misma foto.
+    """
+    cargado = indice_actualizado()
+    with _acceso_indice.lectura():
+        yield _cargado or cargado
+
+
+def asegurar_indexado(doc_id):
+    """
+    Deja el documento indexado en la versión actual de su contenido.
+    Si los fragmentos vigentes ya tienen esa versión no hace nada, así que
+    se puede llamar las veces que haga falta sin duplicar fragmentos.
+    Devuelve True si tuvo que reindexar.
+    """
+    from documentos.models import Documento
+
+    modelo_embeddings, index, fragmentos = indice_actualizado(forzar=True)
+
+    documentos = Documento.objects.select_related("dependencia__dependencia_argos", "tipo_doc")
+    doc = documentos.filter(id=doc_id).first()
+    if not doc or not (doc.texto_extraido or "").strip():
+        print(f"⚠️ Documento {doc_id} no tiene texto extraído.")
+        eliminar_fragmentos_por_doc(doc_id)
+        return False
+
+    version = version_contenido(doc)
+    if fragmentos.versiones_de_doc(doc_id) == {version}:
+        print(f"✔️ Documento {doc_id} ya está indexado (versión {version:016x}).")
+        return False
+
+    nuevos = fragmentos_de_documento(doc)
+    embeddings = codificar_fragmentos([f["texto_norm"] for f in nuevos])
+
+    # 🔹 Se modifica en el lugar el índice cacheado: no hace falta recargarlo.
+    #    Chequeo, reemplazo y guardado bajo el mismo bloqueo entre procesos.
+    with escritura_indice() as (modelo_embeddings, index, fragmentos):
+        if fragmentos.versiones_de_doc(doc_id) == {version}:
+            return False
+        actual = documentos.filter(id=doc_id).first()
+        if actual is None or version_contenido(actual) != version:
+            # 🔹 El documento cambió mientras tanto: lo indexa la tarea encolada por ese cambio
+            print(f"↪️ Documento {doc_id} cambió durante la indexación; se omite la versión {version:016x}.")
+            return False
+        index = _quitar_ids(index, fragmentos.eliminar_doc(doc_id), fragmentos)
+        ids = fragmentos.agregar(nuevos)
+        index.add_with_ids(np.array(embeddings, dtype="float32"), ids)
+        guardar_indice(index, fragmentos)
+        guardar_entidades_doc(doc.id, nuevos)
+
+    print(f"✅ Documento {doc_id} indexado con {len(nuevos)} fragmentos (versión {version:016x}).")
+    return True
+
 
-    fragmentos_restantes = [f for f in fragmentos if f.get("doc_id") != doc_id]
-    textos = [f["texto"] for f in fragmentos_restantes]
+def agregar_fragmentos_doc(doc_id):
+    """Compatibilidad: indexar un documento es idempotente (ver asegurar_indexado)."""
+    return asegurar_indexado(doc_id)
 
-    embeddings = modelo_embeddings.encode(textos)
-    embeddings = normalize(embeddings)
 
-    nuevo_index = faiss.IndexFlatIP(embeddings.shape[1])
-    if len(embeddings) > 0:
-        nuevo_index.add(np.array(embeddings, dtype="float32"))
+def eliminar_fragmentos_por_doc(doc_id):
+    """
+    Quita del índice los fragmentos de un documento con remove_ids.
+    Los vectores del resto no se recalculan.
+    """
+    from documentos.models import EntidadFragmento
 
-    for i, f in enumerate(fragmentos_restantes):
-        f["faiss_id"] = i
+    with escritura_indice() as (modelo_embeddings, index, fragmentos):
+        ids = fragmentos.eliminar_doc(doc_id)
+        if not len(ids):
+            print(f"⚠️ Documento {doc_id} no tenía fragmentos en el índice.")
+            return
 
-    faiss.write_index(nuevo_index, INDEX_PATH)
-    np.save(FRAGMENTOS_PATH, fragmentos_restantes, allow_pickle=True)
-    get_faiss_index.cache_clear()
+        print(f"🗑️ Eliminando {len(ids)} fragmentos del documento {doc_id}...")
+        index = _quitar_ids(index, ids, fragmentos)
+        guardar_indice(index, fragmentos)
+        EntidadFragmento.objects.filter(documento_id=doc_id).delete()
 
-    print(f"✅ Documento {doc_id} eliminado. Total fragmentos ahora: {len(fragmentos_restantes)}")
+    print(f"✅ Documento {doc_id} eliminado. Total fragmentos ahora: {len(fragmentos)}")
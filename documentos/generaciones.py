@@ -0,0 +1,173 @@
+# documentos/generaciones.py
+"""
+Generaciones del índice FAISS: cada regeneración completa se arma en un
+directorio propio y se publica cambiando un puntero con un rename atómico.
+
+    <raiz>/ACTUAL                        nombre de la generación publicada
+    <raiz>/g000007/manifiesto.json       archivo de índice vigente, sha256 y tamaño
+    <raiz>/g000007/indice.000003.faiss   índice serializado (no se modifica nunca)
+    <raiz>/g000007/fragmentos/           metadatos (AlmacenFragmentos)
+
+Las actualizaciones incrementales escriben un archivo de índice nuevo dentro
+de la generación y lo confirman reemplazando el manifiesto, así un lector
+nunca abre un índice a medio escribir. Un proceso que cargó una generación
+sigue usándola aunque se publique otra; de las anteriores a la publicada se
+conservan las últimas `retener` y el resto se borra.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from .bloqueos import bloqueo_archivo
+
+ARCHIVO_ACTUAL = "ACTUAL"
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+DIR_FRAGMENTOS = "fragmentos"
+PATRON_GENERACION = re.compile(r"^g\d{6}$")
+
+
+class IndiceCorrupto(Exception):
+    pass
+
+
+def _escribir_atomico(ruta, datos):
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+def _sha256_archivo(ruta, sincronizar=False):
+    sha = hashlib.sha256()
+    with open(ruta, "r+b" if sincronizar else "rb") as f:
+        if sincronizar:
+            os.fsync(f.fileno())
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _generaciones(raiz):
+    if not os.path.isdir(raiz):
+        return []
+    return sorted(n for n in os.listdir(raiz) if PATRON_GENERACION.match(n))
+
+
+def generacion_actual(raiz):
+    """Nombre de la generación publicada, o None si todavía no hay ninguna."""
+    try:
+        with open(os.path.join(raiz, ARCHIVO_ACTUAL), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def nueva_generacion(raiz):
+    """Crea (sin publicar) el directorio de la próxima generación y devuelve su ruta."""
+    with bloqueo_archivo(os.path.join(raiz, ".lock")):
+        existentes = _generaciones(raiz)
+        numero = int(existentes[-1][1:]) + 1 if existentes else 1
+        ruta = os.path.join(raiz, f"g{numero:06d}")
+        os.makedirs(os.path.join(ruta, DIR_FRAGMENTOS))
+    return ruta
+
+
+def leer_manifiesto(ruta_gen):
+    try:
+        with open(os.path.join(ruta_gen, ARCHIVO_MANIFIESTO), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def archivo_temporal(ruta_gen):
+    """Ruta donde escribir un índice antes de confirmarlo (mismo sistema de archivos)."""
+    return os.path.join(ruta_gen, f".indice-{os.getpid()}-{threading.get_ident()}.tmp")
+
+
+def confirmar_indice(ruta_gen, ruta_tmp, **datos):
+    """
+    Incorpora a la generación el índice recién escrito en `ruta_tmp` con un
+    nombre nuevo y lo publica en el manifiesto (con su sha256). Los archivos
+    de índice reemplazados se borran, salvo el anterior (puede estar leyéndose).
+    """
+    with bloqueo_archivo(os.path.join(ruta_gen, ".lock")):
+        manifiesto = leer_manifiesto(ruta_gen) or {
+            "generacion": os.path.basename(ruta_gen),
+            "creado": time.time(),
+            "secuencia": 0,
+        }
+        anterior = manifiesto.get("indice")
+        manifiesto["secuencia"] += 1
+        nombre = f"indice.{manifiesto['secuencia']:06d}.faiss"
+
+        sha256 = _sha256_archivo(ruta_tmp, sincronizar=True)
+        os.replace(ruta_tmp, os.path.join(ruta_gen, nombre))
+        manifiesto.update(
+            datos,
+            indice=nombre,
+            sha256=sha256,
+            bytes=os.path.getsize(os.path.join(ruta_gen, nombre)),
+            actualizado=time.time(),
+        )
+        _escribir_atomico(
+            os.path.join(ruta_gen, ARCHIVO_MANIFIESTO),
+            json.dumps(manifiesto, indent=2).encode("utf-8"),
+        )
+
+        for archivo in os.listdir(ruta_gen):
+            if archivo.startswith("indice.") and archivo not in (nombre, anterior):
+                try:
+                    os.remove(os.path.join(ruta_gen, archivo))
+                except OSError:
+                    pass
+    return manifiesto
+
+
+def indice_verificado(ruta_gen):
+    """
+    (ruta del índice vigente, manifiesto) después de comprobar su sha256.
+    Si el archivo se reemplazó mientras tanto se vuelve a leer el manifiesto.
+    """
+    for _ in range(3):
+        manifiesto = leer_manifiesto(ruta_gen)
+        if manifiesto is None:
+            raise FileNotFoundError(f"❌ La generación {ruta_gen} no tiene manifiesto.")
+        ruta = os.path.join(ruta_gen, manifiesto["indice"])
+        try:
+            sha256 = _sha256_archivo(ruta)
+        except FileNotFoundError:
+            continue
+        if sha256 != manifiesto["sha256"]:
+            raise IndiceCorrupto(f"❌ {ruta} no coincide con el sha256 del manifiesto.")
+        return ruta, manifiesto
+    raise FileNotFoundError(f"❌ No se pudo leer el índice de {ruta_gen}.")
+
+
+def publicar(raiz, ruta_gen, retener=2):
+    """Apunta ACTUAL a la generación (rename atómico) y borra las que sobran."""
+    _escribir_atomico(os.path.join(raiz, ARCHIVO_ACTUAL), os.path.basename(ruta_gen).encode("utf-8"))
+    recolectar(raiz, retener)
+
+
+def recolectar(raiz, retener=2):
+    """
+    Borra las generaciones anteriores a la publicada salvo las `retener` más
+    recientes (otros procesos pueden tenerlas cargadas). Las posteriores están
+    en armado y no se tocan. Si algo sigue mapeado (Windows), se reintenta en
+    la próxima publicación.
+    """
+    actual = generacion_actual(raiz)
+    if actual is None:
+        return
+    anteriores = [g for g in _generaciones(raiz) if g < actual]
+    for nombre in anteriores[:max(len(anteriores) - retener, 0)]:
+        shutil.rmtree(os.path.join(raiz, nombre), ignore_errors=True)
+        if not os.path.exists(os.path.join(raiz, nombre)):
+            print(f"🧹 Generación {nombre} del índice eliminada.")
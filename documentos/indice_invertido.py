@@ -0,0 +1,122 @@
+# documentos/indice_invertido.py
+import re
+from bisect import bisect_right
+from collections import defaultdict
+
+TOKEN = re.compile(r"\w+")
+
+# 🔹 Palabras que aparecen en casi todos los fragmentos: no sirven como keyword
+PALABRAS_VACIAS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "o", "para", "por", "que", "se", "su", "un", "una", "y",
+    "como", "cual", "cuales", "donde", "quien", "quienes", "sobre", "hay", "sabe",
+}
+
+
+def tokenizar(texto_norm):
+    """Tokens de un texto ya pasado por normalizar_texto."""
+    return TOKEN.findall(texto_norm or "")
+
+
+class IndiceInvertido:
+    """
+    Índice invertido token → faiss_id sobre el texto normalizado de los
+    fragmentos. Devuelve candidatos: quien lo usa verifica la frase exacta
+    sobre texto_norm y descarta los fragmentos eliminados.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._tokens = {}
+        self._vocabulario = None   # (palabras unidas por "\n", palabras, inicios); se arma al pedirlo
+
+    @classmethod
+    def desde_fragmentos(cls, fragmentos):
+        indice = cls()
+        for frag in fragmentos:
+            indice.agregar(frag["faiss_id"], frag.get("texto_norm", ""))
+        return indice
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def agregar(self, faiss_id, texto_norm):
+        tokens = frozenset(tokenizar(texto_norm))
+        self._tokens[faiss_id] = tokens
+        for token in tokens:
+            if token not in self._postings:
+                self._vocabulario = None
+            self._postings[token].add(faiss_id)
+
+    def eliminar(self, ids):
+        for faiss_id in ids:
+            for token in self._tokens.pop(int(faiss_id), ()):
+                posting = self._postings.get(token)
+                if posting is not None:
+                    posting.discard(int(faiss_id))
+                    if not posting:
+                        del self._postings[token]
+                        self._vocabulario = None
+
+    def con_todos(self, tokens):
+        """IDs que contienen todos los tokens (se intersecta desde la lista más corta)."""
+        tokens = set(tokens)
+        if not tokens:
+            return set()
+        listas = sorted((self._postings.get(t, set()) for t in tokens), key=len)
+        resultado = set(listas[0])
+        for posting in listas[1:]:
+            resultado &= posting
+            if not resultado:
+                break
+        return resultado
+
+    def candidatos_frase(self, frase_norm):
+        """
+        IDs que pueden contener la frase como subcadena: los tokens del medio
+        completos, el primero y el último pueden estar cortados ("juan per" →
+        "juan perez"). Quien lo usa verifica la frase sobre texto_norm.
+        """
+        tokens = tokenizar(frase_norm)
+        if len(tokens) <= 1:
+            return self.candidatos_subcadena(frase_norm)
+        resultado = self.con_todos(tokens[1:-1]) if len(tokens) > 2 else None
+        for borde in (tokens[0], tokens[-1]):
+            ids = self.candidatos_subcadena(borde)
+            resultado = ids if resultado is None else resultado & ids
+        return resultado
+
+    def _palabras_con(self, subcadena):
+        """Tokens del vocabulario que contienen `subcadena` ("1234" → "ca1234ax")."""
+        if self._vocabulario is None:
+            palabras = sorted(self._postings)
+            inicios, pos = [], 0
+            for palabra in palabras:
+                inicios.append(pos)
+                pos += len(palabra) + 1
+            self._vocabulario = ("\n".join(palabras), palabras, inicios)
+        texto, palabras, inicios = self._vocabulario
+
+        encontradas, pos = set(), texto.find(subcadena)
+        while pos != -1:
+            i = bisect_right(inicios, pos) - 1
+            encontradas.add(palabras[i])
+            # 🔹 Siguiente palabra: cada una se cuenta una vez
+            pos = texto.find(subcadena, inicios[i] + len(palabras[i]) + 1)
+        return encontradas
+
+    def candidatos_subcadena(self, texto_norm):
+        """
+        IDs que pueden contener `texto_norm` como subcadena, también dentro de
+        una palabra: cada token se busca como subcadena del vocabulario (no
+        del corpus). Quien lo usa verifica sobre texto_norm.
+        """
+        resultado = None
+        for token in set(tokenizar(texto_norm)):
+            ids = set()
+            for palabra in self._palabras_con(token):
+                ids |= self._postings[palabra]
+            resultado = ids if resultado is None else resultado & ids
+            if not resultado:
+                break
+        return resultado or set()
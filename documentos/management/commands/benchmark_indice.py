@@ -0,0 +1,79 @@
+# documentos/management/commands/benchmark_indice.py
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from documentos.faiss_utils import (
+    codificar_fragmentos,
+    get_faiss_index,
+    get_modelo_embeddings,
+    nuevo_indice,
+    normalizar_texto,
+    tipo_de_indice,
+    normalize,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los tipos de índice FAISS (flat, ivfpq, hnsw) sobre el corpus "
+        "actual: recall@k y latencia p50/p95 por consulta frente a flat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=20, help="Vecinos por consulta (top_k).")
+        parser.add_argument("--consultas", type=int, default=200,
+                            help="Fragmentos del corpus usados como consulta.")
+        parser.add_argument("--preguntas", help="Archivo de texto con una pregunta por línea.")
+        parser.add_argument("--tipos", nargs="+", default=["flat", "ivfpq", "hnsw"])
+        parser.add_argument("--semilla", type=int, default=42)
+
+    def handle(self, *args, **opciones):
+        k = opciones["k"]
+        _, _, fragmentos = get_faiss_index()
+        vigentes = list(fragmentos)
+        if not vigentes:
+            self.stderr.write("❌ El índice no tiene fragmentos.")
+            return
+
+        self.stdout.write(f"📦 Cargando vectores de {len(vigentes)} fragmentos (caché de embeddings)...")
+        ids = np.array([f["faiss_id"] for f in vigentes], dtype="int64")
+        vectores = codificar_fragmentos([f["texto_norm"] for f in vigentes])
+        consultas = self._consultas(opciones, vectores)
+
+        exacto = nuevo_indice(vectores.shape[1], tipo="flat")
+        exacto.add_with_ids(vectores, ids)
+        _, referencia = exacto.search(consultas, k)
+
+        self.stdout.write(f"{'tipo':<8}{'recall@' + str(k):>12}{'p50 ms':>10}{'p95 ms':>10}{'armado s':>11}")
+        for tipo in opciones["tipos"]:
+            inicio = time.perf_counter()
+            index = nuevo_indice(vectores.shape[1], tipo=tipo, entrenamiento=vectores)
+            if tipo_de_indice(index) != tipo:
+                # 🔹 nuevo_indice cayó a otro tipo (p. ej. IVF-PQ sin vectores suficientes)
+                self.stdout.write(f"{tipo:<8}  omitido: se armó un índice {tipo_de_indice(index)}")
+                continue
+            index.add_with_ids(vectores, ids)
+            armado = time.perf_counter() - inicio
+
+            latencias, aciertos = [], 0
+            for q, esperados in zip(consultas, referencia):
+                t0 = time.perf_counter()
+                _, obtenidos = index.search(q.reshape(1, -1), k)
+                latencias.append((time.perf_counter() - t0) * 1000)
+                aciertos += len(set(obtenidos[0]) & set(esperados[esperados >= 0]))
+
+            recall = aciertos / max(1, int((referencia >= 0).sum()))
+            p50, p95 = np.percentile(latencias, [50, 95])
+            self.stdout.write(f"{tipo:<8}{recall:>12.3f}{p50:>10.2f}{p95:>10.2f}{armado:>11.1f}")
+
+    def _consultas(self, opciones, vectores):
+        if opciones["preguntas"]:
+            with open(opciones["preguntas"], encoding="utf-8") as f:
+                preguntas = [normalizar_texto(l) for l in f if l.strip()]
+            vec = normalize(get_modelo_embeddings().encode(preguntas))
+            return np.asarray(vec, dtype="float32")
+
+        rng = np.random.default_rng(opciones["semilla"])
+        n = min(opciones["consultas"], len(vectores))
+        return np.ascontiguousarray(vectores[rng.choice(len(vectores), n, replace=False)])
@@ -0,0 +1,241 @@
+# documentos/management/commands/benchmark_recuperacion.py
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Dependencia
+from documentos.models import Documento, TipoDoc
+from documentos.metricas import solicitud
+from documentos.security import PerfilAcceso
+
+TEMAS = ["hurto", "rapiña", "incendio", "accidente de tránsito", "violencia doméstica", "estafa", "contrabando"]
+LUGARES = ["Montevideo", "Canelones", "Maldonado", "Salto", "Paysandú", "Rivera", "Colonia"]
+NOMBRES = ["Juan", "María", "Carlos", "Lucía", "Martín", "Ana", "Diego", "Sofía", "Pablo", "Valentina"]
+APELLIDOS = ["Pérez", "González", "Rodríguez", "Fernández", "López", "Martínez", "Silva", "Sosa", "Núñez"]
+RELLENO = [
+    "Se realizaron las actuaciones correspondientes según el protocolo vigente.",
+    "El personal actuante relevó testimonios en el lugar del hecho.",
+    "Se dio cuenta a la fiscalía de turno, que dispuso las medidas del caso.",
+    "Se incautaron elementos que quedan a disposición de la autoridad competente.",
+    "No se registraron lesionados durante el procedimiento.",
+    "Se coordinó con la unidad especializada para continuar la investigación.",
+]
+
+
+class UsuarioBenchmark:
+    """Usuario con acceso global: mide la recuperación sin el filtro de permisos."""
+    is_authenticated = True
+    _perfil_acceso = PerfilAcceso(True, frozenset())
+
+
+def percentiles(valores):
+    if not valores:
+        return {}
+    return {
+        "p50_ms": round(float(np.percentile(valores, 50)), 2),
+        "p95_ms": round(float(np.percentile(valores, 95)), 2),
+        "p99_ms": round(float(np.percentile(valores, 99)), 2),
+        "media_ms": round(float(np.mean(valores)), 2),
+    }
+
+
+def corpus_sintetico(n_documentos, n_consultas, semilla):
+    """Documentos con identificadores únicos (matrícula, SGSP, persona) y preguntas sobre ellos."""
+    rng = random.Random(semilla)
+    documentos, consultas = [], []
+    claves_por_persona = {}
+    for n in range(n_documentos):
+        tema, lugar = rng.choice(TEMAS), rng.choice(LUGARES)
+        persona = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+        matricula = f"{''.join(rng.choice('ABCDEFGHIKLMNPRSTU') for _ in range(3))}-{rng.randint(1000, 9999)}"
+        sgsp = str(rng.randint(10_000_000, 99_999_999))
+        frases = rng.sample(RELLENO, k=len(RELLENO))
+        texto = " ".join([
+            f"Con fecha {rng.randint(1, 28)}/{rng.randint(1, 12)} se recibe denuncia por {tema} en {lugar}.",
+            frases[0], frases[1],
+            f"Se identifica a {persona} como involucrado, en el vehículo matrícula {matricula}.",
+            frases[2],
+            f"El hecho se registra bajo el número SGSP {sgsp}.",
+            frases[3], frases[4],
+        ])
+        clave = f"doc{n}"
+        claves_por_persona.setdefault(persona, []).append(clave)
+        documentos.append({"clave": clave, "asunto": f"Informe de {tema} en {lugar} ({n})", "texto": texto})
+        consultas.extend([
+            {"pregunta": f"¿Qué se sabe de la matrícula {matricula}?", "relevantes": [clave], "tipo": "entidad"},
+            {"pregunta": f"SGSP {sgsp}", "relevantes": [clave], "tipo": "entidad"},
+            {"pregunta": persona, "relevantes": None, "tipo": "nombre"},
+        ])
+    # 🔹 Los nombres se repiten: es relevante todo documento que nombra a la persona
+    for consulta in consultas:
+        if consulta["relevantes"] is None:
+            consulta["relevantes"] = claves_por_persona[consulta["pregunta"]]
+    rng.shuffle(consultas)
+    return documentos, consultas[:n_consultas]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de recuperación sobre un corpus de prueba (fixture JSON o sintético): "
+        "latencia por etapa, recall@k, MRR y memoria, en JSON para comparar corridas. "
+        "Los documentos se crean dentro de una transacción que se revierte y el índice "
+        "se arma en un directorio temporal (el índice productivo no se toca)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fixture", help=(
+            'JSON {"documentos": [{"clave", "asunto", "texto", "descripcion"?}], '
+            '"consultas": [{"pregunta", "relevantes": [clave, ...]}]}'
+        ))
+        parser.add_argument("--documentos", type=int, default=300, help="Documentos sintéticos.")
+        parser.add_argument("--consultas", type=int, default=200, help="Consultas sintéticas.")
+        parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+        parser.add_argument("--top-k", type=int, default=30, help="top_k de buscar_fragmentos_relevantes.")
+        parser.add_argument("--semilla", type=int, default=42)
+        parser.add_argument("--salida", help="Archivo donde escribir el JSON (por defecto stdout).")
+
+    def _corpus(self, opciones):
+        if opciones["fixture"]:
+            with open(opciones["fixture"], encoding="utf-8") as f:
+                datos = json.load(f)
+            return datos["documentos"], datos["consultas"]
+        return corpus_sintetico(opciones["documentos"], opciones["consultas"], opciones["semilla"])
+
+    def _crear_documentos(self, documentos):
+        dependencia = Dependencia.objects.first()
+        if dependencia is None:
+            raise CommandError("Se necesita al menos una Dependencia para crear los documentos de prueba.")
+        tipo, _ = TipoDoc.objects.get_or_create(tipo="Benchmark")
+        ids = {}
+        for d in documentos:
+            doc = Documento.objects.create(
+                dependencia=dependencia,
+                tipo_doc=tipo,
+                fecha_informe=date.today(),
+                asunto=d["asunto"][:220],
+                descripcion=d.get("descripcion", ""),
+                texto_extraido=d["texto"],
+                leido_por_ia=True,
+            )
+            ids[d["clave"]] = doc.id
+        return ids
+
+    def handle(self, *args, **opciones):
+        import psutil
+        # 👇 Import diferido: el stack de IA sólo se carga al correr el benchmark
+        from documentos.entidades import guardar_entidades_doc
+        from documentos.faiss_utils import (
+            TIPO_INDICE, busqueda_semantica, buscar_fragmentos_relevantes, get_faiss_index,
+            get_modelo_embeddings, normalizar_texto, regenerar_indice_faiss, usar_indice_en,
+            vector_pregunta,
+        )
+
+        documentos, consultas = self._corpus(opciones)
+        proceso = psutil.Process(os.getpid())
+        get_modelo_embeddings()  # 🔹 la carga del modelo no cuenta como armado del índice
+        rss_inicial = proceso.memory_info().rss
+
+        ks = sorted(opciones["k"])
+        metodos = ("buscar_fragmentos_relevantes", "busqueda_semantica")
+        latencias = {"codificar": [], **{m: [] for m in metodos}}
+        aciertos = {m: {k: 0 for k in ks} for m in metodos}
+        rr = {m: [] for m in metodos}
+        usuario = UsuarioBenchmark()
+
+        with transaction.atomic(), tempfile.TemporaryDirectory() as directorio, usar_indice_en(directorio):
+            ids = self._crear_documentos(documentos)
+
+            inicio = time.perf_counter()
+            regenerar_indice_faiss(Documento.objects.filter(pk__in=ids.values()), aislado=True)
+            _, index, fragmentos = get_faiss_index()
+            armado = time.perf_counter() - inicio
+
+            # 🔹 Entidades sólo de los documentos de prueba (ids nuevos): la tabla
+            #    productiva no se vacía ni se bloquea
+            por_doc = {}
+            for frag in fragmentos:
+                por_doc.setdefault(frag["doc_id"], []).append(frag)
+            for doc_id, frags in por_doc.items():
+                guardar_entidades_doc(doc_id, frags)
+            rss_indice = proceso.memory_info().rss
+
+            for consulta in consultas:
+                relevantes = {ids[c] for c in consulta["relevantes"] if c in ids}
+
+                vector_pregunta.cache_clear()
+                t0 = time.perf_counter()
+                vector_pregunta(normalizar_texto(consulta["pregunta"]))
+                latencias["codificar"].append((time.perf_counter() - t0) * 1000)
+
+                resultados = {}
+                t0 = time.perf_counter()
+                with solicitud("benchmark", log=False) as spans:
+                    resultados["buscar_fragmentos_relevantes"] = buscar_fragmentos_relevantes(
+                        consulta["pregunta"], top_k=opciones["top_k"], user=usuario
+                    )
+                latencias["buscar_fragmentos_relevantes"].append((time.perf_counter() - t0) * 1000)
+                # 🔹 Etapas internas (búsqueda, filtro, fallbacks) según documentos.metricas
+                for nombre, segundos in spans.items():
+                    if nombre != "codificar":
+                        latencias.setdefault(nombre, []).append(segundos * 1000)
+
+                t0 = time.perf_counter()
+                resultados["busqueda_semantica"] = busqueda_semantica(consulta["pregunta"], k=max(ks), user=usuario)
+                latencias["busqueda_semantica"].append((time.perf_counter() - t0) * 1000)
+
+                for metodo in metodos:
+                    # 🔹 Ranking de documentos (primer fragmento de cada uno)
+                    docs = list(dict.fromkeys(r["doc_id"] for r in resultados[metodo] if r.get("doc_id")))
+                    for k in ks:
+                        aciertos[metodo][k] += bool(relevantes & set(docs[:k]))
+                    rango = next((i for i, d in enumerate(docs, start=1) if d in relevantes), None)
+                    rr[metodo].append(1 / rango if rango else 0.0)
+
+            n_fragmentos = len(fragmentos)
+            transaction.set_rollback(True)
+
+        n = max(len(consultas), 1)
+        reporte = {
+            "fecha": timezone.now().isoformat(),
+            "corpus": {
+                "origen": opciones["fixture"] or "sintetico",
+                "documentos": len(documentos),
+                "fragmentos": n_fragmentos,
+                "consultas": len(consultas),
+            },
+            "config": {"tipo_indice": TIPO_INDICE, "top_k": opciones["top_k"], "semilla": opciones["semilla"]},
+            "armado_indice_s": round(armado, 2),
+            "latencia": {etapa: percentiles(valores) for etapa, valores in latencias.items()},
+            "calidad": {
+                metodo: {
+                    **{f"recall@{k}": round(aciertos[metodo][k] / n, 4) for k in ks},
+                    "mrr": round(float(np.mean(rr[metodo])) if rr[metodo] else 0.0, 4),
+                }
+                for metodo in metodos
+            },
+            "memoria_mb": {
+                "rss_inicial": round(rss_inicial / 1024 ** 2, 1),
+                "rss_con_indice": round(rss_indice / 1024 ** 2, 1),
+            },
+        }
+        try:
+            import resource  # 🔹 sólo Unix: pico de memoria del proceso (KB en Linux)
+            reporte["memoria_mb"]["rss_pico"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:
+            pass
+
+        salida = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if opciones["salida"]:
+            with open(opciones["salida"], "w", encoding="utf-8") as f:
+                f.write(salida)
+            self.stdout.write(f"✅ Reporte guardado en {opciones['salida']}")
+        else:
+            self.stdout.write(salida)
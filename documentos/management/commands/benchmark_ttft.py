@@ -0,0 +1,97 @@
+# documentos/management/commands/benchmark_ttft.py
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+
+def prompt_sin_prefijo(contexto, pregunta):
+    """Disposición anterior: contexto variable antes de las instrucciones fijas."""
+    from documentos.consultas_phi2 import PREFIJO_PROMPT
+
+    instrucciones = PREFIJO_PROMPT.split("\n\nDocumentos relevantes")[0]
+    return f"""
+Documentos relevantes extraídos de la base de datos:
+{contexto}
+
+{instrucciones}
+
+Pregunta: {pregunta}
+Respuesta:"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tiempo hasta el primer token (TTFT) del modelo GGUF con el prompt "
+        "anterior (contexto primero) y con el prefijo fijo reutilizado desde la caché KV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consultas", type=int, default=5,
+                            help="Preguntas por variante (cada una con otro contexto).")
+        parser.add_argument("--fragmentos", type=int, default=6,
+                            help="Fragmentos del corpus por contexto.")
+        parser.add_argument("--semilla", type=int, default=42)
+
+    def _casos(self, opciones):
+        from documentos.faiss_utils import get_faiss_index
+
+        _, _, fragmentos = get_faiss_index()
+        vigentes = list(fragmentos)
+        if not vigentes:
+            return []
+        rng = np.random.default_rng(opciones["semilla"])
+        casos = []
+        for _ in range(opciones["consultas"]):
+            elegidos = rng.choice(len(vigentes), size=min(opciones["fragmentos"], len(vigentes)), replace=False)
+            frags = [vigentes[i] for i in elegidos]
+            pregunta = f"¿Qué información hay sobre {frags[0].get('asunto') or 'el documento'}?"
+            casos.append(("\n".join(f["texto"] for f in frags), pregunta))
+        return casos
+
+    def _ttft(self, modelo, prompt):
+        inicio = time.perf_counter()
+        salida = modelo(prompt, max_tokens=1, temperature=0.2, stream=True)
+        try:
+            next(iter(salida), None)
+        finally:
+            salida.close()
+        return (time.perf_counter() - inicio) * 1000
+
+    def handle(self, *args, **opciones):
+        # 👇 Import diferido: carga llama_cpp sólo al correr el benchmark
+        from documentos.consultas_phi2 import (
+            construir_prompt, crear_modelo, preparar_prefijo, restaurar_prefijo,
+        )
+
+        casos = self._casos(opciones)
+        if not casos:
+            self.stderr.write("❌ El índice no tiene fragmentos.")
+            return
+
+        modelo = crear_modelo(con_prefijo=False)
+
+        # 🔹 Generación descartada: la primera paga la carga de pesos y buffers,
+        #    que no debe caerle a ninguna de las dos variantes
+        self._ttft(modelo, prompt_sin_prefijo("calentamiento", "calentamiento"))
+
+        # 🔹 Antes: contexto primero → el prefijo común con la pregunta anterior es mínimo
+        antes = [self._ttft(modelo, prompt_sin_prefijo(contexto, pregunta)) for contexto, pregunta in casos]
+
+        # 🔹 Después: instrucciones fijas primero, con su estado KV guardado
+        inicio = time.perf_counter()
+        preparar_prefijo(modelo)
+        armado = (time.perf_counter() - inicio) * 1000
+
+        despues = []
+        for contexto, pregunta in casos:
+            restaurar_prefijo(modelo)
+            despues.append(self._ttft(modelo, construir_prompt(contexto, pregunta)))
+
+        self.stdout.write(f"{'variante':<16}{'p50 ms':>10}{'p95 ms':>10}{'media ms':>10}")
+        for nombre, valores in (("sin prefijo", antes), ("prefijo en KV", despues)):
+            self.stdout.write(
+                f"{nombre:<16}{np.percentile(valores, 50):>10.0f}"
+                f"{np.percentile(valores, 95):>10.0f}{np.mean(valores):>10.0f}"
+            )
+        self.stdout.write(f"📌 Evaluación única del prefijo: {armado:.0f} ms")
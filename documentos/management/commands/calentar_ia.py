@@ -0,0 +1,22 @@
+# documentos/management/commands/calentar_ia.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from documentos.calentamiento import calentar, estado_componentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga embeddings, índice FAISS y LLM y ejecuta una consulta de prueba "
+        "(útil después de un deploy o para verificar el servicio LLM)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sin-llm", action="store_true",
+                            help="No cargar ni probar el modelo de lenguaje.")
+
+    def handle(self, *args, **opciones):
+        tiempos = calentar(llm=not opciones["sin_llm"])
+        self.stdout.write(f"✅ Stack de IA listo en {sum(tiempos.values()):.1f} s")
+        self.stdout.write(json.dumps(estado_componentes(), indent=2, ensure_ascii=False))
@@ -0,0 +1,17 @@
+# documentos/management/commands/indexar_entidades.py
+from django.core.management.base import BaseCommand
+
+from documentos.entidades import regenerar_entidades
+from documentos.faiss_utils import get_faiss_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rearma la tabla de entidades (SGSP, matrículas, teléfonos, CI, direcciones) "
+        "desde los fragmentos ya indexados, sin recalcular embeddings."
+    )
+
+    def handle(self, *args, **opciones):
+        _, _, fragmentos = get_faiss_index()
+        total = regenerar_entidades(fragmentos)
+        self.stdout.write(f"✅ {total} entidades en {len(fragmentos)} fragmentos.")
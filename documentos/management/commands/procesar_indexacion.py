@@ -0,0 +1,37 @@
+# documentos/management/commands/procesar_indexacion.py
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from documentos.cola_indexacion import procesar, recuperar_tareas_colgadas, tomar_tarea
+
+
+class Command(BaseCommand):
+    help = "Worker de la cola de indexación: extrae texto (OCR) e indexa/elimina documentos en FAISS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Procesa las tareas pendientes y termina.")
+        parser.add_argument("--espera", type=float, default=2.0,
+                            help="Segundos entre consultas cuando la cola está vacía.")
+        parser.add_argument("--minutos-colgada", type=int, default=30,
+                            help="Tareas EN_CURSO más viejas que esto vuelven a la cola.")
+
+    def handle(self, *args, **opciones):
+        recuperadas = recuperar_tareas_colgadas(opciones["minutos_colgada"])
+        if recuperadas:
+            self.stdout.write(f"🔁 {recuperadas} tareas colgadas vuelven a la cola.")
+        self.stdout.write("🛠️ Worker de indexación iniciado.")
+
+        try:
+            while True:
+                close_old_connections()
+                tarea = tomar_tarea()
+                if tarea is None:
+                    if opciones["una_vez"]:
+                        break
+                    time.sleep(opciones["espera"])
+                    continue
+                procesar(tarea)
+        except KeyboardInterrupt:
+            self.stdout.write("👋 Worker de indexación detenido.")
@@ -0,0 +1,29 @@
+# documentos/management/commands/regenerar_indice.py
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Rearma el índice FAISS completo por lotes (fragmentado en paralelo, embeddings "
+        "en lotes con caché). Si se interrumpe, volver a correrlo retoma desde la caché "
+        "de embeddings; el índice vigente se reemplaza recién al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procesos", type=int,
+                            help="Procesos para fragmentar y normalizar (DOCIA_REGENERAR_PROCESOS).")
+        parser.add_argument("--procesos-embeddings", type=int,
+                            help="Procesos de encode en CPU (DOCIA_EMBEDDINGS_PROCESOS).")
+
+    def handle(self, *args, **opciones):
+        # 👇 Import diferido: el stack de IA sólo se carga al regenerar
+        from documentos.faiss_utils import regenerar_indice_faiss
+
+        inicio = time.perf_counter()
+        regenerar_indice_faiss(
+            procesos=opciones["procesos"],
+            procesos_embeddings=opciones["procesos_embeddings"],
+        )
+        self.stdout.write(f"✅ Regeneración terminada en {time.perf_counter() - inicio:.1f} s")
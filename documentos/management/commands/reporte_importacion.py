@@ -0,0 +1,67 @@
+# documentos/management/commands/reporte_importacion.py
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# 🔹 Paquetes del stack de IA que no deberían cargarse al arrancar Django
+PESADOS = ["faiss", "torch", "sentence_transformers", "transformers", "sklearn", "llama_cpp", "psutil"]
+
+LINEA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tiempo de importación de un comando de manage.py (por defecto "
+        "'check') con python -X importtime y lista los módulos más costosos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("comando", nargs="*", default=["check"],
+                            help="Comando de manage.py a medir (por defecto: check).")
+        parser.add_argument("--top", type=int, default=15, help="Módulos a listar.")
+
+    def handle(self, *args, **opciones):
+        manage = os.path.join(settings.BASE_DIR, "manage.py")
+        proceso = subprocess.run(
+            [sys.executable, "-X", "importtime", manage, *opciones["comando"]],
+            capture_output=True, text=True,
+        )
+
+        # 🔹 Acumulado por módulo de primer nivel (el que disparó la cadena de imports)
+        modulos = {}
+        total_us = 0
+        for linea in proceso.stderr.splitlines():
+            m = LINEA.match(linea)
+            if not m:
+                continue
+            acumulado, sangria, nombre = int(m.group(2)), len(m.group(3)) - 1, m.group(4)
+            if sangria == 0:
+                modulos[nombre] = modulos.get(nombre, 0) + acumulado
+                total_us += acumulado
+
+        if not modulos:
+            self.stderr.write("❌ No se pudo medir (¿falló el comando?):")
+            self.stderr.write(proceso.stderr[-2000:])
+            return
+
+        self.stdout.write(f"⏱️ Importaciones de 'manage.py {' '.join(opciones['comando'])}': {total_us / 1e6:.2f} s")
+        self.stdout.write(f"{'módulo':<40}{'ms':>10}")
+        for nombre, acumulado in sorted(modulos.items(), key=lambda x: -x[1])[:opciones["top"]]:
+            self.stdout.write(f"{nombre:<40}{acumulado / 1000:>10.1f}")
+
+        importados = {nombre.split(".")[0] for nombre in self._todos(proceso.stderr)}
+        cargados = [p for p in PESADOS if p in importados]
+        if cargados:
+            self.stdout.write(f"⚠️ Stack de IA cargado al arrancar: {', '.join(cargados)}")
+        else:
+            self.stdout.write("✅ El stack de IA no se carga al arrancar.")
+
+    def _todos(self, salida):
+        for linea in salida.splitlines():
+            m = LINEA.match(linea)
+            if m:
+                yield m.group(4)
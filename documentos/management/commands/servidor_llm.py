@@ -0,0 +1,49 @@
+# documentos/management/commands/servidor_llm.py
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documentos.servicio_llm import PoolModelos, crear_servidor
+
+
+class Command(BaseCommand):
+    help = (
+        "Servicio de inferencia local: carga el modelo GGUF una vez y atiende "
+        "las generaciones de todos los workers de Django con concurrencia acotada."
+    )
+
+    def add_arguments(self, parser):
+        url = urlparse(getattr(settings, "DOCIA_LLM_SERVICIO_URL", "") or "http://127.0.0.1:8765")
+        parser.add_argument("--host", default=url.hostname or "127.0.0.1")
+        parser.add_argument("--puerto", type=int, default=url.port or 8765)
+        parser.add_argument("--slots", type=int, default=getattr(settings, "DOCIA_LLM_SLOTS", 1),
+                            help="Generaciones simultáneas (una copia del modelo por slot).")
+        parser.add_argument("--hilos", type=int, default=getattr(settings, "DOCIA_LLM_HILOS", None),
+                            help="Hilos de llama.cpp por slot (por defecto: núcleos / slots).")
+        parser.add_argument("--cola-max", type=int, default=getattr(settings, "DOCIA_LLM_COLA_MAX", 16),
+                            help="Solicitudes en espera antes de responder 503.")
+
+    def handle(self, *args, **opciones):
+        # 👇 Import diferido: sólo este proceso carga llama_cpp
+        from documentos.consultas_phi2 import crear_modelo, get_tokenizador, restaurar_prefijo
+
+        slots = max(1, opciones["slots"])
+        hilos = opciones["hilos"] or max(1, (os.cpu_count() or 8) // slots)
+        self.stdout.write(f"🧠 Cargando {slots} slot(s) del modelo con {hilos} hilos cada uno...")
+        pool = PoolModelos(
+            lambda: crear_modelo(n_threads=hilos),
+            slots=slots,
+            cola_max=opciones["cola_max"],
+            antes_de_generar=restaurar_prefijo,   # 🔹 cada slot parte del prefijo en caché KV
+        )
+
+        servidor = crear_servidor(opciones["host"], opciones["puerto"], pool, get_tokenizador())
+        self.stdout.write(f"✅ Servicio LLM escuchando en http://{opciones['host']}:{opciones['puerto']}")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("👋 Servicio LLM detenido.")
+        finally:
+            servidor.server_close()
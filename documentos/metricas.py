@@ -0,0 +1,107 @@
+# documentos/metricas.py
+"""
+Tiempos por etapa del pipeline de preguntas.
+
+- solicitud(nombre): abre el registro de una solicitud (contextvar); al cerrar
+  imprime una línea con las etapas medidas y el total.
+- etapa(nombre): mide un bloque; se suma a la solicitud en curso (si hay)
+  y al histograma global del proceso.
+- exposicion_prometheus(): histogramas en formato de texto de Prometheus.
+
+Los histogramas son por proceso: con varios workers cada uno expone los suyos.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 🔹 Límites de los buckets en segundos (de encode/búsqueda a generación del LLM)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_solicitud_actual = ContextVar("docia_solicitud", default=None)
+_lock = threading.Lock()
+_histogramas = {}   # (métrica, valor de la etiqueta) -> _Histograma
+
+
+class _Histograma:
+    __slots__ = ("conteos", "suma", "total")
+
+    def __init__(self):
+        self.conteos = [0] * len(BUCKETS)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                self.conteos[i] += 1
+        self.suma += valor
+        self.total += 1
+
+
+def observar(metrica, etiqueta, segundos):
+    with _lock:
+        _histogramas.setdefault((metrica, etiqueta), _Histograma()).observar(segundos)
+
+
+def registrar(nombre, segundos):
+    """Registra una etapa medida por fuera de `etapa` (p. ej. tiempo al primer token)."""
+    spans = _solicitud_actual.get()
+    if spans is not None:
+        spans[nombre] = spans.get(nombre, 0.0) + segundos
+    observar("docia_etapa_segundos", nombre, segundos)
+
+
+@contextmanager
+def etapa(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(nombre, time.perf_counter() - inicio)
+
+
+@contextmanager
+def solicitud(nombre, log=True):
+    """Agrupa las etapas de una solicitud; devuelve el dict {etapa: segundos}."""
+    spans = {}
+    token = _solicitud_actual.set(spans)
+    inicio = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        total = time.perf_counter() - inicio
+        try:
+            _solicitud_actual.reset(token)
+        except ValueError:
+            # 🔹 Generador de un StreamingHttpResponse cerrado desde otro contexto
+            _solicitud_actual.set(None)
+        observar("docia_solicitud_segundos", nombre, total)
+        if log:
+            detalle = {k: round(v * 1000, 1) for k, v in spans.items()}
+            print(f"⏱️ {nombre} {round(total * 1000, 1)} ms {json.dumps(detalle)}")
+
+
+def exposicion_prometheus():
+    with _lock:
+        copia = {clave: (list(h.conteos), h.suma, h.total) for clave, h in _histogramas.items()}
+
+    etiquetas = {"docia_etapa_segundos": "etapa", "docia_solicitud_segundos": "endpoint"}
+    ayudas = {
+        "docia_etapa_segundos": "Duración de cada etapa del pipeline de preguntas.",
+        "docia_solicitud_segundos": "Duración total de las solicitudes de preguntas.",
+    }
+    lineas = []
+    for metrica, etiqueta in etiquetas.items():
+        lineas.append(f"# HELP {metrica} {ayudas[metrica]}")
+        lineas.append(f"# TYPE {metrica} histogram")
+        for (nombre, valor), (conteos, suma, total) in sorted(copia.items()):
+            if nombre != metrica:
+                continue
+            for limite, conteo in zip(BUCKETS, conteos):
+                lineas.append(f'{metrica}_bucket{{{etiqueta}="{valor}",le="{limite}"}} {conteo}')
+            lineas.append(f'{metrica}_bucket{{{etiqueta}="{valor}",le="+Inf"}} {total}')
+            lineas.append(f'{metrica}_sum{{{etiqueta}="{valor}"}} {suma}')
+            lineas.append(f'{metrica}_count{{{etiqueta}="{valor}"}} {total}')
+    return "\n".join(lineas) + "\n"
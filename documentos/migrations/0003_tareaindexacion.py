@@ -0,0 +1,104 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documentos", "0002_remove_documento_grupos_criminales_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TareaIndexacion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "documento_id",
+                    models.BigIntegerField(db_index=True, verbose_name="Documento"),
+                ),
+                (
+                    "accion",
+                    models.CharField(
+                        choices=[
+                            ("INDEXAR", "Extraer texto e indexar"),
+                            ("ELIMINAR", "Eliminar del índice"),
+                        ],
+                        max_length=10,
+                        verbose_name="Acción",
+                    ),
+                ),
+                (
+                    "extraer_texto",
+                    models.BooleanField(
+                        default=False, verbose_name="Extraer texto del PDF"
+                    ),
+                ),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("PENDIENTE", "Pendiente"),
+                            ("EN_CURSO", "En curso"),
+                            ("COMPLETADA", "Completada"),
+                            ("ERROR", "Error"),
+                        ],
+                        default="PENDIENTE",
+                        max_length=10,
+                        verbose_name="Estado",
+                    ),
+                ),
+                (
+                    "intentos",
+                    models.PositiveIntegerField(default=0, verbose_name="Intentos"),
+                ),
+                (
+                    "max_intentos",
+                    models.PositiveIntegerField(
+                        default=3, verbose_name="Máximo de intentos"
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(
+                        blank=True, default="", verbose_name="Último error"
+                    ),
+                ),
+                (
+                    "disponible_desde",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Disponible desde",
+                    ),
+                ),
+                (
+                    "fecha_creacion",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Fecha de creación"
+                    ),
+                ),
+                ("fecha_modificacion", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Tarea de indexación",
+                "verbose_name_plural": "Tareas de indexación",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["estado", "disponible_desde"],
+                        name="tarea_estado_disponible_idx",
+                    )
+                ],
+            },
+        ),
+    ]
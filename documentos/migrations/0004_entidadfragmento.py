@@ -0,0 +1,69 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documentos", "0003_tareaindexacion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EntidadFragmento",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "tipo",
+                    models.CharField(
+                        choices=[
+                            ("sgsp", "Número SGSP"),
+                            ("matricula", "Matrícula"),
+                            ("telefono", "Teléfono"),
+                            ("ci", "Cédula de identidad"),
+                            ("direccion", "Dirección"),
+                        ],
+                        max_length=20,
+                        verbose_name="Tipo",
+                    ),
+                ),
+                (
+                    "valor",
+                    models.CharField(max_length=120, verbose_name="Valor normalizado"),
+                ),
+                (
+                    "faiss_id",
+                    models.BigIntegerField(verbose_name="Fragmento (faiss_id)"),
+                ),
+                (
+                    "documento",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entidades",
+                        to="documentos.documento",
+                        verbose_name="Documento",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Entidad de fragmento",
+                "verbose_name_plural": "Entidades de fragmentos",
+                "indexes": [
+                    models.Index(
+                        fields=["tipo", "valor"], name="entidad_tipo_valor_idx"
+                    ),
+                    models.Index(fields=["valor"], name="entidad_valor_idx"),
+                ],
+            },
+        ),
+    ]
@@ -1,7 +1,6 @@
-import os
 from django.db import models
+from django.utils import timezone
 from core.models import Dependencia, Usuario
-from .utils import extraer_texto_pdf
 
 
 class TipoDoc(models.Model):
@@ -69,6 +68,7 @@ class Documento(models.Model):
     def save(self, *args, **kwargs):
         nuevo = self._state.adding
         texto_antes, asunto_antes, desc_antes = None, None, None
+        leido_antes, dependencia_antes = None, None
 
         if not nuevo:
             try:
@@ -76,41 +76,36 @@ class Documento(models.Model):
                 texto_antes = anterior.texto_extraido
                 asunto_antes = anterior.asunto
                 desc_antes = anterior.descripcion
+                leido_antes = anterior.leido_por_ia
+                dependencia_antes = anterior.dependencia_id
             except Documento.DoesNotExist:
                 pass
 
         super().save(*args, **kwargs)
 
-        # 🔹 Si hay PDF pero no texto, extraerlo
-        if self.informe and not self.texto_extraido:
-            ruta = self.informe.path
-            if os.path.exists(ruta):
-                texto = extraer_texto_pdf(ruta)
-                if texto:
-                    self.texto_extraido = texto.strip()
-                    super().save(update_fields=["texto_extraido"])
-
-        # 🔹 Reindexar en FAISS si:
-        #   - Documento nuevo
-        #   - O cambió el texto_extraido
-        #   - O cambió el asunto
-        #   - O cambió la descripción
-        if (
+        # 🔹 La extracción (OCR) y la indexación en FAISS se hacen fuera del
+        # request: se encola una tarea que procesa `manage.py procesar_indexacion`.
+        #   - Hay PDF pero no texto → extraer e indexar
+        #   - Documento nuevo, o cambió texto_extraido / asunto / descripción → reindexar
+        #   - Cambió leido_por_ia o la dependencia → reindexar (permisos de cada fragmento)
+        extraer = bool(self.informe and not self.texto_extraido)
+        if extraer or (
             self.texto_extraido and (
                 nuevo or
                 self.texto_extraido != texto_antes or
                 self.asunto != asunto_antes or
-                self.descripcion != desc_antes
+                self.descripcion != desc_antes or
+                self.leido_por_ia != leido_antes or
+                self.dependencia_id != dependencia_antes
             )
         ):
-            try:
-                from documentos.faiss_utils import eliminar_fragmentos_por_doc, agregar_fragmentos_doc
-                eliminar_fragmentos_por_doc(self.id)   # Limpia lo viejo
-                agregar_fragmentos_doc(self.id)        # Indexa lo nuevo
-                print(f"✅ Documento {self.id} reindexado en FAISS")
-            except Exception as e:
-                print(f"⚠️ Error al indexar documento {self.id}: {e}")
+            from documentos.cola_indexacion import encolar
+            encolar(self.id, TareaIndexacion.INDEXAR, extraer_texto=extraer)
 
+    @property
+    def tarea_indexacion(self):
+        """Última tarea de indexación del documento (para mostrar su estado)."""
+        return TareaIndexacion.objects.filter(documento_id=self.id).order_by("-id").first()
 
     def fecha_formateada(self):
         if self.fecha_informe:
@@ -121,8 +116,8 @@ class Documento(models.Model):
         return f"{self.fecha_formateada()} - {self.asunto or 'Sin Asunto'}"
 
     def delete(self, using=None, keep_parents=False):
-        from documentos.faiss_utils import eliminar_fragmentos_por_doc
-        eliminar_fragmentos_por_doc(self.id)
+        from documentos.cola_indexacion import encolar
+        encolar(self.id, TareaIndexacion.ELIMINAR)
 
         if self.informe:
             self.informe.storage.delete(self.informe.name)
@@ -130,3 +125,84 @@ class Documento(models.Model):
             self.informe_editable.storage.delete(self.informe_editable.name)
 
         super().delete(using, keep_parents)
+
+
+class TareaIndexacion(models.Model):
+    """
+    Cola persistente de trabajos de extracción e indexación FAISS.
+    Se guarda el id del documento (no una FK) para que las tareas de
+    eliminación sobrevivan al borrado del documento.
+    """
+    INDEXAR = "INDEXAR"
+    ELIMINAR = "ELIMINAR"
+    ACCIONES = [
+        (INDEXAR, "Extraer texto e indexar"),
+        (ELIMINAR, "Eliminar del índice"),
+    ]
+
+    PENDIENTE = "PENDIENTE"
+    EN_CURSO = "EN_CURSO"
+    COMPLETADA = "COMPLETADA"
+    ERROR = "ERROR"
+    ESTADOS = [
+        (PENDIENTE, "Pendiente"),
+        (EN_CURSO, "En curso"),
+        (COMPLETADA, "Completada"),
+        (ERROR, "Error"),
+    ]
+
+    documento_id = models.BigIntegerField(verbose_name="Documento", db_index=True)
+    accion = models.CharField(max_length=10, choices=ACCIONES, verbose_name="Acción")
+    extraer_texto = models.BooleanField(default=False, verbose_name="Extraer texto del PDF")
+    estado = models.CharField(
+        max_length=10, choices=ESTADOS, default=PENDIENTE, verbose_name="Estado"
+    )
+    intentos = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    max_intentos = models.PositiveIntegerField(default=3, verbose_name="Máximo de intentos")
+    error = models.TextField(blank=True, default="", verbose_name="Último error")
+    disponible_desde = models.DateTimeField(default=timezone.now, verbose_name="Disponible desde")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Tarea de indexación"
+        verbose_name_plural = "Tareas de indexación"
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["estado", "disponible_desde"], name="tarea_estado_disponible_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_accion_display()} documento {self.documento_id} ({self.get_estado_display()})"
+
+
+class EntidadFragmento(models.Model):
+    """
+    Identificadores (SGSP, matrículas, teléfonos, CI, direcciones) hallados en
+    cada fragmento al indexar, para resolver consultas por valor exacto.
+    """
+    TIPOS = [
+        ("sgsp", "Número SGSP"),
+        ("matricula", "Matrícula"),
+        ("telefono", "Teléfono"),
+        ("ci", "Cédula de identidad"),
+        ("direccion", "Dirección"),
+    ]
+
+    documento = models.ForeignKey(
+        Documento, on_delete=models.CASCADE, related_name="entidades", verbose_name="Documento"
+    )
+    tipo = models.CharField(max_length=20, choices=TIPOS, verbose_name="Tipo")
+    valor = models.CharField(max_length=120, verbose_name="Valor normalizado")
+    faiss_id = models.BigIntegerField(verbose_name="Fragmento (faiss_id)")
+
+    class Meta:
+        verbose_name = "Entidad de fragmento"
+        verbose_name_plural = "Entidades de fragmentos"
+        indexes = [
+            models.Index(fields=["tipo", "valor"], name="entidad_tipo_valor_idx"),
+            models.Index(fields=["valor"], name="entidad_valor_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.valor}"
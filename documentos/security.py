@@ -1,13 +1,50 @@
+from collections import namedtuple
+
 from documentos.models import Documento
 
+GRUPO_ACCESO_GENERAL = "argos_consultas_general"
+
+# 🔹 Perfil de acceso resuelto: se calcula una vez y se reutiliza en búsquedas y listados
+PerfilAcceso = namedtuple("PerfilAcceso", ["acceso_global", "siglas"])
+SIN_ACCESO = PerfilAcceso(False, frozenset())
+
+
+def _resolver_perfil(user):
+    if user.is_superuser or user.groups.filter(name=GRUPO_ACCESO_GENERAL).exists():
+        return PerfilAcceso(True, frozenset())
+
+    dep = getattr(user, "dependencia", None)
+    dep_argos = dep.dependencia_argos if dep else None
+    if not dep_argos or not dep_argos.sigla:
+        return SIN_ACCESO
+    return PerfilAcceso(False, frozenset([dep_argos.sigla]))
+
+
+def perfil_acceso(user):
+    """
+    Perfil de acceso del usuario (acceso global + siglas visibles).
+    Se memoriza en el objeto user, o sea una vez por request: no se cachea
+    entre requests para que un cambio de grupo o dependencia rija enseguida
+    en todos los workers.
+    """
+    if user is None or not getattr(user, "is_authenticated", False):
+        return SIN_ACCESO
+
+    perfil = getattr(user, "_perfil_acceso", None)
+    if perfil is None:
+        perfil = _resolver_perfil(user)
+        user._perfil_acceso = perfil
+    return perfil
+
+
 def documentos_visibles_para_usuario(user):
     qs = Documento.objects.filter(leido_por_ia=True)
+    perfil = perfil_acceso(user)
 
-    if user.is_superuser or user.groups.filter(name="argos_consultas_general").exists():
+    if perfil.acceso_global:
         return qs  # acceso total
 
-    dep = getattr(user, "dependencia", None)
-    if not dep or not dep.dependencia_argos:
+    if not perfil.siglas:
         return qs.none()  # sin dependencia -> nada
 
-    return qs.filter(dependencia__dependencia_argos__sigla=dep.dependencia_argos.sigla)
+    return qs.filter(dependencia__dependencia_argos__sigla__in=perfil.siglas)
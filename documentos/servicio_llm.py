@@ -0,0 +1,239 @@
+# documentos/servicio_llm.py
+"""
+Servicio de inferencia local para el modelo GGUF.
+
+Un único proceso de larga vida (manage.py servidor_llm) es dueño del modelo:
+los workers de Django no lo cargan y las preguntas simultáneas esperan en
+una cola con concurrencia acotada en lugar de competir por los núcleos.
+
+    POST /generar   {"prompt", "max_tokens", "stop", "temperature", "stream"}
+    POST /tokenizar {"textos"} → {"tokens": [cantidad por texto]}
+    GET  /estado    slots, cola y latencias
+"""
+import json
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+
+TIMEOUT_CLIENTE = getattr(settings, "DOCIA_LLM_TIMEOUT", 300)
+
+# 🔹 Latencias recientes para /estado (ventana deslizante)
+VENTANA_LATENCIAS = 200
+
+
+class ServicioSaturado(Exception):
+    pass
+
+
+# ------------------------------------------------------------
+# Cliente (lo usa consultas_phi2 desde los workers de Django)
+# ------------------------------------------------------------
+def _pedir(url, parametros, ruta="/generar"):
+    solicitud = urllib.request.Request(
+        url.rstrip("/") + ruta,
+        data=json.dumps(parametros).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return urllib.request.urlopen(solicitud, timeout=TIMEOUT_CLIENTE)
+
+
+def generar(url, parametros):
+    """Generación completa: devuelve el texto de la respuesta."""
+    with _pedir(url, dict(parametros, stream=False)) as respuesta:
+        return json.loads(respuesta.read().decode("utf-8"))["texto"]
+
+
+def generar_stream(url, parametros):
+    """
+    Generación en streaming (una línea JSON por token). Cerrar el generador
+    cierra la conexión y el servicio corta la generación en el próximo token.
+    """
+    respuesta = _pedir(url, dict(parametros, stream=True))
+    try:
+        for linea in respuesta:
+            if not linea.strip():
+                continue
+            datos = json.loads(linea.decode("utf-8"))
+            if "error" in datos:
+                raise RuntimeError(datos["error"])
+            yield datos["texto"]
+    finally:
+        respuesta.close()
+
+
+def contar_tokens(url, textos):
+    """Cantidad de tokens de cada texto, con el vocabulario del modelo del servicio."""
+    with _pedir(url, {"textos": list(textos)}, ruta="/tokenizar") as respuesta:
+        return json.loads(respuesta.read().decode("utf-8"))["tokens"]
+
+
+def estado(url):
+    with urllib.request.urlopen(url.rstrip("/") + "/estado", timeout=5) as respuesta:
+        return json.loads(respuesta.read().decode("utf-8"))
+
+
+# ------------------------------------------------------------
+# Servidor
+# ------------------------------------------------------------
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))], 1)
+
+
+class PoolModelos:
+    """
+    `slots` instancias del modelo; cada generación toma una libre.
+    Las solicitudes que no encuentran slot esperan en cola (hasta `cola_max`).
+    """
+
+    def __init__(self, fabrica_modelo, slots=1, cola_max=16, antes_de_generar=None):
+        self.antes_de_generar = antes_de_generar
+        self.libres = queue.Queue()
+        for _ in range(slots):
+            self.libres.put(fabrica_modelo())
+        self.slots = slots
+        self.cola_max = cola_max
+        self._lock = threading.Lock()
+        self.en_cola = 0
+        self.atendidas = 0
+        self.canceladas = 0
+        self.esperas_ms = deque(maxlen=VENTANA_LATENCIAS)
+        self.latencias_ms = deque(maxlen=VENTANA_LATENCIAS)
+
+    def tomar(self):
+        with self._lock:
+            if self.en_cola >= self.cola_max:
+                raise ServicioSaturado(f"Cola llena ({self.en_cola} solicitudes en espera)")
+            self.en_cola += 1
+        inicio = time.perf_counter()
+        try:
+            modelo = self.libres.get()
+        finally:
+            with self._lock:
+                self.en_cola -= 1
+        self.esperas_ms.append((time.perf_counter() - inicio) * 1000)
+        if self.antes_de_generar:
+            self.antes_de_generar(modelo)
+        return modelo
+
+    def devolver(self, modelo, inicio, cancelada=False):
+        self.libres.put(modelo)
+        with self._lock:
+            self.atendidas += 1
+            self.canceladas += int(cancelada)
+        self.latencias_ms.append((time.perf_counter() - inicio) * 1000)
+
+    def estado(self):
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "ocupados": self.slots - self.libres.qsize(),
+                "en_cola": self.en_cola,
+                "cola_max": self.cola_max,
+                "atendidas": self.atendidas,
+                "canceladas": self.canceladas,
+                "espera_p50_ms": _percentil(self.esperas_ms, 0.50),
+                "espera_p95_ms": _percentil(self.esperas_ms, 0.95),
+                "latencia_p50_ms": _percentil(self.latencias_ms, 0.50),
+                "latencia_p95_ms": _percentil(self.latencias_ms, 0.95),
+            }
+
+
+class ManejadorLLM(BaseHTTPRequestHandler):
+    pool = None          # se asignan al crear el servidor
+    tokenizador = None
+
+    def log_message(self, formato, *args):
+        pass  # 🔹 sin log por solicitud (las métricas están en /estado)
+
+    def _json(self, codigo, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/estado":
+            self._json(200, self.pool.estado())
+        else:
+            self._json(404, {"error": "No encontrado"})
+
+    def do_POST(self):
+        ruta = self.path.rstrip("/")
+        if ruta not in ("/generar", "/tokenizar"):
+            self._json(404, {"error": "No encontrado"})
+            return
+
+        largo = int(self.headers.get("Content-Length", 0))
+        parametros = json.loads(self.rfile.read(largo).decode("utf-8"))
+        if ruta == "/tokenizar":
+            # 🔹 Sólo vocabulario: no ocupa un slot de generación
+            self._json(200, {"tokens": [
+                len(self.tokenizador.tokenize(texto.encode("utf-8"), add_bos=False))
+                for texto in parametros.get("textos", [])
+            ]})
+            return
+        stream = bool(parametros.pop("stream", False))
+
+        try:
+            modelo = self.pool.tomar()
+        except ServicioSaturado as e:
+            self._json(503, {"error": str(e)})
+            return
+
+        inicio = time.perf_counter()
+        cancelada = False
+        try:
+            if stream:
+                cancelada = self._generar_stream(modelo, parametros)
+            else:
+                respuesta = modelo(**parametros)
+                self._json(200, {"texto": respuesta["choices"][0]["text"]})
+        except Exception as e:
+            print(f"⚠️ Error al generar respuesta: {e}")
+            if not stream:
+                self._json(500, {"error": str(e)})
+        finally:
+            self.pool.devolver(modelo, inicio, cancelada)
+
+    def _generar_stream(self, modelo, parametros):
+        """Devuelve True si el cliente se desconectó antes de terminar."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        salida = modelo(stream=True, **parametros)
+        try:
+            for parcial in salida:
+                texto = parcial["choices"][0]["text"]
+                if not texto:
+                    continue
+                self.wfile.write(json.dumps({"texto": texto}, ensure_ascii=False).encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 🔹 Cliente desconectado: se deja de generar y el slot queda libre
+            return True
+        except Exception as e:
+            self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8") + b"\n")
+            raise
+        finally:
+            salida.close()
+        return False
+
+
+def crear_servidor(host, puerto, pool, tokenizador=None):
+    manejador = type("ManejadorLLMPool", (ManejadorLLM,), {"pool": pool, "tokenizador": tokenizador})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
@@ -1,3 +1,259 @@
-from django.test import TestCase
+# documentos/tests.py
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from . import consultas_phi2
+from .almacen_fragmentos import AlmacenFragmentos
+from .cache_embeddings import CacheEmbeddings, clave_embedding
+from .generaciones import (
+    IndiceCorrupto,
+    archivo_temporal,
+    confirmar_indice,
+    generacion_actual,
+    indice_verificado,
+    nueva_generacion,
+    publicar,
+)
+
+
+def _fragmento(doc_id, texto, dep=None):
+    return {
+        "doc_id": doc_id,
+        "dep": dep,
+        "leido": True,
+        "version": 1,
+        "texto": texto,
+        "texto_norm": texto.lower(),
+        "asunto": f"Documento {doc_id}",
+    }
+
+
+class DirectorioTemporalMixin:
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+
+# ------------------------------------------------------------
+# Almacén columnar de fragmentos
+# ------------------------------------------------------------
+class AlmacenFragmentosTests(DirectorioTemporalMixin, SimpleTestCase):
+    def _crear(self, fragmentos=()):
+        return AlmacenFragmentos.crear(os.path.join(self.directorio, "fragmentos"), list(fragmentos))
+
+    def test_agregar_y_reabrir(self):
+        almacen = self._crear()
+        ids = almacen.agregar([_fragmento(1, "Oficio de Tránsito", dep="DGT"), _fragmento(2, "Acta")])
+
+        reabierto = AlmacenFragmentos(almacen.directorio)
+        self.assertEqual(ids.tolist(), [0, 1])
+        self.assertEqual(len(reabierto), 2)
+        self.assertEqual(reabierto[0]["texto"], "Oficio de Tránsito")
+        self.assertEqual(reabierto[0]["dep"], "DGT")
+        self.assertIsNone(reabierto[1]["dep"])
+        self.assertEqual(reabierto.meta["proximo_id"], 2)
+
+    def test_eliminar_marca_y_ids_vigentes(self):
+        almacen = self._crear()
+        almacen.agregar([_fragmento(doc, f"texto {i}") for doc in (1, 2, 3, 4, 5) for i in range(2)])
+
+        eliminados = almacen.eliminar_doc(2)
+
+        self.assertEqual(eliminados.tolist(), [2, 3])
+        self.assertEqual(almacen.ids_vigentes().tolist(), [0, 1, 4, 5, 6, 7, 8, 9])
+        self.assertNotIn(2, almacen)
+        self.assertIsNone(almacen.get(3))
+        # 🔹 Por debajo del umbral: sigue en el mismo directorio de datos
+        self.assertEqual(almacen.meta["datos"], "d000001")
+        self.assertEqual(almacen.meta["n_eliminados"], 2)
+
+    def test_compactar_escribe_directorio_de_datos_nuevo(self):
+        almacen = self._crear()
+        almacen.agregar([_fragmento(doc, f"texto {doc}") for doc in (1, 2, 3)])
+        anterior = almacen.meta["datos"]
+
+        almacen.eliminar_doc(1)   # 1/3 eliminados supera UMBRAL_COMPACTACION
+
+        self.assertNotEqual(almacen.meta["datos"], anterior)
+        self.assertFalse(os.path.exists(os.path.join(almacen.directorio, anterior)))
+        self.assertEqual(almacen.meta["n_eliminados"], 0)
+        self.assertEqual(almacen.ids_vigentes().tolist(), [1, 2])
+        self.assertEqual(almacen[2]["texto"], "texto 3")
+        # 🔹 Los IDs no se reutilizan después de compactar
+        self.assertEqual(almacen.agregar([_fragmento(4, "texto 4")]).tolist(), [3])
+
+    def test_refrescar_ve_escrituras_de_otra_instancia(self):
+        escritor = self._crear([dict(_fragmento(1, "inicial"), faiss_id=0)])
+        lector = AlmacenFragmentos(escritor.directorio)
+        self.assertEqual(len(lector), 1)
+
+        escritor.agregar([_fragmento(2, "agregado")])
+        os.utime(escritor.ruta_meta, ns=(0, 0))   # 🔹 firma distinta aunque el mtime no avance
+
+        self.assertTrue(lector.refrescar())
+        self.assertEqual(len(lector), 2)
+        self.assertEqual(lector[1]["texto"], "agregado")
+        self.assertFalse(lector.refrescar())
+
+
+# ------------------------------------------------------------
+# Caché de embeddings
+# ------------------------------------------------------------
+class CacheEmbeddingsTests(DirectorioTemporalMixin, SimpleTestCase):
+    DIMENSION = 4
+
+    def _cache(self, **opciones):
+        return CacheEmbeddings(self.directorio, self.DIMENSION, **opciones)
+
+    @staticmethod
+    def _claves(*textos):
+        return [clave_embedding(t, "modelo-prueba") for t in textos]
+
+    def _vectores(self, n, desde=0):
+        return np.arange(desde, desde + n * self.DIMENSION, dtype="float32").reshape(n, self.DIMENSION)
+
+    def test_acierto_y_fallo_entre_instancias(self):
+        self._cache().guardar(self._claves("a", "b"), self._vectores(2))
+
+        vectores, faltantes = self._cache().buscar(self._claves("b", "x", "a"))
+
+        self.assertEqual(faltantes, [1])
+        np.testing.assert_array_equal(vectores[[2, 0]], self._vectores(2))
+        self.assertFalse(vectores[1].any())
+
+    def test_busca_en_orden_y_en_cola(self):
+        escritor = self._cache(max_cola=2)
+        escritor.guardar(self._claves("a", "b", "c"), self._vectores(3))   # supera la cola: reordena
+        self.assertTrue(os.path.exists(os.path.join(self.directorio, "orden.bin")))
+        escritor.guardar(self._claves("d"), self._vectores(1, desde=100))
+
+        lector = self._cache(max_cola=2)
+        vectores, faltantes = lector.buscar(self._claves("d", "c", "a", "b"))
+
+        self.assertEqual(faltantes, [])
+        self.assertEqual((len(lector._orden), len(lector._cola)), (3, 1))
+        np.testing.assert_array_equal(vectores[0], self._vectores(1, desde=100)[0])
+        np.testing.assert_array_equal(vectores[1:], self._vectores(3)[[2, 0, 1]])
+
+        # 🔹 Al reordenar de nuevo, las filas de la cola pasan al índice ordenado
+        escritor.guardar(self._claves("e", "f"), self._vectores(2, desde=200))
+        vectores, faltantes = lector.buscar(self._claves("d", "f"))
+        self.assertEqual(faltantes, [])
+        self.assertEqual((len(lector._orden), len(lector._cola)), (6, 0))
+        np.testing.assert_array_equal(vectores[1], self._vectores(2, desde=200)[1])
+
+    def test_compactar_con_lector_en_version_anterior(self):
+        escritor = self._cache()
+        escritor.guardar(self._claves("a", "b", "c"), self._vectores(3))
+        lector = self._cache()
+        lector.buscar(self._claves("a"))   # mapea la versión 0
+        mapeados = lector._vectores
+
+        self.assertEqual(escritor.compactar(self._claves("c", "a")), 1)
+
+        # 🔹 Lo ya mapeado sigue legible aunque se hayan borrado los archivos
+        np.testing.assert_array_equal(np.asarray(mapeados), self._vectores(3))
+        vectores, faltantes = lector.buscar(self._claves("a", "b", "c"))
+        self.assertEqual(lector._version, 1)
+        self.assertEqual(faltantes, [1])
+        np.testing.assert_array_equal(vectores[[0, 2]], self._vectores(3)[[0, 2]])
+        self.assertFalse(os.path.exists(os.path.join(self.directorio, "claves.bin")))
+
+        lector.guardar(self._claves("d"), self._vectores(1, desde=100))
+        self.assertEqual(len(escritor), 3)
+
+
+# ------------------------------------------------------------
+# Generaciones del índice
+# ------------------------------------------------------------
+class GeneracionesTests(DirectorioTemporalMixin, SimpleTestCase):
+    def _confirmar(self, ruta_gen, contenido):
+        tmp = archivo_temporal(ruta_gen)
+        with open(tmp, "wb") as f:
+            f.write(contenido)
+        return confirmar_indice(ruta_gen, tmp, tipo="flat")
+
+    def test_publicar_cambia_actual(self):
+        self.assertIsNone(generacion_actual(self.directorio))
+        primera = nueva_generacion(self.directorio)
+        self._confirmar(primera, b"indice 1")
+        publicar(self.directorio, primera)
+        segunda = nueva_generacion(self.directorio)
+
+        # 🔹 Armar una generación no la publica
+        self.assertEqual(generacion_actual(self.directorio), "g000001")
+        self._confirmar(segunda, b"indice 2")
+        publicar(self.directorio, segunda)
+
+        self.assertEqual(generacion_actual(self.directorio), "g000002")
+        ruta, manifiesto = indice_verificado(segunda)
+        with open(ruta, "rb") as f:
+            self.assertEqual(f.read(), b"indice 2")
+        self.assertEqual(manifiesto["tipo"], "flat")
+
+    def test_rechaza_indice_que_no_coincide_con_el_manifiesto(self):
+        ruta_gen = nueva_generacion(self.directorio)
+        manifiesto = self._confirmar(ruta_gen, b"indice original")
+        with open(os.path.join(ruta_gen, manifiesto["indice"]), "r+b") as f:
+            f.write(b"X")
+
+        with self.assertRaises(IndiceCorrupto):
+            indice_verificado(ruta_gen)
+
+    def test_recolectar_conserva_la_actual_y_las_retenidas(self):
+        rutas = [nueva_generacion(self.directorio) for _ in range(5)]
+
+        publicar(self.directorio, rutas[3], retener=1)
+
+        # 🔹 g000005 está en armado (posterior a la publicada): no se toca
+        self.assertEqual(
+            sorted(n for n in os.listdir(self.directorio) if n.startswith("g")),
+            ["g000003", "g000004", "g000005"],
+        )
+        self.assertEqual(generacion_actual(self.directorio), "g000004")
+
+
+# ------------------------------------------------------------
+# Presupuesto de contexto
+# ------------------------------------------------------------
+def _contar_palabras(textos):
+    # 🔹 Una "palabra" por token; el prompt sin contexto (primer texto) no cuenta
+    return [0] + [len(texto.split()) for texto in textos[1:]]
+
+
+@mock.patch.object(consultas_phi2, "contar_tokens", _contar_palabras)
+@mock.patch.object(consultas_phi2, "MAX_FRAGMENTOS_POR_DOC", 2)
+class EmpaquetarContextoTests(SimpleTestCase):
+    def _empaquetar(self, presupuesto, candidatos):
+        with mock.patch.object(consultas_phi2, "PRESUPUESTO_CONTEXTO", presupuesto):
+            return consultas_phi2.empaquetar_contexto("¿pregunta?", candidatos)
+
+    def test_respeta_el_presupuesto_sin_cortar_fragmentos(self):
+        candidatos = [("uno dos tres", 1), ("a b c d e f g h", 2), ("cuatro cinco", 3), ("seis", 4)]
+
+        elegidos, usados = self._empaquetar(8, candidatos)
+
+        # 🔹 Costo = palabras + 1 (salto de línea): 4 + 3 entran, el de 9 no; "seis" (2) ya no
+        self.assertEqual(elegidos, [0, 2])
+        self.assertEqual(usados, 7)
+
+    def test_diversidad_por_documento_antes_de_completar(self):
+        candidatos = [("a", 1), ("b", 1), ("c", 1), ("d", 2)]
+
+        self.assertEqual(self._empaquetar(6, candidatos), ([0, 1, 3], 6))
+        # 🔹 Con lugar de sobra la segunda pasada suma el tercero del documento 1
+        self.assertEqual(self._empaquetar(100, candidatos), ([0, 1, 2, 3], 8))
+
+    def test_indices_en_el_orden_original(self):
+        candidatos = [("a", 1), ("b", 1), ("c", 1), ("d", 2), ("e", 3)]
+
+        elegidos, _ = self._empaquetar(100, candidatos)
+
+        # 🔹 El tercero del documento 1 entra en la segunda pasada pero conserva su lugar
+        self.assertEqual(elegidos, [0, 1, 2, 3, 4])
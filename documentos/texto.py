@@ -0,0 +1,106 @@
+# documentos/texto.py
+"""
+Utilidades de texto sin dependencias pesadas (ni Django ni el stack de IA):
+las usan las vistas, la indexación y los procesos de armado del índice.
+"""
+import re
+import unicodedata
+
+
+def dividir_en_fragmentos(texto, max_long=1200, solapamiento=200, es_normativa=False):
+    """
+    Divide un texto en fragmentos para indexar.
+    Si es normativa, separa por artículos.
+    """
+    if es_normativa:
+        partes = re.split(r'(Artículo\s+\d+)', texto)
+        fragmentos, actual = [], ""
+        for i in range(len(partes)):
+            if re.match(r'Artículo\s+\d+', partes[i]):
+                if actual.strip():
+                    fragmentos.append({"texto": actual.strip()})
+                actual = partes[i]
+            else:
+                actual += " " + partes[i]
+        if actual.strip():
+            fragmentos.append({"texto": actual.strip()})
+        return fragmentos
+
+    oraciones = re.split(r'(?<=[.?!])\s+', texto.strip())
+    fragmentos, actual = [], ""
+    for o in oraciones:
+        if len(actual) + len(o) + 1 <= max_long:
+            actual += " " + o
+        else:
+            fragmentos.append({"texto": actual.strip()})
+            actual = o
+    if actual:
+        fragmentos.append({"texto": actual.strip()})
+    return fragmentos
+
+
+# 🔹 Función para normalizar texto
+def normalizar_texto(texto: str) -> str:
+    if not texto:
+        return ""
+
+    # 🔹 Minúsculas y quitar tildes
+    texto = texto.lower()
+    texto = ''.join(
+        c for c in unicodedata.normalize('NFD', texto)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+    # 🔹 Quitar separadores en números (puntos, guiones, espacios)
+    texto = re.sub(r'(?<=\d)[\.\-\s](?=\d)', '', texto)
+
+    # 🔹 Matrículas: ca-1234-ax / ca 1234 ax → ca1234ax
+    texto = re.sub(
+        r'\b([a-z]{1,3})[\s\-]?(\d{3,4})(?:[\s\-]?([a-z]{1,3}))?\b',
+        lambda m: f"{m.group(1)}{m.group(2)}{m.group(3) or ''}",
+        texto
+    )
+
+    # 🔹 SGSP: números largos (7-10 dígitos) → dejamos solo número
+    # Antes: sgspXXXXXXXX → ahora: XXXXXXXX
+    # Si querés mantener prefijo, cambialo a r"sgsp\1"
+    texto = re.sub(r'\b(\d{7,10})\b', r"\1", texto)
+
+    # 🔹 Teléfonos: 2-3 + 3 + 3/4 dígitos → solo números
+    texto = re.sub(r'\b(\d{2,3})(\d{3})(\d{3,4})\b', r"\1\2\3", texto)
+
+    # 🔹 CI uruguaya: 3.456.789-2 → 34567892
+    texto = re.sub(r'\b(\d{1,2})(\d{3})(\d{3})(\d)\b', r"\1\2\3\4", texto)
+
+    # 🔹 Colapsar espacios múltiples
+    texto = re.sub(r'\s+', ' ', texto)
+
+    return texto.strip()
+
+
+def tiene_match(query: str, texto: str) -> bool:
+    return normalizar_texto(query) in normalizar_texto(texto)
+
+
+def fragmentar_documento(datos):
+    """
+    Fragmentos (sin faiss_id) de un documento ya leído de la base:
+    `datos` trae texto, es_normativa y los campos que viajan con cada fragmento.
+    """
+    texto = (datos["texto"] or "").strip()
+    if not texto:
+        return []
+    campos = {c: datos[c] for c in ("doc_id", "dep", "leido", "asunto", "version")}
+    return [
+        {
+            "texto": frag["texto"],                       # 🔹 original para mostrar
+            "texto_norm": normalizar_texto(frag["texto"]),  # 🔹 normalizado para embeddings
+            **campos,
+        }
+        for frag in dividir_en_fragmentos(texto, es_normativa=datos["es_normativa"])
+    ]
+
+
+def fragmentar_documentos(lote):
+    """Fragmenta un lote de documentos (corre en los procesos del armado completo del índice)."""
+    return [fragmentar_documento(datos) for datos in lote]
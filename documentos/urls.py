@@ -19,5 +19,9 @@ urlpatterns = [
     ),
     path("preguntar/", views.preguntar_argos_html, name="preguntar_argos_link"),
     path("preguntar-argos/", views.preguntar_argos, name="preguntar_argos"),
+    path("preguntar-argos/stream/", views.preguntar_argos_stream, name="preguntar_argos_stream"),
     path("buscar-faiss/", views.buscar_con_faiss, name="buscar_con_faiss"),
+    path("buscar-entidad/", views.documentos_por_entidad, name="documentos_por_entidad"),
+    path("ia/estado/", views.estado_ia, name="estado_ia"),
+    path("ia/metricas/", views.metricas_prometheus, name="metricas_prometheus"),
 ]
@@ -4,6 +4,11 @@ import fitz  # PyMuPDF
 from PIL import Image, ImageEnhance, ImageOps, ImageStat
 import pytesseract
 import io
+from . import cache_ocr
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing.connection import wait
 
 # Configurar Tesseract en Windows
 if platform.system() == "Windows":
@@ -28,8 +33,150 @@ def preprocesar_imagen_para_ocr(imagen):
 
     return imagen
 
+def _config(nombre, defecto):
+    # 🔹 Import diferido: este módulo también se importa en los procesos de OCR
+    from django.conf import settings
+    return getattr(settings, nombre, defecto)
+
+
+# 🔹 Tope por página además del timeout de Tesseract: abrir y rasterizar el PDF
+MARGEN_OCR_PAGINA = 30
+
+
+def ocr_pagina(ruta_pdf, num_pagina, timeout=0, dir_cache=None):
+    """
+    Rasteriza una página y le aplica OCR. Corre en un proceso de OCR,
+    por eso abre el PDF por su cuenta. `timeout` corta Tesseract (segundos).
+    Con `dir_cache`, las páginas con los mismos píxeles no se vuelven a procesar.
+    """
+    with fitz.open(ruta_pdf) as doc:
+        pix = doc[num_pagina].get_pixmap(dpi=300)
+
+    clave = cache_ocr.clave_pagina(pix) if dir_cache else None
+    if clave:
+        texto = cache_ocr.leer(dir_cache, clave)
+        if texto is not None:
+            print(f"[Página {num_pagina+1}] OCR desde caché.")
+            return texto
+
+    imagen = Image.open(io.BytesIO(pix.tobytes("png")))
+    imagen = preprocesar_imagen_para_ocr(imagen)
+    texto = pytesseract.image_to_string(imagen, lang="spa+eng+por", timeout=timeout)
+
+    if clave:
+        cache_ocr.guardar(dir_cache, clave, texto)
+    return texto
+
+
+def _trabajador_ocr(conexion, ruta_pdf, timeout, dir_cache):
+    """Proceso de OCR: recibe números de página por `conexion` y devuelve (página, texto, error)."""
+    while True:
+        i = conexion.recv()
+        if i is None:
+            return
+        try:
+            conexion.send((i, ocr_pagina(ruta_pdf, i, timeout, dir_cache), None))
+        except Exception as e:
+            conexion.send((i, None, str(e)))
+
+
+def ocr_paginas(ruta_pdf, paginas, procesos=1, timeout_pagina=0, dir_cache=None):
+    """
+    OCR de varias páginas repartido en procesos (concurrencia acotada a
+    `procesos`). Devuelve {num_pagina: texto}; una página que falla o supera
+    el timeout queda vacía y no frena al resto.
+    """
+    resultados = {}
+    if procesos <= 1 or len(paginas) <= 1:
+        for i in paginas:
+            try:
+                resultados[i] = ocr_pagina(ruta_pdf, i, timeout_pagina, dir_cache)
+                print(f"[Página {i+1}] OCR OK. Texto: {resultados[i][:100]!r}")
+            except Exception as e:
+                print(f"[Página {i+1}] Error en OCR: {e}")
+        return resultados
+
+    # 🔹 spawn: los workers no heredan el estado del proceso web (torch, FAISS, conexiones)
+    contexto = multiprocessing.get_context("spawn")
+    procesos = min(procesos, len(paginas))
+
+    # 🔹 Tesseract se corta a los `timeout_pagina` s; además cada página tiene un
+    # tope (con margen para rasterizar) por si se cuelga antes de llegar al OCR:
+    # al superarlo se mata sólo el proceso de esa página y se lanza otro.
+    limite = timeout_pagina + MARGEN_OCR_PAGINA if timeout_pagina else None
+    pendientes = deque(paginas)
+    trabajadores = {}   # conexión -> [proceso, página en curso, inicio]
+
+    def lanzar():
+        padre, hijo = contexto.Pipe()
+        proceso = contexto.Process(
+            target=_trabajador_ocr, args=(hijo, ruta_pdf, timeout_pagina, dir_cache), daemon=True
+        )
+        proceso.start()
+        hijo.close()
+        trabajadores[padre] = [proceso, None, None]
+        asignar(padre)
+
+    def asignar(conexion):
+        if pendientes:
+            i = pendientes.popleft()
+            conexion.send(i)
+            trabajadores[conexion][1:] = [i, time.monotonic()]
+        else:
+            trabajadores[conexion][1:] = [None, None]
+
+    def descartar(conexion):
+        proceso = trabajadores.pop(conexion)[0]
+        proceso.kill()
+        proceso.join()
+        conexion.close()
+        if pendientes:
+            lanzar()
+
+    try:
+        for _ in range(procesos):
+            lanzar()
+        while any(t[1] is not None for t in trabajadores.values()):
+            for conexion in wait(list(trabajadores), timeout=1):
+                i = trabajadores[conexion][1]
+                try:
+                    i, texto, error = conexion.recv()
+                except EOFError:
+                    if i is not None:
+                        print(f"[Página {i+1}] Error en OCR: el proceso terminó inesperadamente.")
+                    descartar(conexion)
+                    continue
+                if error is None:
+                    resultados[i] = texto
+                    print(f"[Página {i+1}] OCR OK. Texto: {texto[:100]!r}")
+                else:
+                    print(f"[Página {i+1}] Error en OCR: {error}")
+                asignar(conexion)
+
+            if limite:
+                ahora = time.monotonic()
+                for conexion, (_, i, inicio) in list(trabajadores.items()):
+                    if i is not None and ahora - inicio > limite:
+                        print(f"⚠️ [Página {i+1}] OCR sin terminar a los {limite} s: se omite.")
+                        descartar(conexion)
+    finally:
+        for conexion, (proceso, _, _) in trabajadores.items():
+            try:
+                conexion.send(None)
+            except OSError:
+                pass
+        for conexion, (proceso, _, _) in trabajadores.items():
+            proceso.join(timeout=5)
+            if proceso.is_alive():
+                proceso.kill()
+                proceso.join()
+            conexion.close()
+    return resultados
+
+
 def extraer_texto_pdf(ruta_pdf):
-    texto_total = ""
+    texto_paginas = {}
+    sin_texto = []
 
     try:
         with fitz.open(ruta_pdf) as doc:
@@ -37,21 +184,25 @@ def extraer_texto_pdf(ruta_pdf):
                 texto = pagina.get_text()
                 if texto.strip():
                     print(f"[Página {i+1}] Texto embebido detectado.")
-                    texto_total += texto + "\n"
+                    texto_paginas[i] = texto
                 else:
                     print(f"[Página {i+1}] Sin texto embebido. Aplicando OCR...")
-                    try:
-                        pix = pagina.get_pixmap(dpi=300)
-                        imagen_bytes = pix.tobytes("png")
-                        imagen = Image.open(io.BytesIO(imagen_bytes))
-                        imagen = preprocesar_imagen_para_ocr(imagen)
-
-                        texto_ocr = pytesseract.image_to_string(imagen, lang="spa+eng+por")
-                        print(f"[Página {i+1}] OCR OK. Texto: {texto_ocr[:100]!r}")
-                        texto_total += texto_ocr + "\n"
-                    except Exception as e:
-                        print(f"[Página {i+1}] Error en OCR: {e}")
+                    sin_texto.append(i)
+
+        if sin_texto:
+            dir_cache = _config("DOCIA_OCR_CACHE_DIR", None)
+            texto_paginas.update(ocr_paginas(
+                ruta_pdf,
+                sin_texto,
+                procesos=_config("DOCIA_OCR_PROCESOS", max(1, (os.cpu_count() or 2) - 1)),
+                timeout_pagina=_config("DOCIA_OCR_TIMEOUT_PAGINA", 120),
+                dir_cache=dir_cache,
+            ))
+            if dir_cache:
+                cache_ocr.podar(dir_cache, _config("DOCIA_OCR_CACHE_MAX_MB", 512) * 1024 ** 2)
 
+        # 🔹 Reensamblar en orden de página
+        texto_total = "".join(texto_paginas[i] + "\n" for i in sorted(texto_paginas))
         return texto_total.strip().replace("\n", " ").replace("  ", " ")
 
     except Exception as e:
@@ -1,6 +1,7 @@
-import os
-import numpy as np
-from django.http import JsonResponse
+import hmac
+import json
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
@@ -8,17 +9,23 @@ from django.core.paginator import Paginator
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse
-from .utils import extraer_texto_pdf
-from .models import Documento
+from django.db.models import Q
+from .models import Documento, EntidadFragmento, TareaIndexacion
+from .entidades import extraer_entidades
+from .cola_indexacion import encolar
 from .forms import DocumentoForm
 from .filters import DocumentoFilter
-from .faiss_utils import buscar_fragmentos_relevantes
-from .consultas_phi2 import responder_pregunta_phi2, get_faiss_index
-from .security import documentos_visibles_para_usuario
+from .texto import normalizar_texto
+from . import cache_respuestas
+from .consultas_phi2 import (
+    ERROR_RESPUESTA, SIN_INFORMACION, empaquetar_contexto, limpiar_respuesta,
+    responder_pregunta_phi2, responder_pregunta_stream,
+)
+from .security import documentos_visibles_para_usuario, perfil_acceso
+from .calentamiento import estado_componentes
+from .metricas import etapa, exposicion_prometheus, solicitud
 from core.auditoria import registrar_auditoria
 from collections import defaultdict
-from documentos.faiss_utils import agregar_fragmentos_doc
-from .faiss_utils import tiene_match
 
 
 
@@ -62,12 +69,20 @@ def rehidratar_fragmento(doc, start, end, extra=200):
     return texto[ini:fin].strip()
 
 
-@login_required
-@permission_required("documentos.puede_preguntar_ia", raise_exception=True)
-def preguntar_argos(request):
-    prompt = request.GET.get("prompt", "").strip()
-    if not prompt:
-        return JsonResponse({"respuesta": "Ingrese una pregunta."})
+def solo_documentos_existentes(fragmentos):
+    """Descarta fragmentos de documentos que ya no están en la base."""
+    ids = {f["doc_id"] for f in fragmentos if f.get("doc_id") is not None}
+    existentes = set(Documento.objects.filter(id__in=ids).values_list("id", flat=True))
+    return [f for f in fragmentos if f.get("doc_id") in existentes]
+
+
+def recuperar_contexto(prompt, user):
+    """
+    Busca los fragmentos para una pregunta y arma los previews para la UI
+    y los textos que se pasan al modelo (con los tokens de contexto usados).
+    """
+    # 👇 Import diferido: faiss / sentence-transformers se cargan en la primera pregunta
+    from .faiss_utils import buscar_fragmentos_relevantes
 
     # 🔹 Buscar en FAISS
     fragmentos_relevantes = buscar_fragmentos_relevantes(
@@ -75,12 +90,9 @@ def preguntar_argos(request):
         top_k=30,
         umbral_alto=0.75,
         umbral_bajo=0.60,
-        user=request.user
+        user=user
     )
 
-    if not fragmentos_relevantes:
-        return JsonResponse({"respuesta": "No se encontró información relevante."})
-
     # 🔹 Separar matches y no-matches
     matches = [f for f in fragmentos_relevantes if f.get("match")]
     no_matches = [f for f in fragmentos_relevantes if not f.get("match")]
@@ -92,41 +104,135 @@ def preguntar_argos(request):
     # 🔹 Combinar: primero los matches, luego los demás
     fragmentos_finales = matches + no_matches
 
-    previews, textos_para_modelo = [], []
-
+    # 🔹 Los previews salen del almacén de fragmentos (doc_id, asunto): sin consultas a la BD
+    candidatos = []
     for frag in fragmentos_finales:
-        try:
-            doc = Documento.objects.get(pk=frag["doc_id"])
-        except Documento.DoesNotExist:
+        doc_id = frag.get("doc_id")
+        if doc_id is None:
             continue
+        # ⚠️ Excluir asuntos, solo usar texto real
+        if frag["texto"].strip() != (frag.get("asunto") or "").strip():
+            candidatos.append(frag)
 
-        texto_frag = frag["texto"]
+    # 🔹 Un documento borrado sigue en el índice hasta que el worker procesa la baja:
+    #    no se muestra ni llega al modelo (una consulta por clave primaria)
+    candidatos = solo_documentos_existentes(candidatos)
 
-        # ⚠️ Excluir asuntos, solo usar texto real
-        if texto_frag.strip() != (doc.asunto or "").strip():
+    # 🔹 Entran al prompt los que caben en el presupuesto de tokens
+    with etapa("armado_prompt"):
+        elegidos, tokens_contexto = empaquetar_contexto(
+            prompt, [(frag["texto"], frag["doc_id"]) for frag in candidatos]
+        )
+
+    with etapa("hidratacion"):
+        previews, textos_para_modelo = [], []
+        for i in elegidos:
+            frag = candidatos[i]
             previews.append({
-                "doc_id": doc.id,
-                "asunto": doc.asunto or "Sin asunto",
-                "preview": texto_frag,
-                "url": reverse("ver_documento", args=[doc.id]),
+                "doc_id": frag["doc_id"],
+                "asunto": frag.get("asunto") or "Sin asunto",
+                "preview": frag["texto"],
+                "url": reverse("ver_documento", args=[frag["doc_id"]]),
                 "match": frag.get("match", False),  # ✅ se conserva el match
                 "score": frag.get("score", 0)       # opcional: para debug
             })
-            textos_para_modelo.append(texto_frag)
+            textos_para_modelo.append(frag["texto"])
+
+    return previews, textos_para_modelo, tokens_contexto
+
+
+@login_required
+@permission_required("documentos.puede_preguntar_ia", raise_exception=True)
+def preguntar_argos(request):
+    prompt = request.GET.get("prompt", "").strip()
+    if not prompt:
+        return JsonResponse({"respuesta": "Ingrese una pregunta."})
+
+    with solicitud("preguntar_argos"):
+        previews, textos_para_modelo, tokens_contexto = recuperar_contexto(prompt, request.user)
+
+        if not textos_para_modelo:
+            return JsonResponse({
+                "respuesta": "No se encontró información suficiente en los documentos.",
+                "fragmentos": previews
+            })
+
+        # 🔹 Misma pregunta (o casi) sobre el mismo contexto → respuesta cacheada
+        pregunta_norm = normalizar_texto(prompt)
+        perfil = perfil_acceso(request.user)
+        respuesta = cache_respuestas.buscar(pregunta_norm, textos_para_modelo, perfil)
+
+        if respuesta is None:
+            # 🔹 Generar respuesta con los fragmentos seleccionados
+            respuesta = responder_pregunta_phi2(prompt, textos_para_modelo)
+            if respuesta != ERROR_RESPUESTA:
+                cache_respuestas.guardar(pregunta_norm, textos_para_modelo, perfil, respuesta)
 
-    if not textos_para_modelo:
         return JsonResponse({
-            "respuesta": "No se encontró información suficiente en los documentos.",
-            "fragmentos": previews
+            "respuesta": respuesta,
+            "fragmentos": previews,
+            "tokens_contexto": tokens_contexto,
         })
 
-    # 🔹 Generar respuesta con los fragmentos seleccionados
-    respuesta = responder_pregunta_phi2(prompt, textos_para_modelo)
 
-    return JsonResponse({
-        "respuesta": respuesta,
-        "fragmentos": previews,
-    })
+def evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@login_required
+@permission_required("documentos.puede_preguntar_ia", raise_exception=True)
+def preguntar_argos_stream(request):
+    """
+    Server-Sent Events: primero los fragmentos recuperados, luego la respuesta
+    token a token y al final el texto limpio. Si el cliente se desconecta el
+    servidor cierra el generador y se corta la generación del modelo.
+    """
+    prompt = request.GET.get("prompt", "").strip()
+
+    def eventos():
+        if not prompt:
+            yield evento_sse("fin", {"respuesta": "Ingrese una pregunta."})
+            return
+
+        with solicitud("preguntar_argos_stream"):
+            previews, textos_para_modelo, tokens_contexto = recuperar_contexto(prompt, request.user)
+            yield evento_sse("fragmentos", previews)
+
+            if not textos_para_modelo:
+                yield evento_sse("fin", {"respuesta": "No se encontró información suficiente en los documentos."})
+                return
+
+            pregunta_norm = normalizar_texto(prompt)
+            perfil = perfil_acceso(request.user)
+            cacheada = cache_respuestas.buscar(pregunta_norm, textos_para_modelo, perfil)
+            if cacheada is not None:
+                yield evento_sse("fin", {"respuesta": cacheada, "tokens_contexto": tokens_contexto})
+                return
+
+            partes = []
+            generador = responder_pregunta_stream(prompt, textos_para_modelo)
+            try:
+                for texto in generador:
+                    partes.append(texto)
+                    yield evento_sse("token", {"texto": texto})
+            except GeneratorExit:
+                print(f"🔌 Cliente desconectado; se corta la generación ({len(partes)} tokens).")
+                raise
+            except Exception as e:
+                print(f"⚠️ Error al generar respuesta: {e}")
+                yield evento_sse("error", {"respuesta": ERROR_RESPUESTA})
+                return
+            finally:
+                generador.close()
+
+            respuesta = limpiar_respuesta("".join(partes).strip()) or SIN_INFORMACION
+            cache_respuestas.guardar(pregunta_norm, textos_para_modelo, perfil, respuesta)
+            yield evento_sse("fin", {"respuesta": respuesta, "tokens_contexto": tokens_contexto})
+
+    respuesta = StreamingHttpResponse(eventos(), content_type="text/event-stream")
+    respuesta["Cache-Control"] = "no-cache"
+    respuesta["X-Accel-Buffering"] = "no"   # nginx: no acumular el stream
+    return respuesta
 
 @login_required
 @permission_required("documentos.puede_preguntar_ia", raise_exception=True)
@@ -141,43 +247,92 @@ def preguntar_argos_html(request):
     return render(request, "documentos/preguntar_argos.html")
 
 
+def acceso_monitoreo(request):
+    """Staff, o el token de DOCIA_METRICAS_TOKEN (Authorization: Bearer ...) del monitoreo."""
+    token = getattr(settings, "DOCIA_METRICAS_TOKEN", "")
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def estado_ia(request):
+    """
+    Readiness del stack de IA en este worker; no carga nada. 503 mientras
+    falte algún componente. Sin login (balanceador) sólo se informa "listo";
+    el detalle (componentes, memoria, pid) es para staff o con el token de métricas.
+    """
+    estado = estado_componentes()
+    codigo = 200 if estado["listo"] else 503
+    if not acceso_monitoreo(request):
+        return JsonResponse({"listo": estado["listo"]}, status=codigo)
+    return JsonResponse(estado, status=codigo)
+
+
+def metricas_prometheus(request):
+    """
+    Histogramas de tiempos por etapa en formato de texto de Prometheus.
+    Sólo staff, o con el token de DOCIA_METRICAS_TOKEN (Authorization: Bearer ...)
+    para el scraper.
+    """
+    if not acceso_monitoreo(request):
+        return HttpResponse("No autorizado.", status=403, content_type="text/plain")
+    return HttpResponse(exposicion_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @login_required
 def buscar_con_faiss(request):
     query = request.GET.get("q", "").strip()
     if not query:
         return JsonResponse({"error": "Falta la consulta."})
 
-    modelo_embeddings, index, fragmentos = get_faiss_index()
-    vec = modelo_embeddings.encode([query])
-    distancias, indices = index.search(np.array(vec, dtype="float32"), 10)
+    from .faiss_utils import busqueda_semantica  # 👇 Import diferido
 
-    resultados = []
-    for j, i in enumerate(indices[0]):
-        if i >= len(fragmentos):  # seguridad por si hay índice inválido
-            continue
+    resultados = solo_documentos_existentes(busqueda_semantica(query, k=10, user=request.user))
 
-        frag = fragmentos[i]
-        # Extraer el texto (puede estar en dict o en string según cómo se guardó)
-        texto = frag["texto"]["texto"] if isinstance(frag.get("texto"), dict) else str(frag.get("texto"))
-
-        distancia = float(distancias[0][j])
-        contiene = query.lower() in texto.lower()
-        resultados.append({
-            "doc_id": frag.get("doc_id"),
-            "asunto": frag.get("asunto", "Sin asunto"),
-            "texto": texto[:300],  # preview de 300 chars
-            "distancia": distancia,
-            "match": contiene,
-        })
+    return JsonResponse({
+        "consulta": query,
+        "resultados": resultados,
+    })
 
-    # Ordenar: primero los que contienen literalmente el query, luego por similitud
-    resultados.sort(key=lambda x: (not x["match"], x["distancia"]))
+@login_required
+@permission_required("documentos.view_documento", raise_exception=True)
+def documentos_por_entidad(request):
+    """Documentos visibles que mencionan un identificador (matrícula, CI, SGSP, teléfono...)."""
+    valor = request.GET.get("q", "").strip()
+    if not valor:
+        return JsonResponse({"error": "Falta el valor a buscar."})
+
+    valor_norm = normalizar_texto(valor)
+    filtro = Q(valor=valor_norm)
+    for tipo, valor_entidad in extraer_entidades(valor_norm):
+        filtro |= Q(tipo=tipo, valor=valor_entidad)
+
+    filas = (
+        EntidadFragmento.objects
+        .filter(filtro, documento__in=documentos_visibles_para_usuario(request.user))
+        .values_list("documento_id", "documento__asunto", "tipo")
+        .distinct()
+    )
 
-    
+    documentos = {}
+    for doc_id, asunto, tipo in filas:
+        doc = documentos.setdefault(doc_id, {
+            "doc_id": doc_id,
+            "asunto": asunto or "Sin asunto",
+            "url": reverse("ver_documento", args=[doc_id]),
+            "tipos": [],
+        })
+        if tipo not in doc["tipos"]:
+            doc["tipos"].append(tipo)
 
+    registrar_auditoria(
+        request, "SEARCH", "Documento",
+        descripcion=f"Búsqueda por entidad '{valor}' ({len(documentos)} documentos)"
+    )
     return JsonResponse({
-        "consulta": query,
-        "resultados": resultados[:10],
+        "consulta": valor,
+        "valor_normalizado": valor_norm,
+        "documentos": list(documentos.values()),
     })
 
 # -- Vistas CRUD para Documentos --
@@ -196,28 +351,16 @@ class CrearDocumentoView(LoginRequiredMixin, PermissionRequiredMixin, View):
             post = form.save(commit=False)
             post.creada_por = request.user
 
+            # 🔹 save() encola la extracción del PDF y la indexación en FAISS
             post.save()
 
-            # Extraer texto del PDF
-            if post.informe and not post.texto_extraido:
-                ruta = post.informe.path
-                if os.path.exists(ruta):
-                    texto = extraer_texto_pdf(ruta)
-                    if texto:
-                        post.texto_extraido = texto.strip()
-                        post.save(update_fields=["texto_extraido"])
-
-            # ✅ Indexar en FAISS inmediatamente
-            try:
-                agregar_fragmentos_doc(post.id)
-                print(f"✅ Documento {post.id} indexado en FAISS")
-            except Exception as e:
-                print(f"⚠️ Error al indexar en FAISS: {e}")
-
             form.instance = post
             form.save_m2m()
 
-            messages.success(request, "Documento agregado correctamente.")
+            messages.success(
+                request,
+                "Documento agregado correctamente. El texto se procesará en segundo plano."
+            )
             registrar_auditoria(
                 request, "CREATE", "Documento", objeto_id=str(post.pk),
                 descripcion=f"Se creó documento '{post.asunto}'"
@@ -244,13 +387,9 @@ class EditarDocumentoView(LoginRequiredMixin, PermissionRequiredMixin, View):
 
             post.save()
 
+            # 🔹 PDF nuevo: re-extraer el texto y reindexar en segundo plano
             if "informe" in request.FILES:
-                ruta = post.informe.path
-                if os.path.exists(ruta):
-                    texto = extraer_texto_pdf(ruta)
-                    if texto:
-                        post.texto_extraido = texto.strip()
-                        post.save(update_fields=["texto_extraido"])
+                encolar(post.id, TareaIndexacion.INDEXAR, extraer_texto=True)
 
             form.instance = post
             form.save_m2m()
@@ -271,10 +410,7 @@ class EliminarDocumentoView(LoginRequiredMixin, PermissionRequiredMixin, View):
     def post(self, request, id, *args, **kwargs):
         documento = get_object_or_404(Documento, id=id)
 
-        # 🔹 Primero borrar del índice FAISS
-        from documentos.faiss_utils import eliminar_fragmentos_por_doc
-        eliminar_fragmentos_por_doc(documento.id)
-
+        # 🔹 delete() encola la baja del documento en el índice FAISS
         # 🔹 Registrar auditoría y borrar de la BD
         registrar_auditoria(
             request, "DELETE", "Documento", objeto_id=str(documento.pk),